@@ -0,0 +1,254 @@
+## ~~~ TO NOT EDIT ~~~
+##
+## Local cache of the finished jobs, common to all clusters.
+##
+
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import datetime
+import pandas as pd
+
+
+def default_cache_path(cluster_info):
+    '''
+    Default location of the cache, in the user's cache directory (one file per cluster).
+    :param cluster_info: [dict]
+    :return: [str] path to the SQLite file
+    '''
+    cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    cluster_slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(cluster_info['cluster_name']))
+    return os.path.join(cache_dir, 'GreenAlgorithms4HPC', f'jobs_{cluster_slug}.sqlite')
+
+
+def merge_windows(L_windows):
+    '''
+    Merge overlapping periods.
+    :param L_windows: [list of (str,str)] periods, as YYYY-MM-DD
+    :return: [list of (str,str)] sorted, non-overlapping periods
+    '''
+    L_merged = []
+    for start, end in sorted(L_windows):
+        if (len(L_merged) > 0) and (start <= L_merged[-1][1]):
+            L_merged[-1] = (L_merged[-1][0], max(end, L_merged[-1][1]))
+        else:
+            L_merged.append((start, end))
+    return L_merged
+
+
+class JobsCache():
+    '''
+    On-disk cache (SQLite) of the cleaned, aggregated jobs (i.e. the rows of `WorkloadManager.df_agg_0`),
+    together with the periods that have already been pulled from the workload manager.
+    Only finished jobs are cached: the unfinished ones are just recorded so that they can be pulled again next time.
+    '''
+
+    # Columns of `df_agg_0`, and how they are stored
+    columns_timedelta = ['TotalCPUtimeX', 'WallclockTimeX']  # as an integer number of microseconds
+    columns_datetime = ['SubmitDatetimeX']  # as an integer number of microseconds since epoch
+    columns = [
+        'single_jobID', 'TotalCPUtimeX', 'WallclockTimeX', 'ReqMemX', 'UsedMemX', 'NCPUSX', 'NNodesX',
+        'PartitionX', 'JobNameX', 'SubmitDatetimeX', 'WorkingDirX', 'StateX'
+    ]
+
+    def __init__(self, path, cluster_info, maxAgeDays=730, maxJobs=2000000):
+        '''
+        :param path: [str] path to the SQLite file (created if needed)
+        :param cluster_info: [dict] the cache is reset if it has been built with a different cluster_info
+        :param maxAgeDays: [int] jobs submitted more than this many days ago are evicted
+        :param maxJobs: [int] maximum number of jobs kept, the oldest ones are evicted first
+        '''
+        self.path = path
+        self.maxAgeDays = maxAgeDays
+        self.maxJobs = maxJobs
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.create_tables()
+
+        cluster_info_hash = hashlib.sha256(json.dumps(cluster_info, sort_keys=True, default=str).encode()).hexdigest()
+        stored_hash = self.conn.execute("SELECT value FROM meta WHERE key = 'cluster_info_hash'").fetchone()
+        if (stored_hash is None) or (stored_hash[0] != cluster_info_hash):
+            if stored_hash is not None:
+                print("cluster_info has changed since the cache was built, resetting the cache.")
+            self.reset()
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('cluster_info_hash', ?)", (cluster_info_hash,))
+            self.conn.commit()
+
+        self.evict()
+
+    def create_tables(self):
+        '''
+        Create the tables of the cache, if they don't exist.
+        '''
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                single_jobID TEXT PRIMARY KEY,
+                TotalCPUtimeX INTEGER,
+                WallclockTimeX INTEGER,
+                ReqMemX REAL,
+                UsedMemX REAL,
+                NCPUSX INTEGER,
+                NNodesX INTEGER,
+                PartitionX TEXT,
+                JobNameX TEXT,
+                SubmitDatetimeX INTEGER,
+                WorkingDirX TEXT,
+                StateX INTEGER
+            )''')
+        self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_submit ON jobs (SubmitDatetimeX)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS coverage (startDay TEXT, endDay TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS unfinished (single_jobID TEXT PRIMARY KEY, submitDay TEXT)")
+        self.conn.commit()
+
+    def reset(self):
+        '''
+        Empty the cache.
+        '''
+        for table in ['jobs', 'coverage', 'unfinished']:
+            self.conn.execute(f"DELETE FROM {table}")
+        self.conn.commit()
+
+    def get_coverage(self):
+        '''
+        :return: [list of (str,str)] periods already pulled, as YYYY-MM-DD, sorted and merged.
+        '''
+        return merge_windows(self.conn.execute("SELECT startDay, endDay FROM coverage").fetchall())
+
+    def set_coverage(self, L_windows):
+        '''
+        Replace the periods already pulled.
+        :param L_windows: [list of (str,str)] periods, as YYYY-MM-DD
+        '''
+        self.conn.execute("DELETE FROM coverage")
+        self.conn.executemany("INSERT INTO coverage VALUES (?, ?)", merge_windows(L_windows))
+
+    def missing_windows(self, startDay, endDay):
+        '''
+        Periods of [startDay, endDay] that are not covered by the cache yet.
+        :param startDay: [str] YYYY-MM-DD
+        :param endDay: [str] YYYY-MM-DD
+        :return: [list of (str,str)] periods to pull, as YYYY-MM-DD
+        '''
+        coverage = self.get_coverage()
+        if startDay == endDay:
+            if any(start <= startDay <= end for start, end in coverage):
+                return []
+            return [(startDay, endDay)]
+
+        L_missing = []
+        current = startDay
+        for start, end in coverage:
+            if current >= endDay:
+                break
+            if start > current:
+                L_missing.append((current, min(start, endDay)))
+            current = max(current, end)
+        if current < endDay:
+            L_missing.append((current, endDay))
+        return L_missing
+
+    def unfinished_jobs(self):
+        '''
+        :return: [dict] {single_jobID: submit day} of the jobs that were still queued or running last time.
+        '''
+        return dict(self.conn.execute("SELECT single_jobID, submitDay FROM unfinished"))
+
+    def update(self, df_agg, L_windows):
+        '''
+        Add newly pulled jobs to the cache.
+        :param df_agg: [None or pd.DataFrame] new jobs, in the same format as `WorkloadManager.df_agg_0`
+        :param L_windows: [list of (str,str)] periods that have been fully pulled, as YYYY-MM-DD
+        '''
+        if df_agg is not None:
+            df = df_agg.reset_index()[self.columns].copy()
+            for x in self.columns_timedelta:
+                df[x] = df[x].values.astype('timedelta64[us]').astype('int64')
+            for x in self.columns_datetime:
+                df[x] = df[x].values.astype('datetime64[us]').astype('int64')
+            df = df.astype(object).where(df.notnull(), None)
+
+            finished = df.StateX != -1
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO jobs VALUES ({','.join(['?'] * len(self.columns))})",
+                df.loc[finished].itertuples(index=False, name=None)
+            )
+            self.conn.executemany(
+                "DELETE FROM unfinished WHERE single_jobID = ?",
+                [(x,) for x in df.loc[finished, 'single_jobID']]
+            )
+            submitDays = pd.to_datetime(df.loc[~finished, 'SubmitDatetimeX'].astype('int64'), unit='us').dt.strftime('%Y-%m-%d')
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO unfinished VALUES (?, ?)",
+                zip(df.loc[~finished, 'single_jobID'], submitDays)
+            )
+
+        self.set_coverage(self.get_coverage() + list(L_windows))
+        self.conn.commit()
+
+    def load(self, startDay, endDay):
+        '''
+        Load the cached jobs running during [startDay, endDay].
+        NB: this is not exactly the selection of sacct, which returns the jobs submitted (or eligible) before endDay
+        and ending after startDay. The start and end times of the jobs aren't pulled from sacct (so aren't cached),
+        so a job is considered to end at submit time + wallclock time: the jobs that waited in the queue
+        and ended after startDay, but less than their waiting time after it, are not loaded.
+        :param startDay: [str] YYYY-MM-DD
+        :param endDay: [str] YYYY-MM-DD
+        :return: [pd.DataFrame] in the same format as `WorkloadManager.df_agg_0`
+        '''
+        epoch = datetime.datetime(1970, 1, 1)
+        start_us = int((datetime.datetime.strptime(startDay, '%Y-%m-%d') - epoch) / datetime.timedelta(microseconds=1))
+        end_us = int((datetime.datetime.strptime(endDay, '%Y-%m-%d') - epoch) / datetime.timedelta(microseconds=1))
+        df = pd.read_sql_query(
+            "SELECT * FROM jobs WHERE SubmitDatetimeX <= ? AND SubmitDatetimeX + WallclockTimeX >= ? ORDER BY single_jobID",
+            self.conn,
+            params=(end_us, start_us)
+        )
+        for x in self.columns_timedelta:
+            df[x] = pd.to_timedelta(df[x].astype('int64'), unit='us')
+        for x in self.columns_datetime:
+            df[x] = pd.to_datetime(df[x].astype('int64'), unit='us')
+        return df.set_index('single_jobID')
+
+    def evict(self):
+        '''
+        Evict the jobs submitted more than `maxAgeDays` days ago, and the oldest jobs if there are more than `maxJobs`.
+        The covered periods are trimmed accordingly, so that they are pulled again if needed.
+        '''
+        epoch = datetime.datetime(1970, 1, 1)
+        cutoff = datetime.datetime.combine(datetime.date.today(), datetime.time()) - datetime.timedelta(days=self.maxAgeDays)
+        cutoff_us = int((cutoff - epoch) / datetime.timedelta(microseconds=1))
+
+        n_jobs = self.conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        if n_jobs > self.maxJobs:
+            oldest_kept = self.conn.execute(
+                "SELECT SubmitDatetimeX FROM jobs ORDER BY SubmitDatetimeX LIMIT 1 OFFSET ?",
+                (n_jobs - self.maxJobs,)
+            ).fetchone()[0]
+            cutoff_us = max(cutoff_us, oldest_kept)
+
+        maxWallclock_us = self.conn.execute(
+            "SELECT MAX(WallclockTimeX) FROM jobs WHERE SubmitDatetimeX < ?", (cutoff_us,)
+        ).fetchone()[0]
+        if maxWallclock_us is None:
+            maxWallclock_us = 0
+        self.conn.execute("DELETE FROM jobs WHERE SubmitDatetimeX < ?", (cutoff_us,))
+
+        # Jobs submitted before the cutoff but still running after it aren't in the cache anymore,
+        # so the coverage starts once all of them are finished.
+        coverage_start = epoch + datetime.timedelta(microseconds=cutoff_us + maxWallclock_us) + datetime.timedelta(days=1)
+        coverage_start = coverage_start.strftime('%Y-%m-%d')
+        self.set_coverage([(max(start, coverage_start), end) for start, end in self.get_coverage() if end > coverage_start])
+
+        self.conn.execute(
+            "DELETE FROM unfinished WHERE submitDay < ?",
+            ((epoch + datetime.timedelta(microseconds=cutoff_us)).strftime('%Y-%m-%d'),)
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,169 @@
+## ~~~ TO NOT EDIT ~~~
+##
+## Export of the per-job results and of the power draw timeline, common to all clusters.
+##
+
+import gzip
+import pandas as pd
+
+# Columns exported, in this order, and their type.
+# The schema is the same whatever the options (e.g. UserX and AccountX are empty without --allUsers).
+export_schema = [
+    ('single_jobID', 'string'),
+    ('parentJobID', 'string'),
+    ('UserX', 'string'),
+    ('AccountX', 'string'),
+    ('JobNameX', 'string'),
+    ('WorkingDirX', 'string'),
+    ('PartitionX', 'string'),
+    ('StateX', 'int8'),
+    ('SubmitDatetimeX', 'timestamp'),
+    ('WallclockTimeX', 'duration'),
+    ('TotalCPUtimeX', 'duration'),
+    ('NCPUSX', 'int32'),
+    ('NNodesX', 'int32'),
+    ('ReqMemX', 'float64'),
+    ('UsedMemX', 'float64'),
+    ('NeededMemX', 'float64'),
+    ('memOverallocationFactorX', 'float64'),
+    ('energy_CPUs', 'float64'),
+    ('energy_GPUs', 'float64'),
+    ('energy_memory', 'float64'),
+    ('energy', 'float64'),
+    ('energy_memory_memoryNeededOnly', 'float64'),
+    ('energy_memoryNeededOnly', 'float64'),
+    ('carbonFootprint', 'float64'),
+    ('carbonFootprint_memoryNeededOnly', 'float64'),
+]
+
+# Columns of the power draw timeline (see `GreenAlgorithms.calculate_timeline`), in kW
+timeline_schema = [
+    ('datetime', 'timestamp'),
+    ('power_CPUs', 'float64'),
+    ('power_GPUs', 'float64'),
+    ('power_memory', 'float64'),
+    ('power_overheads', 'float64'),
+    ('power', 'float64'),
+]
+
+export_formats = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.csv': 'csv',
+    '.csv.gz': 'csv',
+}
+
+
+def get_export_format(path):
+    '''
+    Find the export format from the extension of the file.
+    :param path: [str] path of the export file
+    :return: [str] 'parquet', 'arrow' or 'csv'
+    '''
+    for extension, export_format in export_formats.items():
+        if path.endswith(extension):
+            return export_format
+    raise ValueError(f"Unrecognised export format for {path}, the extension should be one of: {', '.join(export_formats)}")
+
+
+def get_arrow_schema(schema=export_schema):
+    '''
+    :param schema: [list of (str,str), default=export_schema] names and types of the columns
+    :return: [pa.Schema] the same schema, as an Arrow schema.
+    '''
+    import pyarrow as pa
+
+    arrow_types = {
+        'string': pa.string(),
+        'int8': pa.int8(),
+        'int32': pa.int32(),
+        'float64': pa.float64(),
+        'timestamp': pa.timestamp('us'),
+        'duration': pa.duration('us'),
+    }
+    return pa.schema([(name, arrow_types[type_name]) for name, type_name in schema])
+
+
+def iter_row_groups(df, rowGroupSize, durations_as_seconds=False, schema=export_schema):
+    '''
+    Split the jobs into row groups with the exported columns and types, converting one group at a time.
+    :param df: [pd.DataFrame] one row per job
+    :param rowGroupSize: [int] number of jobs per row group
+    :param durations_as_seconds: [bool, default=False] export durations as a number of seconds (for text formats)
+    :param schema: [list of (str,str), default=export_schema] names and types of the columns
+    :return: [iterator of pd.DataFrame]
+    '''
+    for start in range(0, len(df), rowGroupSize):
+        group = df.iloc[start:start + rowGroupSize]
+        out = pd.DataFrame(index=group.index)
+        for name, type_name in schema:
+            if name not in group:
+                out[name] = None
+            elif type_name == 'string':
+                out[name] = group[name].astype(object)
+            elif type_name == 'timestamp':
+                out[name] = group[name].values.astype('datetime64[us]')
+            elif type_name == 'duration':
+                out[name] = group[name].values.astype('timedelta64[us]')
+                if durations_as_seconds:
+                    out[name] = out[name].dt.total_seconds()
+            else:
+                out[name] = group[name].astype(type_name)
+        yield out
+
+
+def write_table(df, path, schema, rowGroupSize=100000):
+    '''
+    Write a table in row groups, so that the whole export is never copied in memory.
+    Parquet (zstd) and Arrow (zstd) require pyarrow, CSV is compressed with gzip if the path ends with .gz
+    (durations are then in seconds).
+    :param df: [pd.DataFrame] the table
+    :param path: [str] path of the export file, the format depends on its extension (.parquet, .arrow/.feather, .csv/.csv.gz)
+    :param schema: [list of (str,str)] names and types of the columns exported
+    :param rowGroupSize: [int, default=100000] number of rows per row group
+    '''
+    export_format = get_export_format(path)
+
+    if export_format == 'csv':
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', newline='') as f:
+            # Header written separately, so that it's there even without any rows
+            f.write(','.join(name for name, _ in schema) + '\n')
+            for group in iter_row_groups(df, rowGroupSize, durations_as_seconds=True, schema=schema):
+                group.to_csv(f, header=False, index=False)
+        return
+
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(f"pyarrow is needed to export as {export_format}, install it or export as .csv/.csv.gz instead.")
+
+    arrow_schema = get_arrow_schema(schema)
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(path, arrow_schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_file(path, arrow_schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+    with writer:
+        for group in iter_row_groups(df, rowGroupSize, schema=schema):
+            writer.write_table(pa.Table.from_pandas(group, schema=arrow_schema, preserve_index=False))
+
+
+def export_jobs(df, path, rowGroupSize=100000):
+    '''
+    Write the per-job results (see `write_table`).
+    :param df: [pd.DataFrame] one row per job, with the energies and footprints
+    :param path: [str] path of the export file, the format depends on its extension (.parquet, .arrow/.feather, .csv/.csv.gz)
+    :param rowGroupSize: [int, default=100000] number of jobs per row group
+    '''
+    write_table(df, path, export_schema, rowGroupSize=rowGroupSize)
+
+
+def export_timeline(timeline, path):
+    '''
+    Write the power draw timeline (see `write_table`).
+    :param timeline: [pd.DataFrame] output of `GreenAlgorithms.calculate_timeline`
+    :param path: [str] path of the export file, the format depends on its extension (.parquet, .arrow/.feather, .csv/.csv.gz)
+    '''
+    write_table(timeline, path, timeline_schema)
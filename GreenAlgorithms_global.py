@@ -6,14 +6,218 @@
 
 import os
 import argparse
-import yaml
 import datetime
 import math
 import sys
-import pandas as pd
-import pathlib
+import json
+import importlib
 
-from GreenAlgorithms_workloadManager import WorkloadManager
+
+class lazy_import():
+    '''
+    Module only imported the first time it's used, so that heavy modules (e.g. pandas)
+    are not loaded if the script stops early (e.g. --help or invalid arguments).
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+
+def load_yaml(path):
+    '''
+    Load a yaml file, using a cached copy (as json, in the user's cache directory) if the file hasn't been modified since.
+    This avoids importing and running the yaml parser at every start.
+    Files that can't be stored as json as they are (e.g. with non-string keys, or dates) are not cached.
+    :param path: [str] path to the yaml file
+    :return: [dict] content of the file
+    '''
+    cache_dir = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    cache_path = os.path.join(cache_dir, 'GreenAlgorithms4HPC', 'config_cache.json')
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+
+    try:
+        with open(cache_path, 'r') as f:
+            yaml_cache = json.load(f)
+    except (OSError, ValueError):
+        yaml_cache = {}
+
+    cached = yaml_cache.get(abs_path)
+    if (cached is not None) and (cached['mtime_ns'] == stat.st_mtime_ns) and (cached['size'] == stat.st_size):
+        return cached['content']
+
+    import yaml
+    with open(abs_path, "r") as stream:
+        try:
+            content = yaml.safe_load(stream)
+        except yaml.YAMLError as exc:
+            print(exc)
+            return None
+
+    # Only cached if it is identical once loaded from json (e.g. the keys 1 and '1' would both become '1')
+    try:
+        cacheable = json.loads(json.dumps(content)) == content
+    except (TypeError, ValueError):
+        cacheable = False
+    if cacheable:
+        yaml_cache[abs_path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'content': content}
+    else:
+        yaml_cache.pop(abs_path, None)
+
+    # The entries of the files that have been modified or removed since are dropped
+    for x in list(yaml_cache):
+        try:
+            stat_x = os.stat(x)
+        except OSError:
+            del yaml_cache[x]
+            continue
+        if (yaml_cache[x]['mtime_ns'] != stat_x.st_mtime_ns) or (yaml_cache[x]['size'] != stat_x.st_size):
+            del yaml_cache[x]
+
+    # Cache it for next time (not critical if it fails, e.g. read-only home directory)
+    tmp_path = f"{cache_path}.{os.getpid()}"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(yaml_cache, f)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    return content
+
+
+# Carbon intensity time series already loaded, e.g. by the report server: {path: (mtime_ns, index)}
+CI_timeseries_cache = {}
+
+
+def load_CI_timeseries(path):
+    '''
+    Load a carbon intensity time series, and index it to integrate it over any interval.
+    The file is a CSV with the columns `datetime` (local time, as sacct) and `CI` (in gCO2e/kWh),
+    each value applying from its datetime until the next one (e.g. hourly values).
+    :param path: [str] path to the CSV file
+    :return: [dict] `times` (in s since epoch), `CI`, `cumulativeCI` (integral of CI since the first time, in gCO2e/kWh*s),
+    and `end` of the time series (assuming the last value lasts as long as the one before, never if there is only one value)
+    '''
+    abs_path = os.path.abspath(path)
+    mtime_ns = os.stat(abs_path).st_mtime_ns
+    cached = CI_timeseries_cache.get(abs_path)
+    if (cached is not None) and (cached[0] == mtime_ns):
+        return cached[1]
+
+    timeseries = pd.read_csv(abs_path, usecols=['datetime', 'CI'])
+    timeseries['datetime'] = pd.to_datetime(timeseries.datetime)
+    timeseries = timeseries.sort_values('datetime')
+    assert timeseries.CI.notnull().all(), f"Missing values in the carbon intensity time series: {path}"
+
+    times = timeseries.datetime.values.astype('datetime64[s]').astype('int64').astype('float64')
+    CI = timeseries.CI.values.astype('float64')
+    index = {
+        'times': times,
+        'CI': CI,
+        'cumulativeCI': np.concatenate([[0.], np.cumsum(CI[:-1] * np.diff(times))]),
+        'end': times[-1] + (times[-1] - times[-2]) if len(times) > 1 else np.inf,
+    }
+    CI_timeseries_cache[abs_path] = (mtime_ns, index)
+    return index
+
+
+# Parameters that the what-if scenarios can override (--scenarios), the others are those of the cluster
+scenario_parameters = ['PUE', 'CI', 'CI_timeseries', 'granularity_memory_request', 'power_memory_perGB', 'partitions']
+
+
+def load_scenarios(path, cluster_info):
+    '''
+    Load and check the what-if scenarios to compare with --scenarios (see scenarios.yaml).
+    :param path: [str] yaml file with a list of scenarios, each with a `name` and the parameters it overrides
+    :param cluster_info: [dict] info about the cluster, from cluster_info.yaml, whose partitions the scenarios can change
+    :return: [list of dict] the scenarios
+    '''
+    scenarios = load_yaml(path)
+    if (not isinstance(scenarios, list)) or (len(scenarios) == 0):
+        raise ValueError(f"{path} should contain a list of scenarios")
+    for scenario in scenarios:
+        if (not isinstance(scenario, dict)) or ('name' not in scenario):
+            raise ValueError(f"Each scenario in {path} needs a name, got: {scenario}")
+        unknown = set(scenario) - set(scenario_parameters) - {'name'}
+        if len(unknown) > 0:
+            raise ValueError(f"Unknown parameters in scenario {scenario['name']}: {', '.join(sorted(unknown))} "
+                             f"(can be: {', '.join(scenario_parameters)})")
+        unknown = set(scenario.get('partitions', {})) - set(cluster_info['partitions'])
+        if len(unknown) > 0:
+            raise ValueError(f"Unrecognised partition in scenario {scenario['name']}: {', '.join(sorted(unknown))} "
+                             f"(can be: {', '.join(cluster_info['partitions'])})")
+        for partition, partition_info in scenario.get('partitions', {}).items():
+            if (not isinstance(partition_info, dict)) or (not set(partition_info) <= {'TDP', 'TDP_CPU'}):
+                raise ValueError(f"Only TDP and TDP_CPU can be set for partition {partition} in scenario {scenario['name']}")
+        if ('CI_timeseries' in scenario) and (not os.path.isfile(scenario['CI_timeseries'])):
+            raise ValueError(f"Carbon intensity time series of scenario {scenario['name']} not found: {scenario['CI_timeseries']}")
+    return scenarios
+
+
+# Parameters that can be uncertain (--uncertainty), and the distributions of the factors they are multiplied by
+uncertain_parameters = ['PUE', 'CI', 'TDP', 'power_memory_perGB']
+uncertainty_distributions = {'normal': ['sd'], 'uniform': ['low', 'high'], 'triangular': ['low', 'high']}
+
+
+def load_uncertainty(path):
+    '''
+    Load the distributions of the uncertain parameters for --uncertainty (see uncertainty.yaml).
+    :param path: [str] yaml file with the distribution of the factor each parameter is multiplied by,
+    and optionally the `confidence` level of the intervals and the `seed` of the random draws
+    :return: [dict] the content of the file, with the default confidence (0.95) and seed (0) if missing
+    '''
+    uncertainty = load_yaml(path)
+    if not isinstance(uncertainty, dict):
+        raise ValueError(f"{path} should contain the distribution of the uncertain parameters")
+    unknown = set(uncertainty) - set(uncertain_parameters) - {'confidence', 'seed'}
+    if len(unknown) > 0:
+        raise ValueError(f"Unknown parameters in {path}: {', '.join(sorted(unknown))} (can be: {', '.join(uncertain_parameters)})")
+    for parameter in set(uncertainty) & set(uncertain_parameters):
+        distribution = uncertainty[parameter]
+        if (not isinstance(distribution, dict)) or (distribution.get('distribution') not in uncertainty_distributions):
+            raise ValueError(f"The distribution of {parameter} should be one of: {', '.join(uncertainty_distributions)}")
+        missing = set(uncertainty_distributions[distribution['distribution']]) - set(distribution)
+        if len(missing) > 0:
+            raise ValueError(f"Missing for the distribution of {parameter}: {', '.join(sorted(missing))}")
+    uncertainty.setdefault('confidence', 0.95)
+    uncertainty.setdefault('seed', 0)
+    if not 0 < uncertainty['confidence'] < 1:
+        raise ValueError(f"The confidence level should be between 0 and 1, got: {uncertainty['confidence']}")
+    return uncertainty
+
+
+def format_options(L_options, conjunction='and'):
+    '''
+    List of command line options as text, e.g. for the help and the error messages.
+    :param L_options: [list of str] e.g. ['--stream', '--useCache', '--slurmDB']
+    :param conjunction: [str, default='and'] before the last option
+    :return: [str] e.g. '--stream, --useCache and --slurmDB'
+    '''
+    if len(L_options) == 1:
+        return L_options[0]
+    return f"{', '.join(L_options[:-1])} {conjunction} {L_options[-1]}"
+
+
+class EmptyResults(Exception):
+    '''
+    Raised by `validity_checks.check_empty_results` when there are no jobs and the script shouldn't stop (e.g. on one of several clusters).
+    '''
+    pass
 
 
 class validity_checks():
@@ -21,6 +225,12 @@ class validity_checks():
     This class is used to check the validity of the various arguments and objects.
     '''
 
+    def __init__(self, exitIfEmpty=True):
+        '''
+        :param exitIfEmpty: [bool, default=True] whether to stop the script if there are no jobs, or to raise `EmptyResults` instead.
+        '''
+        self.exitIfEmpty = exitIfEmpty
+
     def validate_dates(self, args):
         '''
         Validate that `startDay` and `endDay` are in the right format and in the right order.
@@ -41,7 +251,8 @@ class validity_checks():
 
     def check_empty_results(self, df, filterWD=None, filterJobIDs='all'):
         '''
-        This is to check whether any jobs have been run on the period, and stop the script if not.
+        This is to check whether any jobs have been run on the period, and stop the script if not
+        (or raise `EmptyResults`, if `exitIfEmpty` is False).
         :param df: [pd.DataFrame] Usage logs
         :param filterWD: [None or str, default=None] Whether the results are filtered based on working directory.
         :param filterJobIDs: [str] 'all' or comma-seperated list of job IDs
@@ -54,6 +265,9 @@ class validity_checks():
             if filterJobIDs != 'all':
                 addThat += ' and with these jobIDs'
 
+            if not self.exitIfEmpty:
+                raise EmptyResults(f"No jobs on that period (from {self.startDay} to {self.endDay}){addThat}.")
+
             print(f'''
 
         You haven't run any jobs on that period (from {self.startDay} to {self.endDay}){addThat}.
@@ -66,6 +280,19 @@ class validity_checks():
 
 class Helpers_GA():
 
+    # Per-job statistics that are summed in the rollup
+    rollup_sums = [
+        'energy_CPUs', 'energy_GPUs', 'energy_memory', 'energy', 'energy_memoryNeededOnly',
+        'carbonFootprint', 'carbonFootprint_memoryNeededOnly',
+        'TotalCPUtimeX', 'WallclockTimeX', 'ReqMemX'
+    ]
+
+    # Rankings of the leaderboard (column to group the jobs by -> name), and the waste they are ranked by
+    leaderboard_rankings = {
+        'single_jobID': 'jobs', 'parentJobID': 'job arrays', 'JobNameX': 'job names', 'WorkingDirX': 'working directories'
+    }
+    leaderboard_wastes = {'memory': 'memory overallocation', 'failed': 'failed jobs'}
+
     def calculate_energies(self, row):
         '''
         Calculate the energy usaged based on the job's paramaters
@@ -93,6 +320,614 @@ class Helpers_GA():
 
         return row
 
+    def partition_coefficients(self, partition_info):
+        '''
+        :param partition_info: [dict] one partition from cluster_info.yaml
+        :return: [tuple of float] TDP_CPU and TDP_GPU (in W)
+        '''
+        if partition_info['type'] == 'CPU':
+            return partition_info['TDP'], 0
+        # NaN if missing, it is then only an issue if a job has used this partition
+        return partition_info.get('TDP_CPU', np.nan), partition_info['TDP']
+
+    def compile_partitions_coefficients(self):
+        '''
+        Compile the partitions from cluster_info.yaml into arrays of coefficients, to be used by `calculate_energies_column`.
+        :return: [pd.DataFrame] indexed by partition name, with columns TDP_CPU and TDP_GPU (in W).
+        '''
+        L_coeffs = [
+            (partition, *self.partition_coefficients(partition_info))
+            for partition, partition_info in self.cluster_info['partitions'].items()
+        ]
+        return pd.DataFrame(L_coeffs, columns=['partition','TDP_CPU','TDP_GPU']).set_index('partition')
+
+    def calculate_energies_column(self, df):
+        '''
+        Vectorised version of `calculate_energies`, for all the jobs at once.
+        :param df: [pd.DataFrame] usage statistics, one row per job
+        :return: [pd.DataFrame] the same statistics with the energies added
+        '''
+        coeffs = self.compile_partitions_coefficients()
+        idx_partition = coeffs.index.get_indexer(df.PartitionX)
+        assert (idx_partition != -1).all(), f"Unrecognised partition: {df.PartitionX[idx_partition == -1].iloc[0]}"
+        TDP2use4CPU = coeffs.TDP_CPU.values[idx_partition]
+        TDP2use4GPU = coeffs.TDP_GPU.values[idx_partition]
+        assert not np.isnan(TDP2use4CPU).any(), f"TDP_CPU missing in cluster_info.yaml for partition: {df.PartitionX[np.isnan(TDP2use4CPU)].iloc[0]}"
+
+        # Same as timedelta.total_seconds(), i.e. an integer number of microseconds divided by 1e6
+        totalCPUtime_s = df.TotalCPUtimeX.values.astype('timedelta64[us]').astype('int64') / 1e6
+        wallclockTime_s = df.WallclockTimeX.values.astype('timedelta64[us]').astype('int64') / 1e6
+
+        df = df.copy()
+        df['energy_CPUs'] = totalCPUtime_s / 3600 * TDP2use4CPU / 1000  # in kWh
+        # TODO: we assume just 1 GPU here
+        df['energy_GPUs'] = wallclockTime_s / 3600 * 1 * TDP2use4GPU / 1000  # in kWh
+
+        ### memory
+        for suffix, memory2use in zip(['','_memoryNeededOnly'], [df.ReqMemX,df.NeededMemX]):
+            df[f'energy_memory{suffix}'] = wallclockTime_s/3600 * memory2use * self.fParams['power_memory_perGB'] /1000 # in kWh
+            df[f'energy{suffix}'] = (df.energy_CPUs +  df.energy_GPUs + df[f'energy_memory{suffix}']) * self.cluster_info['PUE'] # in kWh
+
+        return df
+
+    def get_run_intervals(self, df):
+        '''
+        When each job was running: from its start time (its submission time if it isn't available) for its wallclock time.
+        :param df: [pd.DataFrame] usage statistics, one row per job
+        :return: [tuple of np.array] start (in s since epoch) and duration (in s) of each job
+        '''
+        startDatetime = df.StartDatetimeX if 'StartDatetimeX' in df else df.SubmitDatetimeX
+        start_s = startDatetime.values.astype('datetime64[us]').astype('int64') / 1e6
+        duration_s = df.WallclockTimeX.values.astype('timedelta64[us]').astype('int64') / 1e6
+        return start_s, duration_s
+
+    def find_CI_period(self, index, t):
+        '''
+        :param index: [dict] output of `load_CI_timeseries`
+        :param t: [np.array] times, in s since epoch
+        :return: [np.array of int] position of the value applying at each time in the time series, found by binary search
+        (i.e. the last one starting before, or the first one if before the time series)
+        '''
+        return np.maximum(np.searchsorted(index['times'], t, side='right') - 1, 0)
+
+    def integrate_CI(self, index, t):
+        '''
+        Integral of the carbon intensity from the start of the time series to `t`
+        (before and after the time series, the first and last values are used).
+        :param index: [dict] output of `load_CI_timeseries`
+        :param t: [np.array] times, in s since epoch
+        :return: [np.array] in gCO2e/kWh*s
+        '''
+        i = self.find_CI_period(index, t)
+        return index['cumulativeCI'][i] + index['CI'][i] * (t - index['times'][i])
+
+    def calculate_CI_column(self, df, cluster_info=None):
+        '''
+        Carbon intensity to use for each job: `CI` from cluster_info.yaml, or, if `CI_timeseries` is set,
+        the mean carbon intensity while the job was running (assuming a constant power draw).
+        :param df: [pd.DataFrame] usage statistics, one row per job
+        :param cluster_info: [None or dict, default=None] to override cluster_info.yaml (e.g. for a scenario)
+        :return: [float or np.array] in gCO2e/kWh
+        '''
+        if cluster_info is None:
+            cluster_info = self.cluster_info
+        if 'CI_timeseries' not in cluster_info:
+            return cluster_info['CI']
+
+        index = load_CI_timeseries(cluster_info['CI_timeseries'])
+        start_s, duration_s = self.get_run_intervals(df)
+        end_s = start_s + duration_s
+
+        outside = (start_s < index['times'][0]) | (end_s > index['end'])
+        if outside.any():
+            print(f"NB: {outside.sum():,} job(s) ran outside of the carbon intensity time series, the closest values are used for them.")
+
+        # Mean over the run with the cumulative index (two binary searches per job), or the value at the start for instantaneous jobs
+        with np.errstate(invalid='ignore', divide='ignore'):
+            meanCI = (self.integrate_CI(index, end_s) - self.integrate_CI(index, start_s)) / duration_s
+        instantCI = index['CI'][self.find_CI_period(index, start_s)]
+        return np.where(duration_s > 0, meanCI, instantCI)
+
+    def calculate_timeline(self, df, resolution='hour'):
+        '''
+        Estimated power draw of the jobs over time, assuming that each job draws a constant power while it's running
+        (i.e. its energy divided by its wallclock time), so that the energy over the timeline is the same as in the report.
+        The power in each bin is calculated in one pass with a sweep line: the energy used up to time t is
+        sum(P * (t - start)) over the jobs started before t, minus the same over the jobs finished before t,
+        and these sums are built with difference arrays (i.e. in O(jobs + bins) rather than O(jobs * bins)).
+        :param df: [pd.DataFrame] usage statistics, one row per job, with the energies
+        :param resolution: [str, default='hour'] 'minute' or 'hour'
+        :return: [pd.DataFrame] one row per minute or hour, with the datetime (start of the bin)
+        and the mean power draw of the CPUs, GPUs, memory, data centre overheads and total, in kW
+        '''
+        bin_s = {'minute': 60, 'hour': 3600}[resolution]
+        start_s, duration_s = self.get_run_intervals(df)
+        # Jobs without any wallclock time don't draw any power
+        running = duration_s > 0
+        start_s, duration_s = start_s[running], duration_s[running]
+        energies = {
+            'power_CPUs': df.energy_CPUs.values[running],
+            'power_GPUs': df.energy_GPUs.values[running],
+            'power_memory': df.energy_memory.values[running],
+            'power': df.energy.values[running],
+        }
+        energies['power_overheads'] = energies['power'] - energies['power_CPUs'] - energies['power_GPUs'] - energies['power_memory']
+        columns = ['datetime', 'power_CPUs', 'power_GPUs', 'power_memory', 'power_overheads', 'power']
+        if len(start_s) == 0:
+            return pd.DataFrame(columns=columns)
+
+        # Times relative to the first bin, so that the products below stay small
+        t0 = math.floor(start_s.min() / bin_s) * bin_s
+        start_s, end_s = start_s - t0, start_s + duration_s - t0
+        n_bins = math.ceil(end_s.max() / bin_s)
+        edges_s = np.arange(n_bins + 1) * bin_s
+        # Index of the first edge after the start and end of each job
+        i_start = (start_s // bin_s).astype('int64') + 1
+        i_end = (end_s // bin_s).astype('int64') + 1
+
+        timeline = pd.DataFrame({'datetime': pd.to_datetime(t0 + edges_s[:-1], unit='s')})
+        for x, energy in energies.items():
+            power = energy / (duration_s / 3600)  # in kW
+            # Sum of P and P*start over the jobs started before each edge, minus the same for the jobs finished
+            slope = np.cumsum(
+                np.bincount(i_start, weights=power, minlength=n_bins + 2)
+                - np.bincount(i_end, weights=power, minlength=n_bins + 2)
+            )[:n_bins + 1]
+            intercept = np.cumsum(
+                np.bincount(i_start, weights=power * start_s, minlength=n_bins + 2)
+                - np.bincount(i_end, weights=power * end_s, minlength=n_bins + 2)
+            )[:n_bins + 1]
+            # Energy used up to each edge (in kW.s), and mean power in each bin
+            energy_cumulative = slope * edges_s - intercept
+            timeline[x] = np.diff(energy_cumulative) / bin_s
+        return timeline[columns]
+
+    def calculate_rollup(self, df):
+        '''
+        Aggregate the per-job statistics per day (of submission), partition and state, which is all the report,
+        the summaries per user, account or period and the per-user reports need from the jobs.
+        :param df: [pd.DataFrame] usage statistics, one row per job, with the energies and footprints
+        :return: [pd.DataFrame] one row per (day, PartitionX, StateX), and per UserX and AccountX if available
+        '''
+        df = df.assign(day=df.SubmitDatetimeX.dt.normalize())
+        rollup_keys = ['day', 'PartitionX', 'StateX'] + [x for x in ['UserX', 'AccountX'] if x in df]
+        rollup = df.groupby(rollup_keys, dropna=False, observed=True, sort=True).agg(
+            n_jobs=('StateX', 'size'),
+            # The mean overallocation factor is calculated from the sum and number of non-NaN values
+            n_memOverallocationFactorX=('memOverallocationFactorX', 'count'),
+            memOverallocationFactorX=('memOverallocationFactorX', 'sum'),
+            firstSubmitDatetimeX=('SubmitDatetimeX', 'min'),
+            lastSubmitDatetimeX=('SubmitDatetimeX', 'max'),
+            **{x: (x, 'sum') for x in self.rollup_sums}
+        )
+        return rollup.reset_index()
+
+    def summarise_rollup(self, rollup):
+        '''
+        Calculate the totals used in the report from the rollup.
+        :param rollup: [pd.DataFrame] output of `calculate_rollup`, or a subset of it
+        :return: [dict] the totals
+        '''
+        totals = {x: rollup[x].sum() for x in self.rollup_sums}
+        totals['n_jobs'] = rollup.n_jobs.sum()
+        totals['n_completed'] = rollup.loc[rollup.StateX == 1].n_jobs.sum()
+        totals['n_failed'] = rollup.loc[rollup.StateX == 0].n_jobs.sum()
+        totals['carbonFootprint_failed'] = rollup.loc[rollup.StateX == 0].carbonFootprint.sum()
+        totals['memOverallocationFactorX_mean'] = rollup.memOverallocationFactorX.sum() / rollup.n_memOverallocationFactorX.sum()
+        totals['firstSubmitDatetimeX'] = rollup.firstSubmitDatetimeX.min()
+        totals['lastSubmitDatetimeX'] = rollup.lastSubmitDatetimeX.max()
+        totals['states'] = set(rollup.StateX)
+
+        ### Find list of partitions corresponding to GPUs
+        list_GPUs_partitions = [x for x in self.cluster_info['partitions'] if self.cluster_info['partitions'][x]['type']=='GPU']
+        totals['GPUusageTimeX'] = rollup.loc[rollup.PartitionX.isin(list_GPUs_partitions)].WallclockTimeX.sum()
+
+        return totals
+
+    def summarise_rollup_by(self, rollup, by):
+        '''
+        Totals of the rollup for each value of a column.
+        :param rollup: [pd.DataFrame] output of `calculate_rollup`, possibly with extra columns to group by
+        :param by: [str] column to group by
+        :return: [pd.DataFrame] one row per value of `by`
+        '''
+        failed = rollup.StateX == 0
+        rollup = rollup.assign(
+            n_failed=rollup.n_jobs.where(failed, 0),
+            carbonFootprint_failed=rollup.carbonFootprint.where(failed, 0),
+            carbonFootprint_memoryWaste=rollup.carbonFootprint - rollup.carbonFootprint_memoryNeededOnly,
+        )
+        summary = rollup.groupby(by, dropna=False, observed=True).agg(
+            n_jobs=('n_jobs', 'sum'),
+            n_failed=('n_failed', 'sum'),
+            energy=('energy', 'sum'),
+            energy_CPUs=('energy_CPUs', 'sum'),
+            energy_GPUs=('energy_GPUs', 'sum'),
+            energy_memory=('energy_memory', 'sum'),
+            carbonFootprint=('carbonFootprint', 'sum'),
+            carbonFootprint_failed=('carbonFootprint_failed', 'sum'),
+            carbonFootprint_memoryWaste=('carbonFootprint_memoryWaste', 'sum'),
+            memOverallocationFactorX=('memOverallocationFactorX', 'sum'),
+            n_memOverallocationFactorX=('n_memOverallocationFactorX', 'sum'),
+        )
+        summary['memOverallocationFactorX'] /= summary.n_memOverallocationFactorX
+        return summary.drop(columns='n_memOverallocationFactorX').rename(columns={'memOverallocationFactorX': 'memOverallocationFactorX_mean'})
+
+    def calculate_usersSummary(self, by):
+        '''
+        Summarise the footprint per user or per account, from the rollup.
+        :param by: [str] 'UserX' or 'AccountX'
+        :return: [pd.DataFrame] one row per user or account, sorted by decreasing carbon footprint
+        '''
+        summary = self.summarise_rollup_by(self.rollup, by)
+        return summary.sort_values('carbonFootprint', ascending=False)
+
+    def calculate_periodSummary(self, breakdown):
+        '''
+        Summarise the footprint per day, week (Monday to Sunday) or month of submission, from the rollup.
+        :param breakdown: [str] 'day', 'week' or 'month'
+        :return: [pd.DataFrame] one row per period with jobs, in chronological order
+        '''
+        freq = {'day': 'D', 'week': 'W', 'month': 'M'}[breakdown]
+        rollup = self.rollup.assign(period=self.rollup.day.dt.to_period(freq))
+        return self.summarise_rollup_by(rollup, 'period').sort_index()
+
+    def group_jobs(self, df):
+        '''
+        Group the jobs per partition and state, so that they can be summed once for many sets of parameters
+        (the energy of a job is linear in the TDP, the power of the memory, the PUE and the carbon intensity).
+        :param df: [pd.DataFrame] usage statistics, one row per job
+        :return: [tuple] partitions (pd.Index), group of each job (np.array of int, two groups per partition: not failed and failed),
+        and the values the energy is proportional to: TotalCPUtimeX and WallclockTimeX (in h), and ReqMemX times WallclockTimeX (in GB.h)
+        '''
+        idx_partition, partitions = pd.factorize(df.PartitionX)
+        group = idx_partition * 2 + (df.StateX.values == 0)
+        totalCPUtime_h = df.TotalCPUtimeX.values.astype('timedelta64[us]').astype('int64') / 1e6 / 3600
+        wallclockTime_h = df.WallclockTimeX.values.astype('timedelta64[us]').astype('int64') / 1e6 / 3600
+        return partitions, group, [totalCPUtime_h, wallclockTime_h, wallclockTime_h * df.ReqMemX.values]
+
+    def sum_per_group(self, group, n_groups, L_values, CI=1):
+        '''
+        :param group: [np.array of int] group of each job, from `group_jobs`
+        :param n_groups: [int]
+        :param L_values: [list of np.array] values to sum, one per job
+        :param CI: [float or np.array, default=1] carbon intensity to weight the values with
+        :return: [np.array] values x groups
+        '''
+        return np.stack([np.bincount(group, weights=x * CI, minlength=n_groups) for x in L_values])
+
+    def get_TDP_per_group(self, partitions, partitions_info):
+        '''
+        :param partitions: [pd.Index] partitions of the groups, from `group_jobs`
+        :param partitions_info: [dict] `partitions` from cluster_info.yaml, possibly modified
+        :return: [np.array] (CPU, GPU) x groups, TDP in W
+        '''
+        coeffs = np.array([self.partition_coefficients(partitions_info[partition]) for partition in partitions], dtype='float64').reshape(-1, 2)
+        assert not np.isnan(coeffs).any(), f"TDP_CPU missing in cluster_info.yaml for one of the partitions: {', '.join(partitions)}"
+        # Same coefficients for the failed and the other jobs of a partition
+        return np.repeat(coeffs.T, 2, axis=1)
+
+    def calculate_energy_components(self, sums, TDP, power_memory_perGB):
+        '''
+        Energy of the groups of jobs under several sets of parameters at once, before the data centre overheads (i.e. the PUE).
+        :param sums: [np.array] (TotalCPUtimeX, WallclockTimeX, ReqMemX[, NeededMemX]) x groups, or sets x ... x groups,
+        from `sum_per_group` (the results are footprints if the sums are weighted by the carbon intensity)
+        :param TDP: [np.array] sets x (CPU, GPU) x groups, in W
+        :param power_memory_perGB: [np.array] sets x 1, in W/GB
+        :return: [dict of np.array] sets x groups: CPUs, GPUs, memory (and memory_memoryNeededOnly), in kWh (or gCO2e)
+        '''
+        sums = np.broadcast_to(sums, (len(TDP),) + np.shape(sums)[-2:])
+        components = {
+            'CPUs': TDP[:, 0] * sums[:, 0] / 1000,
+            'GPUs': TDP[:, 1] * sums[:, 1] / 1000,
+            'memory': power_memory_perGB * sums[:, 2] / 1000,
+        }
+        if sums.shape[1] > 3:
+            components['memory_memoryNeededOnly'] = power_memory_perGB * sums[:, 3] / 1000
+        return components
+
+    def calculate_scenarios(self, scenarios):
+        '''
+        Footprint of the jobs under other parameters (PUE, carbon intensity, TDP of some partitions...), without pulling them again.
+        The jobs are first summed per partition and state (once per carbon intensity time series and memory granularity
+        used by the scenarios), and all the scenarios are then calculated at once from these sums, as arrays of scenarios x groups.
+        :param scenarios: [list of dict] output of `load_scenarios`
+        :return: [pd.DataFrame] one row per scenario (the first one with the current parameters),
+        with the energy, footprint, memory waste and failed jobs waste
+        '''
+        from GreenAlgorithms_workloadManager import Helpers_WM
+
+        df = self.df
+        scenarios = [{'name': 'Current'}] + scenarios
+        partitions, group, L_values = self.group_jobs(df)
+        n_groups = 2 * len(partitions)
+
+        ### Sums of the jobs per group, as is for the energy, and weighted by the carbon intensity for the footprint
+        # (the jobs are only summed again for the carbon intensity time series, a constant one multiplies the sums)
+        neededMemTime = {}  # per memory granularity
+        CIs = {self.CI_key: self.CI}  # per carbon intensity (value or time series)
+        sums_energy = {}  # per memory granularity
+        sums_footprint = {}  # per (carbon intensity, memory granularity)
+        L_sums_energy, L_sums_footprint = [], []
+        for scenario in scenarios:
+            cluster_info = {**self.cluster_info, **{x: scenario[x] for x in ['CI', 'CI_timeseries', 'granularity_memory_request'] if x in scenario}}
+            if 'CI' in scenario:
+                cluster_info.pop('CI_timeseries', None)
+            CI_key = ('CI_timeseries', cluster_info['CI_timeseries']) if 'CI_timeseries' in cluster_info else ('CI', cluster_info['CI'])
+            granularity = cluster_info['granularity_memory_request']
+
+            if granularity not in neededMemTime:
+                if granularity == self.cluster_info['granularity_memory_request']:
+                    neededMem = df.NeededMemX.values
+                else:
+                    neededMem = Helpers_WM().calc_realMemNeeded_column(df, granularity).values
+                # NB: L_values[1] is the wallclock time
+                neededMemTime[granularity] = L_values[1] * neededMem
+            if CI_key not in CIs:
+                CIs[CI_key] = self.calculate_CI_column(df, cluster_info=cluster_info)
+
+            L_values_scenario = L_values + [neededMemTime[granularity]]
+            if granularity not in sums_energy:
+                sums_energy[granularity] = self.sum_per_group(group, n_groups, L_values_scenario)
+            if (CI_key, granularity) not in sums_footprint:
+                if np.ndim(CIs[CI_key]) == 0:
+                    sums_footprint[(CI_key, granularity)] = sums_energy[granularity] * CIs[CI_key]
+                else:
+                    sums_footprint[(CI_key, granularity)] = self.sum_per_group(group, n_groups, L_values_scenario, CI=CIs[CI_key])
+            L_sums_energy.append(sums_energy[granularity])
+            L_sums_footprint.append(sums_footprint[(CI_key, granularity)])
+
+        ### Coefficients of each scenario
+        L_TDP = []
+        for scenario in scenarios:
+            partitions_info = {
+                partition: {**partition_info, **scenario.get('partitions', {}).get(partition, {})}
+                for partition, partition_info in self.cluster_info['partitions'].items()
+            }
+            L_TDP.append(self.get_TDP_per_group(partitions, partitions_info))
+        TDP = np.stack(L_TDP)
+        PUE = np.array([scenario.get('PUE', self.cluster_info['PUE']) for scenario in scenarios])[:, None]
+        power_memory_perGB = np.array([scenario.get('power_memory_perGB', self.fParams['power_memory_perGB']) for scenario in scenarios])[:, None]
+
+        ### All the scenarios at once: energies per (scenario, group), in kWh, and footprints, in gCO2e
+        results = {}
+        for name, sums in [('energy', np.stack(L_sums_energy)), ('carbonFootprint', np.stack(L_sums_footprint))]:
+            components = self.calculate_energy_components(sums, TDP, power_memory_perGB)
+            processors = components['CPUs'] + components['GPUs']
+            results[name] = PUE * (processors + components['memory'])
+            results[f'{name}_memoryNeededOnly'] = PUE * (processors + components['memory_memoryNeededOnly'])
+
+        summary = pd.DataFrame({
+            'energy': results['energy'].sum(axis=1),
+            'carbonFootprint': results['carbonFootprint'].sum(axis=1),
+            'carbonFootprint_memoryWaste': (results['carbonFootprint'] - results['carbonFootprint_memoryNeededOnly']).sum(axis=1),
+            'carbonFootprint_failed': results['carbonFootprint'][:, 1::2].sum(axis=1),
+        }, index=pd.Index([str(scenario['name']) for scenario in scenarios], name='scenario'))
+        summary['change'] = summary.carbonFootprint / summary.carbonFootprint.iloc[0] - 1
+        return summary
+
+    def draw_factors(self, distribution, size, rng):
+        '''
+        Random factors to multiply an uncertain parameter by.
+        :param distribution: [None or dict] from `load_uncertainty`, the parameter is certain if None
+        :param size: [int or tuple] shape of the output
+        :param rng: [np.random.Generator]
+        :return: [np.array] positive factors, centred on 1 (unless set otherwise in the distribution)
+        '''
+        if distribution is None:
+            return np.ones(size)
+        if distribution['distribution'] == 'normal':
+            factors = rng.normal(distribution.get('mean', 1), distribution['sd'], size)
+        elif distribution['distribution'] == 'uniform':
+            factors = rng.uniform(distribution['low'], distribution['high'], size)
+        elif distribution['low'] == distribution['high']:
+            # numpy doesn't draw from a triangular distribution of width 0
+            factors = np.full(size, float(distribution['low']))
+        else:
+            factors = rng.triangular(distribution['low'], distribution.get('mode', 1), distribution['high'], size)
+        return np.maximum(factors, 0)
+
+    def calculate_uncertainty(self, uncertainty, n_samples, chunk_size=1000):
+        '''
+        Monte Carlo estimate of the uncertainty on the totals of the report: the uncertain parameters are multiplied
+        by random factors, and the totals are calculated for each sample, from the sums of the jobs per partition and state
+        (as in `calculate_scenarios`), by chunks of samples to bound the memory used.
+        :param uncertainty: [dict] output of `load_uncertainty`
+        :param n_samples: [int] number of samples
+        :param chunk_size: [int, default=1000] number of samples calculated at once
+        :return: [pd.DataFrame] one row per total (footprint, failed jobs waste, energy and its split),
+        with the estimate (current parameters) and the confidence interval (`low` and `high`)
+        '''
+        partitions, group, L_values = self.group_jobs(self.df)
+        n_groups = 2 * len(partitions)
+        sums_energy = self.sum_per_group(group, n_groups, L_values)
+        sums_footprint = self.sum_per_group(group, n_groups, L_values, CI=self.CI)
+        TDP = self.get_TDP_per_group(partitions, self.cluster_info['partitions'])
+
+        # One stream of random numbers per parameter, so that the samples drawn chunk by chunk don't depend on the chunk size
+        L_seeds = np.random.SeedSequence(uncertainty['seed']).spawn(len(uncertain_parameters))
+        rngs = {x: np.random.default_rng(seed) for x, seed in zip(uncertain_parameters, L_seeds)}
+        L_totals = []
+        for chunk_start in range(0, n_samples, chunk_size):
+            n = min(chunk_size, n_samples - chunk_start)
+            factors = {x: self.draw_factors(uncertainty.get(x), (n, 1), rngs[x]) for x in ['PUE', 'CI', 'power_memory_perGB']}
+            # TDP drawn independently for each partition, and for the CPUs and GPUs of a partition
+            factors_TDP = np.repeat(self.draw_factors(uncertainty.get('TDP'), (n, 2, len(partitions)), rngs['TDP']), 2, axis=2)
+            TDP_samples = TDP[None] * factors_TDP
+            PUE = self.cluster_info['PUE'] * factors['PUE']
+            power_memory_perGB = self.fParams['power_memory_perGB'] * factors['power_memory_perGB']
+
+            energy = {x: y.sum(axis=1) for x, y in self.calculate_energy_components(sums_energy, TDP_samples, power_memory_perGB).items()}
+            energy_beforeOverheads = energy['CPUs'] + energy['GPUs'] + energy['memory']
+            footprint = self.calculate_energy_components(sums_footprint, TDP_samples, power_memory_perGB)
+            footprint = PUE * factors['CI'] * (footprint['CPUs'] + footprint['GPUs'] + footprint['memory'])
+            L_totals.append(pd.DataFrame({
+                'carbonFootprint': footprint.sum(axis=1),
+                'carbonFootprint_failed': footprint[:, 1::2].sum(axis=1),
+                'energy': PUE[:, 0] * energy_beforeOverheads,
+                'energy_CPUs': energy['CPUs'],
+                'energy_GPUs': energy['GPUs'],
+                'energy_memory': energy['memory'],
+                'energy_overheads': (PUE[:, 0] - 1) * energy_beforeOverheads,
+            }))
+        samples = pd.concat(L_totals, ignore_index=True)
+
+        totals = self.summarise_rollup(self.rollup)
+        alpha = (1 - uncertainty['confidence']) / 2
+        summary = samples.quantile([alpha, 1 - alpha]).T.set_axis(['low', 'high'], axis=1)
+        summary.insert(0, 'estimate', [
+            totals['carbonFootprint'], totals['carbonFootprint_failed'], totals['energy'], totals['energy_CPUs'], totals['energy_GPUs'],
+            totals['energy_memory'], totals['energy'] - totals['energy_CPUs'] - totals['energy_GPUs'] - totals['energy_memory'],
+        ])
+        return summary
+
+    def formatText_uncertainty(self, summary):
+        '''
+        Format the confidence intervals as a table
+        :param summary: [pd.DataFrame] output of `calculate_uncertainty`
+        :return: [str] text to display
+        '''
+        names = {
+            'carbonFootprint': 'Footprint', 'carbonFootprint_failed': 'Failed jobs waste', 'energy': 'Energy', 'energy_CPUs': '- CPUs',
+            'energy_GPUs': '- GPUs', 'energy_memory': '- Memory', 'energy_overheads': '- Data centre overheads',
+        }
+        L_rows = []
+        for x, row in summary.iterrows():
+            if x.startswith('energy'):
+                L_rows.append([f"{y:,.2f} kWh" for y in row])
+            else:
+                L_rows.append([self.formatText_footprint(y) for y in row])
+        table = pd.DataFrame(L_rows, columns=['Estimate', 'Low', 'High'], index=[names[x] for x in summary.index])
+        return '\n'.join(f"        {line}" for line in table.to_string().split('\n'))
+
+    def formatText_scenarios(self, summary):
+        '''
+        Format the comparison of the scenarios as a table
+        :param summary: [pd.DataFrame] output of `calculate_scenarios`
+        :return: [str] text to display
+        '''
+        table = pd.DataFrame({
+            'Energy': summary.energy.map('{:,.2f} kWh'.format),
+            'Footprint': summary.carbonFootprint.map(self.formatText_footprint),
+            'Change': summary.change.map('{:+.1%}'.format),
+            'Failed jobs waste': summary.carbonFootprint_failed.map(self.formatText_footprint),
+            'Memory waste': summary.carbonFootprint_memoryWaste.map(self.formatText_footprint),
+        }, index=summary.index.rename('Scenario'))
+        return '\n'.join(f"        {line}" for line in table.to_string().split('\n'))
+
+    def calculate_leaderboard(self, df, n):
+        '''
+        Rank the jobs, job arrays, job names and working directories by the carbon they waste,
+        with memory overallocation (footprint minus footprint with the memory needed only) and with failed jobs.
+        Only the top `n` of each ranking are selected (`nlargest`), the jobs are never sorted.
+        NB: this is done once all the footprints are calculated, rather than with bounded heaps while the jobs are pulled:
+        the footprints are only known at that point, and the total of a job array, job name or working directory
+        is only known once all its jobs have been seen, so it can't be dropped from a top `n` before.
+        :param df: [pd.DataFrame] usage statistics, one row per job, with the footprints
+        :param n: [int] length of each ranking
+        :return: [pd.DataFrame] one row per (ranking, waste, rank), with the `key` ranked (and its user, if available),
+        the number of jobs and the carbon wasted, in gCO2e
+        '''
+        # The same job names and working directories are ranked separately for each user
+        context = [x for x in ['UserX'] if x in df]
+        wastes = {
+            'memory': df.carbonFootprint - df.carbonFootprint_memoryNeededOnly,
+            'failed': df.carbonFootprint.where(df.StateX == 0, 0),
+        }
+        L_leaderboards = []
+        for waste, waste_per_job in wastes.items():
+            # Only the jobs wasting something can be ranked
+            jobs = df.loc[waste_per_job > 0, list(self.leaderboard_rankings) + context]
+            jobs['carbonFootprint_wasted'] = waste_per_job.loc[jobs.index]
+            for ranking in self.leaderboard_rankings:
+                if ranking == 'single_jobID':
+                    top = jobs.nlargest(n, 'carbonFootprint_wasted').assign(n_jobs=1)
+                else:
+                    top = jobs.groupby([ranking] + context, observed=True, sort=False).agg(
+                        carbonFootprint_wasted=('carbonFootprint_wasted', 'sum'),
+                        n_jobs=('carbonFootprint_wasted', 'size'),
+                    ).nlargest(n, 'carbonFootprint_wasted').reset_index()
+                L_leaderboards.append(pd.DataFrame({
+                    'ranking': ranking,
+                    'waste': waste,
+                    **{x: top[x].astype(str).values for x in context},
+                    'key': top[ranking].astype(str).values,
+                    'n_jobs': top.n_jobs.values,
+                    'carbonFootprint_wasted': top.carbonFootprint_wasted.values,
+                }))
+        return pd.concat(L_leaderboards, ignore_index=True)
+
+    def select_leaderboard(self, leaderboard, n):
+        '''
+        Top `n` of each ranking of a leaderboard, e.g. to combine the leaderboards of several clusters.
+        :param leaderboard: [pd.DataFrame] output of `calculate_leaderboard`, possibly with more than `n` rows per ranking
+        :param n: [int] length of each ranking
+        :return: [pd.DataFrame] same format as `calculate_leaderboard`
+        '''
+        leaderboard = leaderboard.sort_values('carbonFootprint_wasted', ascending=False, kind='mergesort')
+        return leaderboard.groupby(['ranking', 'waste'], sort=False).head(n).reset_index(drop=True)
+
+    def formatText_leaderboard(self, leaderboard):
+        '''
+        Format the leaderboard as lists, one per ranking and waste
+        :param leaderboard: [pd.DataFrame] output of `calculate_leaderboard`
+        :return: [str] text to display
+        '''
+        context = [x for x in ['ClusterX', 'UserX'] if x in leaderboard]
+        L_text = []
+        for waste, waste_name in self.leaderboard_wastes.items():
+            for ranking, ranking_name in self.leaderboard_rankings.items():
+                top = leaderboard.loc[(leaderboard.ranking == ranking) & (leaderboard.waste == waste)]
+                L_text.append(f"\n        ...Top {ranking_name} by waste from {waste_name}:")
+                if len(top) == 0:
+                    L_text.append("             (none)")
+                for rank, row in enumerate(top.itertuples(index=False), start=1):
+                    text_context = ', '.join(str(getattr(row, x)) for x in context)
+                    text_context = f" ({text_context})" if text_context != '' else ''
+                    text_jobs = f" over {row.n_jobs:,} job{'s' if row.n_jobs > 1 else ''}" if ranking != 'single_jobID' else ''
+                    L_text.append(f"             {rank}. {row.key}{text_context}: {self.formatText_footprint(row.carbonFootprint_wasted)}{text_jobs}")
+        return '\n'.join(L_text)
+
+    def formatText_usersSummary(self, summary, name):
+        '''
+        Format the per-user or per-account summary as a table
+        :param summary: [pd.DataFrame] output of `calculate_usersSummary`
+        :param name: [str] name of the index of the table, e.g. 'User'
+        :return: [str] text to display
+        '''
+        table = pd.DataFrame({
+            'Jobs': summary.n_jobs.map('{:,}'.format),
+            'Failed jobs': summary.n_failed.map('{:,}'.format),
+            'Energy': summary.energy.map('{:,.2f} kWh'.format),
+            'Footprint': summary.carbonFootprint.map(self.formatText_footprint),
+            'Failed jobs waste': summary.carbonFootprint_failed.map(self.formatText_footprint),
+            'Memory waste': summary.carbonFootprint_memoryWaste.map(self.formatText_footprint),
+            'Memory overallocation': summary.memOverallocationFactorX_mean.map('{:.1f}'.format),
+        }, index=summary.index.rename(name))
+        return '\n'.join(f"        {line}" for line in table.to_string().split('\n'))
+
+    def formatText_periodSummary(self, summary, name):
+        '''
+        Format the per-period summary as a table, with the split of the energy
+        :param summary: [pd.DataFrame] output of `calculate_periodSummary`
+        :param name: [str] name of the index of the table, e.g. 'Month'
+        :return: [str] text to display
+        '''
+        dcOverheads = summary.energy - summary.energy_CPUs - summary.energy_GPUs - summary.energy_memory
+        table = pd.DataFrame({
+            'Jobs': summary.n_jobs.map('{:,}'.format),
+            'Failed jobs': summary.n_failed.map('{:,}'.format),
+            'Energy': summary.energy.map('{:,.2f} kWh'.format),
+            'CPUs': (summary.energy_CPUs / summary.energy).map('{:.0%}'.format),
+            'GPUs': (summary.energy_GPUs / summary.energy).map('{:.0%}'.format),
+            'Memory': (summary.energy_memory / summary.energy).map('{:.0%}'.format),
+            'Overheads': (dcOverheads / summary.energy).map('{:.0%}'.format),
+            'Footprint': summary.carbonFootprint.map(self.formatText_footprint),
+            'Failed jobs waste': summary.carbonFootprint_failed.map(self.formatText_footprint),
+            'Memory waste': summary.carbonFootprint_memoryWaste.map(self.formatText_footprint),
+        }, index=summary.index.astype(str).rename(name))
+        return '\n'.join(f"        {line}" for line in table.to_string().split('\n'))
+
     def formatText_footprint(self, footprint_g):
         '''
         Format the text to display the carbon footprint
@@ -169,27 +1004,40 @@ class GreenAlgorithms(Helpers_GA):
         Calculate the carbon footprint of each job
         '''
         ### Calculate energies
-        self.df = self.df.apply(self.calculate_energies, axis = 1)
+        self.df = self.calculate_energies_column(self.df)
 
         ### Calculate footprints
+        # NB: the carbon intensity is kept for the scenarios (`calculate_scenarios`)
+        self.CI = self.calculate_CI_column(self.df)
+        self.CI_key = ('CI_timeseries', self.cluster_info['CI_timeseries']) if 'CI_timeseries' in self.cluster_info else ('CI', self.cluster_info['CI'])
         for suffix in ['', '_memoryNeededOnly']:
-            self.df[f'carbonFootprint{suffix}'] = self.df[f'energy{suffix}'] * self.cluster_info['CI']
+            self.df[f'carbonFootprint{suffix}'] = self.df[f'energy{suffix}'] * self.CI
+
+        ### Aggregate per day
+        self.rollup = self.calculate_rollup(self.df)
 
-    def generate_report(self):
+    def generate_report(self, rollup=None, title=None, leaderboard=None):
         '''
         Generate the report to display in the command line
+        :param rollup: [None or pd.DataFrame, default=None] subset of the rollup to report on (default: all the jobs)
+        :param title: [None or str, default=None] title of the report (default: "Your carbon footprint on [cluster name]")
+        :param leaderboard: [None or pd.DataFrame, default=None] output of `calculate_leaderboard`, to show the largest sources of waste
+        :return: [str] the report (also stored in self.report)
         '''
+        if rollup is None:
+            rollup = self.rollup
+        totals = self.summarise_rollup(rollup)
+
         # Footprint
-        footprint_g = self.df.carbonFootprint.sum()
+        footprint_g = totals['carbonFootprint']
         text_footprint = self.formatText_footprint(footprint_g)
 
-        footprint_realVmem = self.df.carbonFootprint.sum() - self.df.carbonFootprint_memoryNeededOnly.sum()
+        footprint_realVmem = totals['carbonFootprint'] - totals['carbonFootprint_memoryNeededOnly']
         text_footprint_memoryNeededOnly = self.formatText_footprint(footprint_realVmem)
 
         # Failed jobs
-        assert set(self.df.StateX) <= {0,1}
-        df_failedJobs = self.df.loc[self.df.StateX == 0]
-        footprint_g_failed = df_failedJobs.carbonFootprint.sum()
+        assert totals['states'] <= {0,1}
+        footprint_g_failed = totals['carbonFootprint_failed']
         text_footprint_failed = self.formatText_footprint(footprint_g_failed)
 
         # Equivalence tree months
@@ -215,28 +1063,33 @@ class GreenAlgorithms(Helpers_GA):
         else:
             text_filterJobIDs = f"\n        (NB: The only jobs considered here are those with job IDs: {self.args.filterJobIDs})\n"
 
-        ### Find list of partitions corresponding to GPUs
-        list_GPUs_partitions = [x for x in cluster_info['partitions'] if cluster_info['partitions'][x]['type']=='GPU']
-
         ### If there is no GPU time
-        totalGPUusageTime = self.df.loc[self.df.PartitionX.isin(list_GPUs_partitions)].WallclockTimeX.sum()
+        totalGPUusageTime = totals['GPUusageTimeX']
         if pd.isnull(totalGPUusageTime):
             totalGPUusageTime = 0
 
-        ### about cluster name
-        clusterName = cluster_info['cluster_name']
+        ### Title, and padding of the period to center it
+        if title is None:
+            title = f"Your carbon footprint on {self.cluster_info['cluster_name']}"
+        padding = len(title) - len(f"({self.args.startDay} / {self.args.endDay})")
+
+        ### Largest sources of waste
+        if leaderboard is None:
+            text_leaderboard = ''
+        else:
+            text_leaderboard = f"\n\n        Largest sources of waste:\n{self.formatText_leaderboard(leaderboard)}"
 
         ### Energy overheads
-        totalEnergy = self.df.energy.sum()
-        dcOverheads = totalEnergy - self.df.energy_CPUs.sum() - self.df.energy_GPUs.sum() - self.df.energy_memory.sum()
+        totalEnergy = totals['energy']
+        dcOverheads = totalEnergy - totals['energy_CPUs'] - totals['energy_GPUs'] - totals['energy_memory']
 
         self.report = f'''
-          ############################{'#'*len(clusterName)}###
-          #                           {' '*len(clusterName)}  #
-          #  Your carbon footprint on {clusterName}  #
-          #  {' '*(math.floor(len(clusterName)/2))}({self.args.startDay} / {self.args.endDay}){' '*(math.ceil(len(clusterName)/2))}  #
-          #                           {' '*len(clusterName)}  #
-          ############################{'#'*len(clusterName)}###
+          ###{'#'*len(title)}###
+          #  {' '*len(title)}  #
+          #  {title}  #
+          #  {' '*(math.floor(padding/2))}({self.args.startDay} / {self.args.endDay}){' '*(math.ceil(padding/2))}  #
+          #  {' '*len(title)}  #
+          ###{'#'*len(title)}###
 
                   {'-' * (len(text_footprint) + 6)}
                  |   {text_footprint}   |
@@ -247,100 +1100,452 @@ class GreenAlgorithms(Helpers_GA):
              - {text_driving}
              - {text_flying}
 
-        ...On average, you request {self.df.memOverallocationFactorX.mean():.1f} times the memory you need.
+        ...On average, you request {totals['memOverallocationFactorX_mean']:.1f} times the memory you need.
            By only requesting the memory you needed, you could have saved {text_footprint_memoryNeededOnly} ({footprint_realVmem / self.fParams['tree_month']:,.2f} tree-months).
         
-        ...{len(df_failedJobs)/len(self.df):.1%} of your jobs failed, which represents a waste of {text_footprint_failed} ({footprint_g_failed / self.fParams['tree_month']:,.2f} tree-months).
+        ...{totals['n_failed']/totals['n_jobs']:.1%} of your jobs failed, which represents a waste of {text_footprint_failed} ({footprint_g_failed / self.fParams['tree_month']:,.2f} tree-months).{text_leaderboard}
         {text_filterCWD}{text_filterJobIDs}
         Energy used: {totalEnergy:,.2f} kWh
-             - CPUs: {self.df.energy_CPUs.sum():,.2f} kWh ({round(self.df.energy_CPUs.sum() / totalEnergy, 2):.0%})
-             - GPUs: {self.df.energy_GPUs.sum():,.2f} kWh ({round(self.df.energy_GPUs.sum() / totalEnergy, 2):.0%})
-             - Memory: {self.df.energy_memory.sum():,.2f} kWh ({round(self.df.energy_memory.sum() / totalEnergy, 2):.0%})
+             - CPUs: {totals['energy_CPUs']:,.2f} kWh ({round(totals['energy_CPUs'] / totalEnergy, 2):.0%})
+             - GPUs: {totals['energy_GPUs']:,.2f} kWh ({round(totals['energy_GPUs'] / totalEnergy, 2):.0%})
+             - Memory: {totals['energy_memory']:,.2f} kWh ({round(totals['energy_memory'] / totalEnergy, 2):.0%})
              - Data centre overheads: {dcOverheads:,.2f} kWh ({round(dcOverheads / totalEnergy, 2):.0%})
 
         Summary of your usage: 
-             - First/last job recorded on that period: {str(self.df.SubmitDatetimeX.min().date())}/{str(self.df.SubmitDatetimeX.max().date())}
-             - Number of jobs: {len(self.df):,} ({len(self.df.loc[self.df.StateX == 1]):,} completed)
-             - Total CPU usage time: {str(self.df.TotalCPUtimeX.sum())}
+             - First/last job recorded on that period: {str(totals['firstSubmitDatetimeX'].date())}/{str(totals['lastSubmitDatetimeX'].date())}
+             - Number of jobs: {totals['n_jobs']:,} ({totals['n_completed']:,} completed)
+             - Total CPU usage time: {str(totals['TotalCPUtimeX'])}
              - Total GPU usage time: {str(totalGPUusageTime)}
-             - Total wallclock time: {str(self.df.WallclockTimeX.sum())}
-             - Total memory requested: {self.df.ReqMemX.sum():,.0f} GB
+             - Total wallclock time: {str(totals['WallclockTimeX'])}
+             - Total memory requested: {totals['ReqMemX']:,.0f} GB
 
 
         Any bugs, questions, suggestions? Email LL582@medschl.cam.ac.uk
         {'-' * 80}
         Calculated using the Green Algorithms framework: www.green-algorithms.org
         '''
+        return self.report
+
+def pull_jobs(args, cluster_info, validator, profiler):
+    '''
+    Pull the usage logs from the workload manager, clean them and aggregate them per job.
+    :param args: [Namespace] command line arguments from the user
+    :param cluster_info: [dict] info about the cluster, from cluster_info.yaml
+    :param validator: [validity_checks] to stop if there are no jobs
+    :param profiler: [Profiler] to profile the different steps
+    :return: [WorkloadManager] with the jobs to report on in `df_agg`
+    '''
+    # Imported here rather than at the top, as they load pandas
+    from GreenAlgorithms_workloadManager import WorkloadManager
+    from GreenAlgorithms_cache import JobsCache, default_cache_path
+    if args.slurmDB is not None:
+        from GreenAlgorithms_slurmdb import SlurmDBWorkloadManager as WorkloadManager
+
+    ### Pull usage statistics from the workload manager
+    WM = WorkloadManager(args, cluster_info, profiler=profiler)
+
+    if args.useCache:
+        ### Only pull the usage logs that are not in the local cache yet
+        with profiler.stage('pull_logs_cached') as record:
+            cache = JobsCache(
+                default_cache_path(cluster_info),
+                cluster_info,
+                maxAgeDays=args.cacheMaxAgeDays,
+                maxJobs=args.cacheMaxJobs
+            )
+            WM.pull_logs_cached(cache)
+            cache.close()
+            record['rows_out'] = len(WM.df_agg_0)
+        # Check if there are any jobs during the period
+        validator.check_empty_results(WM.df_agg_0)
+        with profiler.stage('process_df_agg', rows_in=len(WM.df_agg_0)) as record:
+            WM.process_df_agg()
+            record['rows_out'] = len(WM.df_agg)
+    elif args.stream:
+        ### Pull, clean and aggregate the usage logs chunk by chunk
+        with profiler.stage('stream_logs') as record:
+            WM.stream_logs()
+            record['rows_out'] = len(WM.df_agg_0)
+        # Check if there are any jobs during the period (the filters are applied while streaming)
+        validator.check_empty_results(WM.df_agg_0, filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+        with profiler.stage('process_df_agg', rows_in=len(WM.df_agg_0)) as record:
+            WM.process_df_agg()
+            record['rows_out'] = len(WM.df_agg)
+    else:
+        with profiler.stage('pull_logs') as record:
+            WM.pull_logs()
+            if args.slurmDB is not None:
+                # Number of jobs and job steps
+                record['rows_out'] = len(WM.jobs_db) + len(WM.steps_db)
+            else:
+                # Number of lines of the sacct output, including the header
+                record['rows_out'] = WM.count_lines(WM.logs_raw)
+
+        ### Log the output for debugging
+        scripts_dir = os.path.dirname(os.path.realpath(__file__))
+        if args.reportBug | args.reportBugHere:
+            log_name = str(datetime.datetime.now().timestamp()).replace(".", "_")
+
+            if args.reportBug:
+                log_path = os.path.join(scripts_dir, 'error_logs', f'sacctOutput_{log_name}.csv')
+                # Logging into a seperate dir to write-protect the main one (not in place for now)
+                # log_path = os.path.join(pathlib.Path(scripts_dir).parent.absolute(), 'GreenAlgorithms4HPC_errorLogs', f'sacctOutput_{log_name}.csv')
+            elif args.reportBugHere:
+                log_path = f'{os.getcwd()}/sacctOutput_{log_name}.csv'
+
+            os.makedirs(os.path.dirname(log_path), exist_ok=True) # Create error_logs dir if needed
+            with open(log_path, 'wb') as f:
+                f.write(WM.logs_raw)
+            print(f"SLURM statistics logged for debuging: {log_path}")
+
+        if args.workers > 1:
+            ### Turn usage logs into DataFrame, filter, clean and aggregate them, with several processes
+            with profiler.stage('aggregate_logs_parallel') as record:
+                WM.aggregate_logs_parallel()
+                record['rows_out'] = len(WM.df_agg_0)
+            validator.check_empty_results(WM.df_agg_0, filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+            with profiler.stage('process_df_agg', rows_in=len(WM.df_agg_0)) as record:
+                WM.process_df_agg()
+                record['rows_out'] = len(WM.df_agg)
+        else:
+            ### Turn usage logs into DataFrame
+            with profiler.stage('convert2dataframe') as record:
+                WM.convert2dataframe()
+                record['rows_out'] = len(WM.logs_df)
+            # Check if there are any jobs during the period (and with these jobIDs, if they have been passed to the workload manager)
+            pushedJobIDs = args.filterJobIDs if WM.get_filter_jobIDs() is not None else 'all'
+            validator.check_empty_results(WM.logs_df, filterJobIDs=pushedJobIDs)
+
+            ### Only keep the jobs from this directory and with these jobIDs, before cleaning them
+            if (args.filterWD is not None) | (args.filterJobIDs != 'all'):
+                with profiler.stage('filter_logs_df', rows_in=len(WM.logs_df)) as record:
+                    WM.filter_logs_df()
+                    record['rows_out'] = len(WM.logs_df)
+                validator.check_empty_results(WM.logs_df, filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+
+            ### Clean the usage logs
+            with profiler.stage('clean_logs_df', rows_in=len(WM.logs_df)) as record:
+                WM.clean_logs_df()
+                record['rows_out'] = len(WM.df_agg)
 
-def main(args, cluster_info, fParams):
+    # Check if there are any jobs during the period from this directory and with these jobIDs
+    validator.check_empty_results(WM.df_agg, filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+
+    return WM
+
+
+def print_periodSummary(GA, args, profiler):
+    '''
+    Print the breakdown of the footprint per day, week or month (with --breakdown).
+    :param GA: [GreenAlgorithms] with the footprints calculated
+    :param args: [Namespace] command line arguments from the user
+    :param profiler: [Profiler] to profile the different steps
+    '''
+    with profiler.stage('summary_per_period', rows_in=len(GA.rollup)) as record:
+        summary = GA.calculate_periodSummary(args.breakdown)
+        record['rows_out'] = len(summary)
+    print(f"\n        Carbon footprint per {args.breakdown} (of submission):\n")
+    print(GA.formatText_periodSummary(summary, args.breakdown.capitalize()))
+
+
+def print_scenarios(GA, scenarios, profiler):
+    '''
+    Print the comparison of the what-if scenarios (with --scenarios).
+    :param GA: [GreenAlgorithms] with the footprints calculated
+    :param scenarios: [list of dict] output of `load_scenarios`
+    :param profiler: [Profiler] to profile the different steps
+    '''
+    with profiler.stage('scenarios', rows_in=len(GA.df)) as record:
+        summary = GA.calculate_scenarios(scenarios)
+        record['rows_out'] = len(summary)
+    print(f"\n        Carbon footprint of the same jobs under other scenarios:\n")
+    print(GA.formatText_scenarios(summary))
+
+
+def print_uncertainty(GA, uncertainty, args, profiler):
+    '''
+    Print the confidence intervals of the footprint and energy (with --uncertainty).
+    :param GA: [GreenAlgorithms] with the footprints calculated
+    :param uncertainty: [dict] output of `load_uncertainty`
+    :param args: [Namespace] command line arguments from the user
+    :param profiler: [Profiler] to profile the different steps
+    '''
+    with profiler.stage('uncertainty', rows_in=len(GA.df)) as record:
+        summary = GA.calculate_uncertainty(uncertainty, args.uncertaintySamples)
+        record['rows_out'] = args.uncertaintySamples
+    print(f"\n        Uncertainty ({uncertainty['confidence']:.0%} interval, from {args.uncertaintySamples:,} samples of the parameters):\n")
+    print(GA.formatText_uncertainty(summary))
+
+
+def report_per_user(GA, args, profiler, location):
+    '''
+    Print the breakdown of the footprint per user and per account (with --allUsers), and the report of each user (with --perUserReports).
+    :param GA: [GreenAlgorithms] with the footprints calculated
+    :param args: [Namespace] command line arguments from the user
+    :param profiler: [Profiler] to profile the different steps
+    :param location: [str] name of the cluster(s), for the titles
+    '''
+    # NB: User and Account can be missing when replaying logs pulled without --allUsers
+    for by, name in [('UserX', 'User'), ('AccountX', 'Account')]:
+        if by in GA.rollup:
+            with profiler.stage(f'summary_per_{name.lower()}', rows_in=len(GA.rollup)) as record:
+                summary = GA.calculate_usersSummary(by)
+                record['rows_out'] = len(summary)
+            print(f"\n        Carbon footprint per {name.lower()}:\n")
+            print(GA.formatText_usersSummary(summary, name))
+
+    if args.perUserReports & ('UserX' in GA.rollup):
+        with profiler.stage('perUserReports', rows_in=len(GA.rollup)):
+            for user, rollup_user in GA.rollup.groupby('UserX', observed=True):
+                print(GA.generate_report(rollup=rollup_user, title=f"Carbon footprint of {user} on {location}"))
+
+
+def main(args, cluster_info, fParams, profiler=None, scenarios=None, uncertainty=None):
     '''
     The main steps of what we're doing here
     :param args: [Namespace] command line arguments from the user
     :param cluster_info: [dict] info about the cluster, from cluster_info.yaml
     :param fParams: [dict] Fixed parameters, from fixed_parameters.yaml
+    :param profiler: [None or Profiler, default=None] to profile the different steps (with --profile)
+    :param scenarios: [None or list of dict, default=None] what-if scenarios to compare (with --scenarios), from `load_scenarios`
+    :param uncertainty: [None or dict, default=None] distributions of the uncertain parameters (with --uncertainty), from `load_uncertainty`
     '''
+    from GreenAlgorithms_export import export_jobs, export_timeline
+    from GreenAlgorithms_profiling import Profiler
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
     ### Check input
     validator = validity_checks()
     validator.validate_dates(args)
 
     ### Pull usage statistics from the workload manager
-    WM = WorkloadManager(args, cluster_info)
-    WM.pull_logs()
-
-    ### Log the output for debugging
-    scripts_dir = os.path.dirname(os.path.realpath(__file__))
-    if args.reportBug | args.reportBugHere:
-        log_name = str(datetime.datetime.now().timestamp()).replace(".", "_")
-
-        if args.reportBug:
-            log_path = os.path.join(scripts_dir, 'error_logs', f'sacctOutput_{log_name}.csv')
-            # Logging into a seperate dir to write-protect the main one (not in place for now)
-            # log_path = os.path.join(pathlib.Path(scripts_dir).parent.absolute(), 'GreenAlgorithms4HPC_errorLogs', f'sacctOutput_{log_name}.csv')
-        elif args.reportBugHere:
-            log_path = f'{os.getcwd()}/sacctOutput_{log_name}.csv'
-
-        os.makedirs(os.path.dirname(log_path), exist_ok=True) # Create error_logs dir if needed
-        with open(log_path, 'wb') as f:
-            f.write(WM.logs_raw)
-        print(f"SLURM statistics logged for debuging: {log_path}")
-
-    ### Turn usage logs into DataFrame
-    WM.convert2dataframe()
-    # Check if there are any jobs during the period
-    validator.check_empty_results(WM.logs_df)
-
-    ### Clean the usage logs
-    WM.clean_logs_df()
-    # Check if there are any jobs during the period from this directory and with these jobIDs
-    validator.check_empty_results(WM.df_agg, filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+    WM = pull_jobs(args, cluster_info, validator, profiler)
 
     ### Calculate energy usage and footprints
-    GA = GreenAlgorithms(df=WM.df_agg, args=args, cluster_info=cluster_info, fParams=fParams)
-    GA.calculate_footprint()
-    GA.generate_report()
+    with profiler.stage('calculate_footprint', rows_in=len(WM.df_agg)) as record:
+        GA = GreenAlgorithms(df=WM.df_agg, args=args, cluster_info=cluster_info, fParams=fParams)
+        GA.calculate_footprint()
+        record['rows_out'] = len(GA.rollup)
+
+    ### Largest sources of waste
+    leaderboard = None
+    if args.leaderboard is not None:
+        with profiler.stage('leaderboard', rows_in=len(GA.df)) as record:
+            leaderboard = GA.calculate_leaderboard(GA.df, args.leaderboard)
+            record['rows_out'] = len(leaderboard)
+
+    with profiler.stage('generate_report', rows_in=len(GA.rollup)) as record:
+        if args.allUsers:
+            GA.generate_report(title=f"Carbon footprint of all users on {cluster_info['cluster_name']}", leaderboard=leaderboard)
+        else:
+            GA.generate_report(leaderboard=leaderboard)
+    print(GA.report)
+
+    ### Breakdown per period
+    if args.breakdown is not None:
+        print_periodSummary(GA, args, profiler)
+
+    ### Uncertainty on the footprint
+    if uncertainty is not None:
+        print_uncertainty(GA, uncertainty, args, profiler)
+
+    ### What-if scenarios
+    if scenarios is not None:
+        print_scenarios(GA, scenarios, profiler)
+
+    ### Export the per-job results
+    if args.export != '':
+        with profiler.stage('export', rows_in=len(GA.df)):
+            export_jobs(GA.df, args.export)
+        print(f"Results per job exported to: {args.export}")
+
+    ### Export the power draw over time
+    if args.timeline != '':
+        with profiler.stage('timeline', rows_in=len(GA.df)) as record:
+            timeline = GA.calculate_timeline(GA.df, resolution=args.timelineResolution)
+            export_timeline(timeline, args.timeline)
+            record['rows_out'] = len(timeline)
+        print(f"Power draw per {args.timelineResolution} exported to: {args.timeline} (peak: {timeline.power.max():,.1f} kW)")
+
+    if args.memoryUsage:
+        for name, bytes_per_row in WM.memory_usage_per_job().items():
+            print(f"Memory usage of {name}: {bytes_per_row:,.0f} bytes per row")
+
+    ### Breakdown per user and account
+    if args.allUsers:
+        report_per_user(GA, args, profiler, cluster_info['cluster_name'])
+
+
+
+def footprint_cluster(args, cluster_info, fParams, validator, profiler):
+    '''
+    Pull the jobs of one cluster and calculate their footprint, with the coefficients of this cluster.
+    :param args: [Namespace] command line arguments from the user
+    :param cluster_info: [dict] info about the cluster, from its cluster_info.yaml
+    :param fParams: [dict] Fixed parameters, from fixed_parameters.yaml
+    :param validator: [validity_checks] raising `EmptyResults` if there are no jobs
+    :param profiler: [Profiler] to profile the different steps
+    :return: [(pd.DataFrame, None or pd.DataFrame)] the rollup and the leaderboard (with --leaderboard) of this cluster,
+    with the name of the cluster in `ClusterX`
+    '''
+    with profiler.stage(cluster_info['cluster_name']):
+        WM = pull_jobs(args, cluster_info, validator, profiler)
+        with profiler.stage('calculate_footprint', rows_in=len(WM.df_agg)) as record:
+            GA = GreenAlgorithms(df=WM.df_agg, args=args, cluster_info=cluster_info, fParams=fParams)
+            GA.calculate_footprint()
+            record['rows_out'] = len(GA.rollup)
+        # The top jobs of each cluster, the top ones of all the clusters are selected from them
+        leaderboard = None
+        if args.leaderboard is not None:
+            with profiler.stage('leaderboard', rows_in=len(GA.df)) as record:
+                leaderboard = GA.calculate_leaderboard(GA.df, args.leaderboard)
+                leaderboard.insert(2, 'ClusterX', cluster_info['cluster_name'])
+                record['rows_out'] = len(leaderboard)
+
+    # Partitions can have the same name on different clusters, but not the same coefficients
+    rollup = GA.rollup.assign(PartitionX=cluster_info['cluster_name'] + '/' + GA.rollup.PartitionX.astype(str))
+    rollup.insert(0, 'ClusterX', cluster_info['cluster_name'])
+    return rollup, leaderboard
+
+
+def main_clusters(args, L_cluster_info, fParams, profiler=None):
+    '''
+    Same as `main`, but on several clusters: their jobs are pulled concurrently, and reported on together.
+    :param args: [Namespace] command line arguments from the user
+    :param L_cluster_info: [list of dict] info about each cluster, from their cluster_info.yaml
+    :param fParams: [dict] Fixed parameters, from fixed_parameters.yaml
+    :param profiler: [None or Profiler, default=None] to profile the different steps (with --profile)
+    '''
+    from concurrent.futures import ThreadPoolExecutor
+    from GreenAlgorithms_profiling import Profiler
+
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
+    ### Check input
+    validator = validity_checks(exitIfEmpty=False)
+    validator.validate_dates(args)
+
+    ### Pull the jobs of each cluster and calculate their footprint, all clusters at the same time
+    with ThreadPoolExecutor(max_workers=len(L_cluster_info)) as executor:
+        futures = [
+            executor.submit(footprint_cluster, args, cluster_info, fParams, validator, profiler)
+            for cluster_info in L_cluster_info
+        ]
+        L_rollups = []
+        L_leaderboards = []
+        for cluster_info, future in zip(L_cluster_info, futures):
+            try:
+                rollup, leaderboard = future.result()
+                L_rollups.append(rollup)
+                L_leaderboards.append(leaderboard)
+            except EmptyResults as e:
+                print(f"{cluster_info['cluster_name']}: {e}")
+
+    # Stop if there are no jobs on any of the clusters
+    validator.exitIfEmpty = True
+    if len(L_rollups) == 0:
+        validator.check_empty_results(L_rollups, filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+
+    ### Combine the clusters, with the partitions of each one
+    clusters_info = {
+        'cluster_name': ', '.join([cluster_info['cluster_name'] for cluster_info in L_cluster_info]),
+        'partitions': {
+            f"{cluster_info['cluster_name']}/{partition}": partition_info
+            for cluster_info in L_cluster_info
+            for partition, partition_info in cluster_info['partitions'].items()
+        },
+    }
+    GA = GreenAlgorithms(df=None, args=args, cluster_info=clusters_info, fParams=fParams)
+    GA.rollup = pd.concat(L_rollups, ignore_index=True)
+    leaderboard = None
+    if args.leaderboard is not None:
+        leaderboard = GA.select_leaderboard(pd.concat(L_leaderboards, ignore_index=True), args.leaderboard)
+
+    with profiler.stage('generate_report', rows_in=len(GA.rollup)):
+        if args.allUsers:
+            GA.generate_report(title=f"Carbon footprint of all users on {len(L_cluster_info)} clusters", leaderboard=leaderboard)
+        else:
+            GA.generate_report(title=f"Your carbon footprint on {len(L_cluster_info)} clusters", leaderboard=leaderboard)
     print(GA.report)
 
+    ### Breakdown per period
+    if args.breakdown is not None:
+        print_periodSummary(GA, args, profiler)
+
+    ### Breakdown per cluster
+    with profiler.stage('summary_per_cluster', rows_in=len(GA.rollup)) as record:
+        summary = GA.calculate_usersSummary('ClusterX')
+        record['rows_out'] = len(summary)
+    print(f"\n        Carbon footprint per cluster:\n")
+    print(GA.formatText_usersSummary(summary, 'Cluster'))
+
+    ### Breakdown per user and account
+    if args.allUsers:
+        report_per_user(GA, args, profiler, clusters_info['cluster_name'])
+
+
+def generate_user_report(df_agg, args, cluster_info, fParams):
+    '''
+    Report of a user, from their jobs already cleaned and aggregated (used by the report server).
+    :param df_agg: [pd.DataFrame] finished jobs, in the same format as `WorkloadManager.df_agg`
+    :param args: [Namespace] command line arguments from the user
+    :param cluster_info: [dict] info about the cluster, from cluster_info.yaml
+    :param fParams: [dict] Fixed parameters, from fixed_parameters.yaml
+    :return: [str] the report
+    '''
+    GA = GreenAlgorithms(df=df_agg, args=args, cluster_info=cluster_info, fParams=fParams)
+    GA.calculate_footprint()
+    return GA.generate_report()
+
+
+def serve(args, cluster_info, fParams):
+    '''
+    Run the report server (with --serve), answering the requests of the users until stopped.
+    :param args: [Namespace] command line arguments used to start the server
+    :param cluster_info: [dict] info about the cluster, from cluster_info.yaml
+    :param fParams: [dict] Fixed parameters, from fixed_parameters.yaml
+    '''
+    from GreenAlgorithms_server import ReportServer, default_socket_path
+
+    validity_checks().validate_dates(args)
+    server = ReportServer(
+        args.serve or default_socket_path(cluster_info),
+        args,
+        cluster_info,
+        fParams,
+        report_function=generate_user_report,
+        refreshMinutes=args.refreshMinutes
+    )
+    server.serve()
 
 
 if __name__ == "__main__":
-    # TODO: add unit tests that can run automatically
     ### Load cluster specific info
-    with open("cluster_info.yaml", "r") as stream:
-        try:
-            cluster_info = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-
-    ### Load fixed parameters
-    with open("fixed_parameters.yaml", "r") as stream:
-        try:
-            fParams = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
+    cluster_info = load_yaml("cluster_info.yaml")
 
     ### Create argument parser
     parser = argparse.ArgumentParser(description=f'Calculate your carbon footprint on {cluster_info["cluster_name"]}.')
 
+    ### Options that can't be used together: option -> options it can't be used with.
+    # Used both to check the arguments and in the help (without the options for debugging, which are not in the help).
+    incompatible_options = {
+        '--stream': ['--shardDays', '--reportBug', '--reportBugHere'],
+        '--workers': ['--stream', '--useCache', '--slurmDB', '--clusters'],
+        '--useCache': ['--stream', '--allUsers', '--reportBug', '--reportBugHere', '--useLoggedOutput'],
+        '--slurmDB': ['--stream', '--shardDays', '--useCache', '--reportBug', '--reportBugHere', '--useLoggedOutput'],
+        '--clusters': ['--export', '--scenarios', '--uncertainty', '--timeline', '--memoryUsage', '--reportBug', '--reportBugHere',
+                       '--useLoggedOutput', '--useOtherClusterInfo'],
+        '--serve': ['--stream', '--useCache', '--allUsers', '--breakdown', '--leaderboard', '--scenarios', '--uncertainty', '--export',
+                    '--timeline', '--memoryUsage', '--reportBug', '--reportBugHere', '--slurmDB', '--clusters', '--profile'],
+    }
+    debugging_options = ['--useLoggedOutput', '--useOtherClusterInfo']
+
+    def help_incompatible(option):
+        return f"Not compatible with {format_options([x for x in incompatible_options[option] if x not in debugging_options])}."
+
     default_endDay = datetime.date.today().strftime("%Y-%m-%d")  # today
     default_startDay = f"{datetime.date.today().year}-01-01" # start of the year
 
@@ -359,20 +1564,121 @@ if __name__ == "__main__":
         Note that this will write out some basic information about your jobs, such as runtime, number of cores and memory usage.')
     parser.add_argument('--reportBugHere', action='store_true',
                         help='Similar to --reportBug, but exports the output to your home folder')
+    parser.add_argument('--stream', action='store_true',
+                        help='Process the usage logs in chunks as they come out of the workload manager, to limit memory usage on long periods. \
+        ' + help_incompatible('--stream'))
+    parser.add_argument('--chunkSize', type=int, default=100000,
+                        help='Number of rows of usage logs processed at once with --stream (default: 100000)')
+    parser.add_argument('--shardDays', type=int, default=0,
+                        help='Split the period into windows of this many days, and pull the usage logs of the different windows in parallel \
+        (default: 0, i.e. no splitting). Not compatible with --stream.')
+    parser.add_argument('--shardWorkers', type=int, default=4,
+                        help='Maximum number of windows pulled at the same time with --shardDays (default: 4)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to clean and aggregate the usage logs (default: 1). ' + help_incompatible('--workers'))
+    parser.add_argument('--useCache', action='store_true',
+                        help='Keep the finished jobs in a local cache (in ~/.cache), so that only new days are pulled next time. \
+        The jobs are selected on their submit time + wallclock time rather than their end time, \
+        so the jobs that waited in the queue just before the start of the period can be missed. ' + help_incompatible('--useCache'))
+    parser.add_argument('--cacheMaxAgeDays', type=int, default=730,
+                        help='Jobs submitted more than this many days ago are removed from the cache (default: 730)')
+    parser.add_argument('--cacheMaxJobs', type=int, default=2000000,
+                        help='Maximum number of jobs kept in the cache, the oldest ones are removed first (default: 2000000)')
+    parser.add_argument('--allUsers', action='store_true',
+                        help='Report on the jobs of all the users (requires the corresponding permissions on the workload manager), \
+        with a breakdown per user and per account. Not compatible with --useCache.')
+    parser.add_argument('--perUserReports', action='store_true',
+                        help='With --allUsers, also print the full report of each user.')
+    parser.add_argument('--breakdown', type=str, default=None, choices=['day', 'week', 'month'],
+                        help='Also show the footprint, energy, failed jobs and memory waste per day, week or month (of submission of the jobs).')
+    parser.add_argument('--leaderboard', type=int, nargs='?', const=10, default=None,
+                        help='Also show the jobs, job arrays, job names and working directories wasting the most carbon, \
+        with memory overallocation and with failed jobs (top 10, or the number given).')
+    parser.add_argument('--uncertainty', type=str, default='',
+                        help='Also show confidence intervals on the footprint and energy, from the uncertainty on the PUE, \
+        carbon intensity, TDP and power of the memory given in this file (see uncertainty.yaml). \
+        As for the other files, a relative path is from the installation directory, where cluster_info.yaml is.')
+    parser.add_argument('--uncertaintySamples', type=int, default=10000,
+                        help='Number of samples of the parameters drawn with --uncertainty (default: 10000)')
+    parser.add_argument('--scenarios', type=str, default='',
+                        help='Also compare the footprint of the same jobs under the scenarios in this file (e.g. another PUE, \
+        carbon intensity, memory granularity or TDP for some partitions, see scenarios.yaml). \
+        As for the other files, a relative path is from the installation directory, where cluster_info.yaml is.')
+    parser.add_argument('--export', type=str, default='',
+                        help='Export the results per job to this file, as Parquet (.parquet), Arrow (.arrow or .feather) \
+        or CSV (.csv or .csv.gz). Parquet and Arrow require pyarrow.')
+    parser.add_argument('--timeline', type=str, default='',
+                        help='Export the estimated power draw of the jobs over time (CPUs, GPUs, memory and data centre overheads, in kW) to this file, \
+        as Parquet (.parquet), Arrow (.arrow or .feather) or CSV (.csv or .csv.gz). Use with --allUsers for the whole cluster.')
+    parser.add_argument('--timelineResolution', type=str, default='hour', choices=['minute', 'hour'],
+                        help='Resolution of the power draw exported with --timeline (default: hour)')
+    parser.add_argument('--memoryUsage', action='store_true',
+                        help='Print the memory used per job by the usage logs.')
+    parser.add_argument('--slurmDB', type=str, nargs='?', const='', default=None,
+                        help='Read the jobs straight from the SLURM accounting database rather than with sacct \
+        (settings in `slurmdb` in cluster_info.yaml, requires pymysql). If a file is given, it is read as a SQLite copy of the database instead. \
+        ' + help_incompatible('--slurmDB'))
+    parser.add_argument('--clusters', type=str, nargs='+', default=None,
+                        help='Report on several clusters at once, each described by its own cluster_info file (e.g. clustersData/clusterA.yaml), \
+        with a breakdown per cluster. The usage logs of the different clusters are pulled at the same time. ' + help_incompatible('--clusters'))
+    parser.add_argument('--serve', type=str, nargs='?', const='', default=None,
+                        help='Run as a report server: keep the jobs of all the users from the last --cacheMaxAgeDays days in memory, \
+        refresh them every --refreshMinutes minutes, and answer the requests of the users on a Unix socket \
+        (by default `server_socket` in cluster_info.yaml, or in /run/GreenAlgorithms4HPC/, which must not be writable by the users). \
+        The script then gets the reports from the server when it is running, if the server is run by root or `server_user` in cluster_info.yaml. \
+        As with --useCache, the server selects the jobs on their submit time + wallclock time, so the jobs that waited in the queue \
+        just before the start of the period can be missed. Requires the permissions to see the jobs of all the users. ' + help_incompatible('--serve'))
+    parser.add_argument('--refreshMinutes', type=float, default=15,
+                        help='Time between two refreshes of the jobs with --serve, in minutes (default: 15)')
+    parser.add_argument('--noServer', action='store_true',
+                        help="Calculate the report without the report server, even if it is running (e.g. to select the jobs as sacct does).")
+    parser.add_argument('--profile', type=str, nargs='?', const='', default=None,
+                        help='Print the wall time, CPU time, increase in peak memory and number of rows of each step, as JSON. \
+        If a file is given, the JSON is appended to it instead (one line per run).')
     # Arguments for debugging
     parser.add_argument('--useLoggedOutput', type=str, default='', help=argparse.SUPPRESS)
     parser.add_argument('--useOtherClusterInfo', type=str, default='', help=argparse.SUPPRESS)
 
     args = parser.parse_args()
 
+    def is_used(option):
+        # An option is used if it isn't left to its default value
+        dest = option.lstrip('-')
+        return getattr(args, dest) != parser.get_default(dest)
+
+    for option, L_incompatible in incompatible_options.items():
+        if is_used(option) and any(is_used(x) for x in L_incompatible):
+            parser.error(f"{option} can't be used with {format_options(L_incompatible, 'or')}.")
+    if args.uncertaintySamples < 1:
+        parser.error("--uncertaintySamples needs a positive number of samples.")
+    if (args.leaderboard is not None) and (args.leaderboard < 1):
+        parser.error("--leaderboard needs a positive number of jobs.")
+    if args.perUserReports & (not args.allUsers):
+        parser.error("--perUserReports can only be used with --allUsers.")
+
+    ### Check the dates before loading anything else
+    validity_checks().validate_dates(args)
+
+    ### Load fixed parameters
+    fParams = load_yaml("fixed_parameters.yaml")
+
     # For debuging, load custom cluster info
     if args.useOtherClusterInfo != '':
         print(f"Overrriding cluster_info with: {args.useOtherClusterInfo}")
-        with open(os.path.join('clustersData', args.useOtherClusterInfo), "r") as stream:
-            try:
-                cluster_info = yaml.safe_load(stream)
-            except yaml.YAMLError as exc:
-                print(exc)
+        cluster_info = load_yaml(os.path.join('clustersData', args.useOtherClusterInfo))
+
+    ### Load the what-if scenarios and the uncertainty, so that the script stops before pulling the jobs if they are not valid
+    scenarios, uncertainty = None, None
+    if args.scenarios != '':
+        try:
+            scenarios = load_scenarios(args.scenarios, cluster_info)
+        except (OSError, ValueError) as e:
+            parser.error(f"--scenarios: {e}")
+    if args.uncertainty != '':
+        try:
+            uncertainty = load_uncertainty(args.uncertainty)
+        except (OSError, ValueError) as e:
+            parser.error(f"--uncertainty: {e}")
 
     ### Set the WD to filter on, if needed
     if args.filterCWD:
@@ -380,6 +1686,54 @@ if __name__ == "__main__":
     else:
         args.filterWD = None
 
-    ### Run main
-    main(args, cluster_info, fParams)
+    ### Run the report server
+    if args.serve is not None:
+        serve(args, cluster_info, fParams)
+        sys.exit()
+
+    ### Get the report from the report server if it's running, to avoid pulling and processing the jobs again.
+    # The server only has the basic report, other outputs are calculated here.
+    if not any(is_used(x) for x in ['--noServer'] + incompatible_options['--serve'] + debugging_options):
+        from GreenAlgorithms_server import request_report, default_socket_path, trusted_server_uids
+        response = request_report(default_socket_path(cluster_info), args, trusted_server_uids(cluster_info))
+        if (response is not None) and (response['status'] == 'ok'):
+            print(response['output'])
+            sys.exit()
+        elif (response is not None) and (response['status'] == 'empty'):
+            validator = validity_checks()
+            validator.validate_dates(args)
+            validator.check_empty_results([], filterWD=args.filterWD, filterJobIDs=args.filterJobIDs)
+        # Otherwise (no server, or period not covered by the server), the report is calculated here
+
+    ### Load the cluster info of each cluster, if needed
+    if args.clusters is not None:
+        L_cluster_info = [load_yaml(path) for path in args.clusters]
+        cluster_names = [x['cluster_name'] for x in L_cluster_info]
+        if len(set(cluster_names)) < len(cluster_names):
+            parser.error(f"--clusters needs clusters with different names, but got: {', '.join(cluster_names)}")
 
+    ### Run main
+    # A failed sacct call stops the script with its error (the main functions import this module anyway)
+    from GreenAlgorithms_workloadManager import SacctError
+    try:
+        if args.profile is None:
+            if args.clusters is None:
+                main(args, cluster_info, fParams, scenarios=scenarios, uncertainty=uncertainty)
+            else:
+                main_clusters(args, L_cluster_info, fParams)
+        else:
+            from GreenAlgorithms_profiling import Profiler
+            profiler = Profiler()
+            try:
+                if args.clusters is None:
+                    main(args, cluster_info, fParams, profiler=profiler, scenarios=scenarios, uncertainty=uncertainty)
+                else:
+                    main_clusters(args, L_cluster_info, fParams, profiler=profiler)
+            finally:
+                # Also written when stopping early, e.g. if there are no jobs
+                if args.clusters is None:
+                    profiler.write(args.profile, cluster_name=cluster_info['cluster_name'], args=vars(args))
+                else:
+                    profiler.write(args.profile, cluster_name=cluster_names, args=vars(args))
+    except SacctError as e:
+        sys.exit(str(e))
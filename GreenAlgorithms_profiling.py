@@ -0,0 +1,111 @@
+## ~~~ TO NOT EDIT ~~~
+##
+## Profiling of the different stages, common to all clusters.
+##
+
+import os
+import sys
+import json
+import time
+import datetime
+import threading
+import contextlib
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the peak memory is then not recorded
+    resource = None
+
+
+def get_peak_rss_MB():
+    '''
+    :return: [float or None] peak resident memory of the process so far, in MB.
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux, in bytes on macOS
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+class Profiler():
+    '''
+    Record the wall time, CPU time, increase of the peak memory and number of rows in/out of each stage.
+    Stages can be nested (their name is then prefixed with the name of the parent stage),
+    and a stage run several times (e.g. once per chunk) is recorded once, with its total time.
+    When disabled, stages don't record anything.
+    Stages can be profiled from different threads, each with its own nesting
+    (NB: the CPU time and peak memory are those of the whole process).
+    '''
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.records = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        '''
+        Profile a stage, e.g. `with profiler.stage('clean_logs_df', rows_in=len(df)) as record: ...`
+        The number of rows out can be set in the stage with `record['rows_out'] = ...`,
+        otherwise it's the same as the number of rows in (e.g. for stages adding a column).
+        :param name: [str] name of the stage
+        :param rows_in: [None or int, default=None] number of rows in input
+        '''
+        record = {'rows_out': None}
+        if not self.enabled:
+            yield record
+            return
+
+        current_stages = self.local.__dict__.setdefault('current_stages', [])
+        current_stages.append(name)
+        full_name = '/'.join(current_stages)
+        wall, cpu, peak_rss = time.perf_counter(), time.process_time(), get_peak_rss_MB()
+        try:
+            yield record
+        finally:
+            current_stages.pop()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            new_peak_rss = get_peak_rss_MB()
+            rows_out = record['rows_out'] if record['rows_out'] is not None else rows_in
+            with self.lock:
+                total = self.records.setdefault(full_name, {
+                    'stage': full_name, 'calls': 0, 'wall_s': 0., 'cpu_s': 0., 'peak_rss_delta_MB': None,
+                    'peak_rss_MB': None, 'rows_in': None, 'rows_out': None,
+                })
+                total['calls'] += 1
+                total['wall_s'] += wall
+                total['cpu_s'] += cpu
+                if new_peak_rss is not None:
+                    total['peak_rss_delta_MB'] = (total['peak_rss_delta_MB'] or 0.) + new_peak_rss - peak_rss
+                    total['peak_rss_MB'] = new_peak_rss
+                for x, n_rows in [('rows_in', rows_in), ('rows_out', rows_out)]:
+                    if n_rows is not None:
+                        total[x] = (total[x] or 0) + int(n_rows)
+
+    def to_json(self, **metadata):
+        '''
+        :param metadata: information about the run to add to the output (e.g. the arguments)
+        :return: [str] the records, as one line of JSON
+        '''
+        return json.dumps({
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            **metadata,
+            'stages': list(self.records.values()),
+        })
+
+    def write(self, path='', **metadata):
+        '''
+        Print the records as JSON, or append them to a file (one line per run).
+        :param path: [str, default=''] file to append to, printed if empty
+        :param metadata: information about the run to add to the output
+        '''
+        output = self.to_json(**metadata)
+        if path == '':
+            print(output)
+        else:
+            with open(path, 'a') as f:
+                f.write(output + '\n')
@@ -0,0 +1,296 @@
+## ~~~ TO NOT EDIT ~~~
+##
+## Report server, keeping the jobs of all the users in memory, common to all clusters.
+##
+
+import os
+import re
+import sys
+import pwd
+import copy
+import json
+import time
+import socket
+import signal
+import struct
+import datetime
+import threading
+import socketserver
+
+# NB: only the standard library is imported here, so that the client (`request_report`) starts quickly.
+# pandas is imported by the server itself, in `ReportServer.__init__`.
+
+# Command line arguments sent to the server with each request
+request_args = ['startDay', 'endDay', 'filterWD', 'filterJobIDs']
+
+# Maximum size of a request (one line of JSON), in bytes, so that a client can't make the server read without limit
+max_request_size = 65536
+
+
+# Default directory of the sockets of the report servers: not writable by the users (unlike /tmp),
+# so that they can't start a fake server on the socket that the others connect to.
+default_socket_dir = '/run/GreenAlgorithms4HPC'
+
+
+def default_socket_path(cluster_info):
+    '''
+    Location of the socket of the report server, `server_socket` in cluster_info.yaml if set.
+    :param cluster_info: [dict]
+    :return: [str] path to the Unix socket
+    '''
+    if 'server_socket' in cluster_info:
+        return cluster_info['server_socket']
+    cluster_slug = re.sub(r'[^A-Za-z0-9_-]+', '_', str(cluster_info['cluster_name']))
+    return os.path.join(default_socket_dir, f'{cluster_slug}.sock')
+
+
+def trusted_server_uids(cluster_info):
+    '''
+    Users whose report server is trusted: root, the user running the script, and `server_user` in cluster_info.yaml if set.
+    :param cluster_info: [dict]
+    :return: [set] user IDs
+    '''
+    uids = {0, os.getuid()}
+    if 'server_user' in cluster_info:
+        uids.add(pwd.getpwnam(cluster_info['server_user']).pw_uid)
+    return uids
+
+
+def peer_uid(sock):
+    '''
+    User ID of the process at the other end of a Unix socket.
+    :param sock: [socket.socket] connected Unix socket
+    :return: [int]
+    '''
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _, uid, _ = struct.unpack('3i', creds)
+    return uid
+
+
+def request_report(socket_path, args, trusted_uids, timeout=60):
+    '''
+    Ask the report server for the report of the user running this script.
+    :param socket_path: [str] path to the Unix socket of the server
+    :param args: [Namespace] command line arguments from the user
+    :param trusted_uids: [set] user IDs allowed to run the server (see `trusted_server_uids`)
+    :param timeout: [float, default=60] in seconds
+    :return: [None or dict] None if the server isn't running (or isn't trusted), otherwise its response, with `status` and `output`
+    '''
+    request = {x: getattr(args, x) for x in request_args}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            # The reply is only used if the server is run by a trusted user
+            uid = peer_uid(sock)
+            if uid not in trusted_uids:
+                print(f"WARNING: the report server on {socket_path} is run by an untrusted user (uid {uid}), it is ignored.", file=sys.stderr)
+                return None
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            L_chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if chunk == b'':
+                    break
+                L_chunks.append(chunk)
+        return json.loads(b''.join(L_chunks))
+    except (OSError, ValueError):
+        # No server (or not responding properly): the report is calculated without it
+        return None
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Answer one request: one line of JSON in, one JSON object out.
+    '''
+
+    def handle(self):
+        # The user is identified by the credentials of the socket, so that users can only see their own jobs
+        uid = peer_uid(self.request)
+        try:
+            line = self.rfile.readline(max_request_size)
+            if not line.endswith(b'\n'):
+                raise ValueError(f"The request should be one line of JSON of at most {max_request_size:,} bytes")
+            request = json.loads(line)
+            response = self.server.report_server.answer(request, uid)
+        except Exception as e:
+            self.server.report_server.log(f"Error with a request from uid {uid}: {e!r}")
+            response = {'status': 'error', 'output': str(e)}
+        self.wfile.write(json.dumps(response).encode())
+
+
+class ReportServer():
+    '''
+    Keep the jobs of all the users in memory (over the last `args.cacheMaxAgeDays` days), refresh them from the
+    workload manager every `refreshMinutes` minutes (only pulling the days since the last refresh),
+    and answer the report requests of the users on a Unix socket.
+    '''
+
+    def __init__(self, socket_path, args, cluster_info, fParams, report_function, refreshMinutes=15):
+        '''
+        :param socket_path: [str] path to the Unix socket to listen on
+        :param args: [Namespace] command line arguments used to start the server
+        :param cluster_info: [dict] info about the cluster, from cluster_info.yaml
+        :param fParams: [dict] Fixed parameters, from fixed_parameters.yaml
+        :param report_function: [function] (df_agg, args, cluster_info, fParams) -> report, as a string
+        :param refreshMinutes: [float, default=15] time between two refreshes of the jobs
+        '''
+        import pandas as pd
+        from GreenAlgorithms_workloadManager import WorkloadManager
+
+        self.pd = pd
+        self.socket_path = socket_path
+        self.cluster_info = cluster_info
+        self.fParams = fParams
+        self.report_function = report_function
+        self.refreshMinutes = refreshMinutes
+
+        # The jobs of all the users are pulled, without any filter
+        self.args = copy.copy(args)
+        self.args.allUsers = True
+        self.args.filterWD = None
+        self.args.filterJobIDs = 'all'
+        self.WM = WorkloadManager(self.args, cluster_info)
+
+        self.lock = threading.Lock()
+        self.df_agg_0 = None  # All the jobs pulled, including the unfinished ones
+        self.jobs_per_user = {}  # Finished jobs of each user, as returned by `WorkloadManager.process_df_agg`
+        self.coverageStart = None  # YYYY-MM-DD, first day that can be reported on
+        self.lastRefreshDay = None  # YYYY-MM-DD
+
+    def log(self, message):
+        print(f"[{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+    def refresh(self):
+        '''
+        Pull the jobs since the last refresh (or over the last `args.cacheMaxAgeDays` days the first time),
+        replace the previous version of the jobs pulled again, and evict the jobs finished before that period.
+        '''
+        wall = time.perf_counter()
+        today = datetime.date.today()
+        tomorrow = (today + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+        coverageStart = (today - datetime.timedelta(days=self.args.cacheMaxAgeDays)).strftime('%Y-%m-%d')
+
+        # sacct returns all the jobs running during the period, so this includes the jobs unfinished last time
+        # (the jobs finished since then were still running on the day of the last refresh).
+        startDay = coverageStart if self.lastRefreshDay is None else max(self.lastRefreshDay, coverageStart)
+        if self.args.shardDays > 0:
+            L_windows = self.WM.split_period(self.args.shardDays, startDay, tomorrow)
+        else:
+            L_windows = [(startDay, tomorrow)]
+        new_agg = self.WM.aggregate_raw_logs(self.WM.pull_logs_sharded(L_windows))
+
+        L_agg = [df for df in [self.df_agg_0, new_agg] if (df is not None) and (len(df) > 0)]
+        if len(L_agg) == 0:
+            df_agg_0 = self.pd.DataFrame()
+        else:
+            df_agg_0 = self.pd.concat(L_agg)
+            # The latest version of the jobs pulled again is kept
+            df_agg_0 = df_agg_0.loc[~df_agg_0.index.duplicated(keep='last')]
+            # Jobs finished before the period are evicted
+            end = df_agg_0.SubmitDatetimeX + df_agg_0.WallclockTimeX
+            df_agg_0 = df_agg_0.loc[(end >= self.pd.Timestamp(coverageStart)) | (df_agg_0.StateX == -1)]
+
+        jobs_per_user = {}
+        if len(df_agg_0) > 0:
+            self.WM.df_agg_0 = df_agg_0
+            self.WM.process_df_agg()
+            df_agg_0 = self.WM.df_agg_0
+            jobs_per_user = {user: df for user, df in self.WM.df_agg.groupby('UserX', observed=True)}
+
+        with self.lock:
+            self.df_agg_0 = df_agg_0
+            self.jobs_per_user = jobs_per_user
+            self.coverageStart = coverageStart
+            self.lastRefreshDay = today.strftime('%Y-%m-%d')
+        self.log(
+            f"Refreshed from {startDay}: {0 if new_agg is None else len(new_agg):,} jobs pulled, {len(df_agg_0):,} jobs "
+            f"of {len(jobs_per_user):,} users in memory ({time.perf_counter() - wall:.1f}s)"
+        )
+
+    def refresh_periodically(self):
+        '''
+        Refresh the jobs every `refreshMinutes` minutes (the previous jobs are kept if a refresh fails).
+        '''
+        while True:
+            time.sleep(self.refreshMinutes * 60)
+            try:
+                self.refresh()
+            except Exception as e:
+                self.log(f"Refresh failed: {e!r}")
+
+    def answer(self, request, uid):
+        '''
+        Generate the report requested by a user, on their own jobs.
+        :param request: [dict] the arguments in `request_args`
+        :param uid: [int] user ID of the user making the request
+        :return: [dict] `status` ('ok', 'empty' if there are no jobs, or 'unavailable' if the period isn't covered)
+        and `output` (the report)
+        '''
+        user = pwd.getpwuid(uid).pw_name
+        args = copy.copy(self.args)
+        args.allUsers = False
+        for x in request_args:
+            setattr(args, x, request[x])
+        for x in [args.startDay, args.endDay]:
+            datetime.datetime.strptime(x, '%Y-%m-%d')
+
+        with self.lock:
+            jobs_user = self.jobs_per_user.get(user)
+            coverageStart = self.coverageStart
+        if (coverageStart is None) or (args.startDay < coverageStart):
+            return {'status': 'unavailable', 'output': f"Only the jobs from {coverageStart} are kept in memory."}
+        if jobs_user is None:
+            return {'status': 'empty', 'output': ''}
+
+        # NB: same selection of the jobs running during the period as with the local cache (`JobsCache.load`)
+        df_agg = jobs_user.loc[
+            (jobs_user.SubmitDatetimeX <= self.pd.Timestamp(args.endDay))
+            & (jobs_user.SubmitDatetimeX + jobs_user.WallclockTimeX >= self.pd.Timestamp(args.startDay))
+        ]
+        if args.filterWD is not None:
+            df_agg = df_agg.loc[df_agg.WorkingDirX == args.filterWD]
+        if args.filterJobIDs != 'all':
+            df_agg = df_agg.loc[df_agg.parentJobID.isin(args.filterJobIDs.split(','))]
+        if len(df_agg) == 0:
+            return {'status': 'empty', 'output': ''}
+
+        report = self.report_function(df_agg.copy(), args, self.cluster_info, self.fParams)
+        self.log(f"Report for {user} ({len(df_agg):,} jobs)")
+        return {'status': 'ok', 'output': report}
+
+    def serve(self):
+        '''
+        Pull the jobs, then answer the requests until stopped, while refreshing the jobs in the background.
+        '''
+        # The directory of the socket must not be writable by the users, otherwise they could replace the socket
+        socket_dir = os.path.dirname(os.path.abspath(self.socket_path))
+        os.makedirs(socket_dir, mode=0o755, exist_ok=True)
+        if os.stat(socket_dir).st_mode & 0o022:
+            sys.exit(f"{socket_dir} is writable by other users, the socket of the report server can't be put there.")
+
+        # Only one server per socket, a socket left by a server that has stopped is removed
+        if os.path.exists(self.socket_path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                try:
+                    sock.connect(self.socket_path)
+                    sys.exit(f"A report server is already running on {self.socket_path}")
+                except ConnectionRefusedError:
+                    os.remove(self.socket_path)
+
+        self.refresh()
+
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, RequestHandler)
+        server.daemon_threads = True
+        server.report_server = self
+        # Any user can ask for their own report (the users can't create or replace the socket, see above)
+        os.chmod(self.socket_path, 0o666)
+        threading.Thread(target=self.refresh_periodically, daemon=True).start()
+        self.log(f"Listening on {self.socket_path}")
+        # So that the socket is removed when the server is stopped with `kill`
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(self.socket_path)
@@ -0,0 +1,291 @@
+## ~~~ TO BE EDITED TO BE TAILORED TO THE WORKLOAD MANAGER ~~~
+##
+## Alternative to pulling the usage logs with sacct: the jobs are read straight from the SLURM accounting database.
+## This is designed for the schema of SLURM >= 18.08 (memory usage in tres_usage_in_max).
+##
+
+import os
+import re
+import time
+import datetime
+import numpy as np
+import pandas as pd
+from GreenAlgorithms_workloadManager import WorkloadManager
+
+
+class SlurmDBWorkloadManager(WorkloadManager):
+    '''
+    Same as `WorkloadManager`, but the jobs and job steps are queried from the tables of the SLURM accounting database
+    (<cluster>_job_table, <cluster>_step_table and <cluster>_assoc_table) rather than parsed from the output of sacct.
+    The fields come back typed, so the usage logs are built with the cleaned columns (ending with X) straight away.
+    The database is either a MySQL server (settings in `slurmdb` in cluster_info.yaml, requires pymysql),
+    or a local SQLite file with the same tables (e.g. a stand-in for testing, see benchmarks/generate_slurmdb.py).
+    '''
+
+    # Values used by SLURM in the accounting database
+    NO_VAL = 4294967294  # id_array_task of the jobs that are not part of an array
+    MEM_MASK = 9223372036854775807  # mem_req without the MEM_PER_CPU flag (highest bit)
+    JOB_STATE_BASE = 0xff
+    JOB_REQUEUE = 0x400
+    job_states = [
+        'PENDING', 'RUNNING', 'SUSPENDED', 'COMPLETED', 'CANCELLED', 'FAILED',
+        'TIMEOUT', 'NODE_FAIL', 'PREEMPTED', 'BOOT_FAIL', 'DEADLINE', 'OUT_OF_MEMORY'
+    ]
+
+    def connect(self):
+        '''
+        Open a connection to the accounting database.
+        :return: [DB-API connection, str] the connection, and the placeholder used for the parameters of the queries
+        '''
+        if self.args.slurmDB != '':
+            import sqlite3
+            if not os.path.exists(self.args.slurmDB):
+                raise FileNotFoundError(f"SLURM database not found: {self.args.slurmDB}")
+            return sqlite3.connect(f"file:{self.args.slurmDB}?mode=ro", uri=True), '?'
+
+        assert 'slurmdb' in self.cluster_info, "The settings of the SLURM database need to be in `slurmdb` in cluster_info.yaml"
+        settings = self.cluster_info['slurmdb']
+        try:
+            import pymysql
+        except ImportError:
+            raise ImportError("pymysql is needed to read the SLURM accounting database, install it or use sacct instead.")
+        password = None
+        if 'password_file' in settings:
+            with open(os.path.expanduser(settings['password_file']), 'r') as f:
+                password = f.read().strip()
+        conn = pymysql.connect(
+            host=settings.get('host', 'localhost'),
+            port=int(settings.get('port', 3306)),
+            user=settings.get('user', 'slurm'),
+            password=password,
+            database=settings.get('database', 'slurm_acct_db'),
+        )
+        return conn, '%s'
+
+    def get_cluster_name(self, conn):
+        '''
+        Name of the cluster in the accounting database, i.e. the prefix of the tables.
+        It's read from `slurmdb` in cluster_info.yaml, or found from the tables if there is only one cluster (SQLite only).
+        :param conn: [DB-API connection]
+        :return: [str]
+        '''
+        cluster = self.cluster_info.get('slurmdb', {}).get('cluster')
+        if cluster is None:
+            assert self.args.slurmDB != '', "The name of the cluster needs to be in `slurmdb` in cluster_info.yaml"
+            tables = [x for x, in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            L_clusters = [x[:-len('_job_table')] for x in tables if x.endswith('_job_table')]
+            assert len(L_clusters) == 1, f"Specify the cluster in `slurmdb` in cluster_info.yaml, the database has: {L_clusters}"
+            cluster = L_clusters[0]
+        # The name is used in the queries, so it can't be passed as a parameter
+        assert re.fullmatch(r'[A-Za-z0-9_]+', cluster), f"Unexpected cluster name: {cluster}"
+        return cluster
+
+    def get_jobs_condition(self, placeholder):
+        '''
+        Conditions on the jobs (table aliased as j) to pull, as with sacct: jobs submitted before the end of the period
+        and not finished before its start, from the current user only (unless --allUsers).
+        The filters on working directory and job IDs are applied here as well.
+        :param placeholder: [str] placeholder for the parameters, e.g. '?'
+        :return: [str, list] the conditions, and their parameters
+        '''
+        # Same as sacct, i.e. midnight (local time) at the start of these days
+        start = int(time.mktime(datetime.datetime.strptime(self.args.startDay, '%Y-%m-%d').timetuple()))
+        end = int(time.mktime(datetime.datetime.strptime(self.args.endDay, '%Y-%m-%d').timetuple()))
+
+        conditions = [
+            "j.deleted = 0",
+            f"j.time_submit <= {placeholder}",
+            f"(j.time_end >= {placeholder} OR j.time_end = 0)",
+        ]
+        params = [end, start]
+        if not self.args.allUsers:
+            conditions.append(f"j.id_user = {placeholder}")
+            params.append(os.getuid())
+        if self.args.filterWD is not None:
+            conditions.append(f"j.work_dir = {placeholder}")
+            params.append(self.args.filterWD)
+        L_jobIDs = self.get_filter_jobIDs()
+        if L_jobIDs is not None:
+            # Parent job ID, as in `get_parent_jobID`
+            conditions.append(
+                f"(CASE WHEN j.id_array_task = {self.NO_VAL} THEN j.id_job ELSE j.id_array_job END) "
+                f"IN ({','.join([placeholder] * len(L_jobIDs))})"
+            )
+            params += [int(x) for x in L_jobIDs]
+        return ' AND '.join(conditions), params
+
+    def query(self, conn, sql, params):
+        '''
+        Run a query and load the results.
+        :return: [pd.DataFrame] one column per field selected
+        '''
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        columns = [x[0] for x in cursor.description]
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+        cursor.close()
+        return df
+
+    def pull_logs(self):
+        '''
+        Query the jobs and job steps of the period from the accounting database, only with the fields needed.
+        '''
+        conn, placeholder = self.connect()
+        try:
+            cluster = self.get_cluster_name(conn)
+            condition, params = self.get_jobs_condition(placeholder)
+
+            user_fields, user_join = '', ''
+            if self.args.allUsers:
+                user_fields = ", a.`user` AS User, j.account AS Account"
+                user_join = f"LEFT JOIN {cluster}_assoc_table AS a ON a.id_assoc = j.id_assoc"
+            self.jobs_db = self.query(conn, f'''
+                SELECT j.job_db_inx, j.id_job, j.id_array_job, j.id_array_task, j.job_name, j.`partition`, j.work_dir,
+                    j.state, j.nodes_alloc, j.cpus_req, j.tres_alloc,
+                    j.mem_req & {self.MEM_MASK} AS mem_MB, j.mem_req <> (j.mem_req & {self.MEM_MASK}) AS mem_perCPU,
+                    j.time_submit, j.time_start, j.time_end, j.time_suspended{user_fields}
+                FROM {cluster}_job_table AS j {user_join}
+                WHERE {condition}''', params)
+
+            self.steps_db = self.query(conn, f'''
+                SELECT s.job_db_inx, s.state, s.time_start, s.time_end, s.time_suspended,
+                    s.user_sec, s.user_usec, s.sys_sec, s.sys_usec, s.tres_usage_in_max
+                FROM {cluster}_step_table AS s JOIN {cluster}_job_table AS j ON j.job_db_inx = s.job_db_inx
+                WHERE s.deleted = 0 AND {condition}''', params)
+        finally:
+            conn.close()
+
+    def get_state_name(self, x):
+        '''
+        Name of a state from the accounting database, as displayed by sacct.
+        :param x: [int] state
+        :return: [str] e.g. 'COMPLETED'
+        '''
+        if pd.isnull(x):
+            return 'UNKNOWN'
+        x = int(x)
+        if x & self.JOB_REQUEUE:
+            return 'REQUEUED'
+        base = x & self.JOB_STATE_BASE
+        return self.job_states[base] if base < len(self.job_states) else 'UNKNOWN'
+
+    def get_tres_column(self, x, tres_id):
+        '''
+        Extract one resource from TRES strings, e.g. the number of CPUs (id 1) from '1=4,2=8000,4=1'.
+        :param x: [pd.Series of str] TRES strings
+        :param tres_id: [int] id of the resource
+        :return: [pd.Series of float] NaN if the resource isn't there
+        '''
+        return x.str.extract(rf'(?:^|,){tres_id}=([0-9]+)', expand=False).astype('float64')
+
+    def epoch_to_datetime_column(self, x):
+        '''
+        Convert timestamps from the database into local datetimes (as displayed by sacct).
+        The UTC offset is calculated once per quarter of an hour, as changes of time zone happen on these.
+        :param x: [pd.Series of int] seconds since epoch
+        :return: [pd.Series of datetime64]
+        '''
+        quarters = x // 900
+        offsets = self.apply_per_value(quarters, lambda q: 0 if pd.isnull(q) else time.localtime(q * 900).tm_gmtoff).astype('int64')
+        return pd.to_datetime(x + offsets, unit='s')
+
+    def elapsed_column(self, df, now):
+        '''
+        Elapsed time of jobs or steps: from their start to their end (or now if they are still running), minus the time suspended.
+        :param df: [pd.DataFrame] with time_start, time_end and time_suspended (seconds since epoch)
+        :param now: [int] current time, in seconds since epoch
+        :return: [pd.Series of timedelta64]
+        '''
+        end = df.time_end.where(df.time_end != 0, now)
+        elapsed = (end - df.time_start - df.time_suspended).where(df.time_start != 0, 0).clip(lower=0)
+        return pd.to_timedelta(elapsed.astype('int64'), unit='s')
+
+    def convert2dataframe(self):
+        '''
+        Build the usage logs (one row per job, then one row per job step) with the cleaned fields, as `clean_columns` would,
+        so that they can be aggregated per job in the same way.
+        '''
+        jobs, steps = self.jobs_db, self.steps_db
+        if len(jobs) == 0:
+            self.logs_df = pd.DataFrame()
+            return
+        now = int(time.time())
+
+        # Empty text fields are missing values for sacct
+        for x in ['job_name', 'partition', 'work_dir', 'User', 'Account']:
+            if x in jobs:
+                jobs[x] = jobs[x].where(jobs[x] != '')
+        logs_jobs = pd.DataFrame(index=jobs.index)
+
+        ### Job ID, with the index of the task for job arrays
+        isArray = jobs.id_array_task != self.NO_VAL
+        logs_jobs['single_jobID'] = jobs.id_job.astype(str).where(
+            ~isArray, jobs.id_array_job.astype(str) + '_' + jobs.id_array_task.astype(str)
+        )
+
+        ### Number of CPUs and nodes (CPUs requested for jobs that haven't started)
+        logs_jobs['NCPUSX'] = self.get_tres_column(jobs.tres_alloc.fillna(''), 1).fillna(jobs.cpus_req).astype('int32')
+        logs_jobs['NNodesX'] = jobs.nodes_alloc.astype('int32')
+
+        ### Memory requested, per CPU or per node, in MB
+        memory = jobs.mem_MB.astype('float64') / 1e3
+        logs_jobs['ReqMemX'] = memory * np.where(jobs.mem_perCPU.astype(bool), logs_jobs.NCPUSX, logs_jobs.NNodesX)
+        # As for sacct, memory usage is only reported on the steps
+        logs_jobs['UsedMemX'] = 0.
+
+        ### Times
+        logs_jobs['WallclockTimeX'] = self.elapsed_column(jobs, now)
+        logs_jobs['SubmitDatetimeX'] = self.epoch_to_datetime_column(jobs.time_submit)
+
+        ### Other fields
+        logs_jobs['PartitionX'] = self.apply_per_value(jobs['partition'], self.clean_partition, cluster_info=self.cluster_info)
+        logs_jobs['JobNameX'] = jobs.job_name.astype('category')
+        logs_jobs['WorkingDirX'] = jobs.work_dir.astype('category')
+        logs_jobs['StateX'] = self.apply_per_value(jobs.state, lambda x: self.clean_State(self.get_state_name(x))).astype('int8')
+        for x in ['User', 'Account']:
+            if x in jobs:
+                logs_jobs[f'{x}X'] = jobs[x].astype('category')
+
+        ### Steps, with the same requested resources as their job
+        job_position = pd.Series(np.arange(len(jobs)), index=jobs.job_db_inx.values)
+        steps_job = job_position.reindex(steps.job_db_inx.values).values
+        assert not np.isnan(steps_job).any(), "Some job steps don't have a job"
+        steps_job = steps_job.astype('int64')
+
+        logs_steps = pd.DataFrame({
+            'single_jobID': logs_jobs.single_jobID.values[steps_job],
+            'NCPUSX': logs_jobs.NCPUSX.values[steps_job],
+            'NNodesX': logs_jobs.NNodesX.values[steps_job],
+            'ReqMemX': logs_jobs.ReqMemX.values[steps_job],
+            'SubmitDatetimeX': logs_jobs.SubmitDatetimeX.values[steps_job],
+            'PartitionX': '',
+        })
+        # Maximum memory usage, in bytes (converted into K first, as displayed by sacct)
+        usedMem_bytes = self.get_tres_column(steps.tres_usage_in_max.fillna(''), 2)
+        logs_steps['UsedMemX'] = (usedMem_bytes / 1024 / 1e6).fillna(0.).values
+        logs_steps['WallclockTimeX'] = self.elapsed_column(steps, now).values
+        cpu_us = (steps.user_sec + steps.sys_sec).astype('int64') * 1000000 + (steps.user_usec + steps.sys_usec).astype('int64')
+        logs_steps['TotalCPUtimeX'] = pd.to_timedelta(cpu_us, unit='us').values
+        logs_steps['StateX'] = self.apply_per_value(steps.state, lambda x: self.clean_State(self.get_state_name(x))).astype('int8').values
+
+        ### As for sacct, the CPU time of a job is the total of its steps
+        cpu_us_jobs = np.zeros(len(jobs), dtype='int64')
+        np.add.at(cpu_us_jobs, steps_job, cpu_us.values)
+        logs_jobs['TotalCPUtimeX'] = pd.to_timedelta(cpu_us_jobs, unit='us')
+
+        self.logs_df = pd.concat([logs_jobs, logs_steps], ignore_index=True)
+
+    def filter_logs_df(self):
+        '''
+        The filters on working directory and job IDs are already applied by the query (see `get_jobs_condition`).
+        '''
+        pass
+
+    def clean_logs_df(self):
+        '''
+        The usage logs already have the cleaned fields, so they are only aggregated per job.
+        '''
+        ### Aggregate per jobID
+        self.df_agg_0 = self.aggregate_per_job(self.logs_df)
+
+        self.process_df_agg()
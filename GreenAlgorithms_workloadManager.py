@@ -5,10 +5,56 @@
 ##
 
 import subprocess
+import numpy as np
 import pandas as pd
 from io import BytesIO
 import datetime
 import os
+import glob
+import gzip
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+from GreenAlgorithms_profiling import Profiler
+
+# Usage logs and workload manager of a worker process of `WorkloadManager.aggregate_logs_parallel`,
+# only set in the workers, by `init_worker`.
+worker_inputs = {}
+
+
+def init_worker(WM, logs_raw):
+    '''
+    Initializer of the worker processes of `WorkloadManager.aggregate_logs_parallel`.
+    The workers are forked, so they inherit `WM` and `logs_raw` from the memory of the main process instead of receiving a copy.
+    :param WM: [WorkloadManager]
+    :param logs_raw: [bytes or mmap] usage logs
+    '''
+    worker_inputs.update(WM=WM, logs_raw=logs_raw)
+
+
+class SacctError(Exception):
+    '''
+    Raised when a sacct call fails, rather than reporting on the jobs of the other calls only.
+    '''
+    pass
+
+
+def aggregate_logs_part(part):
+    '''
+    Filter, clean and aggregate per job one part of the usage logs, in a worker process.
+    :param part: [(int,int)] start and end of the part in the usage logs, in bytes
+    :return: [pd.DataFrame] one row per job, indexed by single_jobID (empty if there are no jobs)
+    '''
+    WM = worker_inputs['WM']
+    logs_raw = worker_inputs['logs_raw']
+    start, end = part
+    header = logs_raw[:logs_raw.find(b'\n') + 1]
+    logs_df = WM.read_logs(BytesIO(header + logs_raw[start:end]))
+    logs_df, _ = WM.filter_raw_logs(logs_df)
+    if len(logs_df) == 0:
+        return pd.DataFrame()
+    WM.clean_columns(logs_df)
+    return WM.aggregate_per_job(logs_df)
+
 
 class Helpers_WM():
 
@@ -26,6 +72,18 @@ class Helpers_WM():
             memory /= 1e6
         return memory
 
+    def convert_to_GB_column(self, memory, unit):
+        '''
+        Vectorised version of `convert_to_GB`.
+        :param memory: [pd.Series of float] quantities to convert
+        :param unit: [pd.Series of str] unit of each value of `memory`, has to be in ['M', 'G', 'K']
+        :return: [pd.Series of float] memory in GB.
+        '''
+        assert unit.isin(['M', 'G', 'K']).all(), f"Unrecognised memory unit(s): {set(unit) - {'M', 'G', 'K'}}"
+        # Same divisions as in convert_to_GB, so that the results are identical
+        divisor = unit.map({'G': 1., 'M': 1e3, 'K': 1e6})
+        return memory / divisor
+
     def calc_ReqMem(self, x):
         '''
         Calculate the total memory required when submitting the job.
@@ -50,6 +108,23 @@ class Helpers_WM():
 
         return memory
 
+    def calc_ReqMem_column(self, df):
+        '''
+        Vectorised version of `calc_ReqMem`, working on the whole sacct output at once.
+        :param df: [pd.DataFrame] sacct output, with columns ReqMem, NNodes and NCPUS.
+        :return: [pd.Series of float] total required memory, in GB.
+        '''
+        parts = df.ReqMem.str.extract(r'^(?P<memory>[0-9.]+)(?P<unit>[A-Za-z])(?P<per_coreOrNode>[A-Za-z])$')
+        unparsed = parts.memory.isnull()
+        assert not unparsed.any(), f"Can't parse ReqMem: {df.ReqMem[unparsed].iloc[0]}"
+
+        # Convert memory to GB
+        memory = self.convert_to_GB_column(parts.memory.astype('float64'), parts.unit)
+
+        # Multiply by number of nodes/cores
+        assert parts.per_coreOrNode.isin(['n','c']).all()
+        return memory * np.where(parts.per_coreOrNode == 'c', df.NCPUS, df.NNodes)
+
     def clean_RSS(self, x, cluster_info):
         '''
         Clean the RSS value in sacct output.
@@ -70,6 +145,31 @@ class Helpers_WM():
 
         return memory
 
+    def clean_RSS_column(self, x, cluster_info):
+        '''
+        Vectorised version of `clean_RSS`.
+        :param x: [pd.Series] the MaxRSS values, each either NaN or of the form '2745K' (or just a number).
+        :param cluster_info: [dict]
+        :return: [pd.Series of float] RSS values, in GB.
+        '''
+        memory = pd.Series(0., index=x.index)
+        toParse = x.notnull() & (x != '0')
+        if not toParse.any():
+            return memory
+
+        parts = x[toParse].str.extract(r'^(?P<memory>[0-9.]+)(?P<unit>[A-Za-z]?)$')
+        unparsed = parts.memory.isnull()
+        assert not unparsed.any(), f"Can't parse MaxRSS: {x[toParse][unparsed].iloc[0]}"
+
+        # Special case for the situation where MaxRSS is of the form '154264' without a unit.
+        noUnit = parts.unit == ''
+        if noUnit.any():
+            assert 'default_unit_RSS' in cluster_info, "Some values of MaxRSS don't have a unit. Please specify a default_unit_RSS in cluster_info.yaml"
+            parts.loc[noUnit, 'unit'] = cluster_info['default_unit_RSS']
+
+        memory[toParse] = self.convert_to_GB_column(parts.memory.astype('float64'), parts.unit)
+        return memory
+
     def clean_partition(self, x, cluster_info):
         '''
         Clean the partition field, by replacing NaNs with empty string
@@ -131,6 +231,31 @@ class Helpers_WM():
         )
         return timeD
 
+    def parse_timedelta_column(self, x):
+        '''
+        Vectorised version of `parse_timedelta`.
+        :param x: [pd.Series of str] Durations, as '[DD-HH:MM:]SS[.MS]'
+        :return: [pd.Series of timedelta64] Parsed durations
+        '''
+        parts = x.str.extract(
+            r'^(?:(?P<days>[0-9]+)-)?(?:(?:(?P<hours>[0-9]+):)?(?P<minutes>[0-9]+):)?(?P<seconds>[0-9]+)(?:\.(?P<ms>[0-9]+))?$'
+        )
+        unparsed = parts.seconds.isnull()
+        assert not unparsed.any(), f"Can't parse the duration: {x[unparsed].iloc[0]}"
+        parts = parts.fillna('0').astype('int64')
+
+        # Everything is added up as an integer number of milliseconds, so that there are no rounding errors
+        total_ms = (((parts.days * 24 + parts.hours) * 60 + parts.minutes) * 60 + parts.seconds) * 1000 + parts.ms
+        return pd.to_timedelta(total_ms, unit='ms')
+
+    def parse_datetime_column(self, x):
+        '''
+        Parse the datetimes from sacct output (e.g. Submit), as '%Y-%m-%dT%H:%M:%S'.
+        :param x: [pd.Series of str] Datetimes
+        :return: [pd.Series of datetime64] Parsed datetimes
+        '''
+        return pd.to_datetime(x, format="%Y-%m-%dT%H:%M:%S")
+
     def calc_realMemNeeded(self, x, granularity_memory_request):
         '''
         Calculate the minimum memory needed.
@@ -141,6 +266,18 @@ class Helpers_WM():
         '''
         return min(x.ReqMemX,(int(x.UsedMemX/granularity_memory_request)+1)*granularity_memory_request)
 
+    def calc_realMemNeeded_column(self, df, granularity_memory_request):
+        '''
+        Vectorised version of `calc_realMemNeeded`.
+        :param df: [pd.DataFrame] one row per job, with ReqMemX and UsedMemX
+        :param granularity_memory_request: [float or int] level of granularity available when requesting memory on this cluster
+        :return: [pd.Series of float] minimum memory needed, in GB.
+        '''
+        # NB: UsedMemX is positive, so floor is the same as int
+        memNeeded = (np.floor(df.UsedMemX / granularity_memory_request) + 1) * granularity_memory_request
+        # Same as min(): ReqMemX unless memNeeded is smaller
+        return df.ReqMemX.where(~(memNeeded < df.ReqMemX), memNeeded).astype('float64')
+
     def clean_State(self, x):
         '''
         Standardise the job's state, coding with {-1,0,1}
@@ -154,6 +291,18 @@ class Helpers_WM():
         else:
             return 0
 
+    def apply_per_value(self, x, func, **kwargs):
+        '''
+        Apply a function once per distinct value of a column (including NaN) rather than once per row.
+        :param x: [pd.Series] column with few distinct values (e.g. a categorical)
+        :param func: [function] function applied to each value
+        :return: [pd.Series of object] output of func for each row
+        '''
+        codes, uniques = pd.factorize(x)
+        # NaNs have a code of -1, i.e. the last value
+        values = np.array([func(u, **kwargs) for u in uniques] + [func(np.nan, **kwargs)], dtype=object)
+        return pd.Series(values[codes], index=x.index)
+
     def get_parent_jobID(self, x):
         '''
         Get the parent job ID in case of array jobs
@@ -164,134 +313,680 @@ class Helpers_WM():
         assert len(foo) <= 2, f"Can't parse the job ID: {x}"
         return foo[0]
 
+    def get_parent_jobID_column(self, x):
+        '''
+        Vectorised version of `get_parent_jobID`.
+        :param x: [pd.Series of str] JobIDs of the form 123456789_0 (with or without '_0')
+        :return: [pd.Series of str] Parent IDs 123456789
+        '''
+        wrong_format = x.str.count('_') > 1
+        assert not wrong_format.any(), f"Can't parse the job ID: {x[wrong_format].iloc[0]}"
+        return x.str.replace(r'_.*$', '', regex=True)
+
+    def get_single_jobID_column(self, x):
+        '''
+        Get the jobID of the job each job step belongs to, i.e. the JobID before the '.' (e.g. 123456789 for 123456789.batch)
+        :param x: [pd.Series of str] JobIDs from sacct
+        :return: [pd.Series of str] single jobIDs
+        '''
+        return x.str.replace(r'\..*$', '', regex=True)
+
 
 class WorkloadManager(Helpers_WM):
 
-    def __init__(self, args, cluster_info):
+    # Types of the fields of sacct output, once in memory
+    sacct_dtypes = {
+        'JobID': 'str',
+        'JobName': 'category',
+        'Submit': 'str',
+        'Elapsed': 'str',
+        'Partition': 'category',
+        'NNodes': 'int32',
+        'NCPUS': 'int32',
+        'TotalCPU': 'str',
+        'ReqMem': 'str',
+        'MaxRSS': 'str',
+        'WorkDir': 'category',
+        'State': 'category',
+        'User': 'category',
+        'Account': 'category',
+    }
+
+    def __init__(self, args, cluster_info, profiler=None):
         '''
         Methods related to the Workload manager
         :param args: [Namespace] input from the user
         :param cluster_info: [dict] information about this specific cluster.
+        :param profiler: [None or Profiler, default=None] to profile the different cleaning steps
         '''
         self.args = args
         self.cluster_info = cluster_info
+        self.profiler = profiler if profiler is not None else Profiler(enabled=False)
         super().__init__()
 
-    def pull_logs(self):
+    def get_sacct_format(self):
         '''
-        Run the command line to pull usage from the workload manager.
+        Fields pulled from sacct (with User and Account as well when reporting on all the users).
+        :return: [str] comma-separated list of fields, for --format
+        '''
+        fields = "JobID,JobName,Submit,Elapsed,Partition,NNodes,NCPUS,TotalCPU,ReqMem,MaxRSS,WorkDir,State"
+        if self.args.allUsers:
+            fields += ",User,Account"
+        return fields
+
+    def get_sacct_command(self, startDay=None, endDay=None, jobIDs=None):
+        '''
+        Build the command line to pull usage from the workload manager.
+        :param startDay: [str, default=None] YYYY-MM-DD, to override args.startDay
+        :param endDay: [str, default=None] YYYY-MM-DD, to override args.endDay
+        :param jobIDs: [None or list of str, default=None] to only pull these jobs
+        :return: [list of str] the sacct command.
         '''
         bash_com = [
             "sacct",
             "--starttime",
-            self.args.startDay,  # format YYYY-MM-DD
+            startDay or self.args.startDay,  # format YYYY-MM-DD
             "--endtime",
-            self.args.endDay,  # format YYYY-MM-DD
+            endDay or self.args.endDay,  # format YYYY-MM-DD
             "--format",
-            "JobID,JobName,Submit,Elapsed,Partition,NNodes,NCPUS,TotalCPU,ReqMem,MaxRSS,WorkDir,State",
+            self.get_sacct_format(),
             "-P"
         ]
+        if self.args.allUsers:
+            bash_com.append("--allusers")
+        if jobIDs is not None:
+            bash_com += ["--jobs", ','.join(jobIDs)]
+        if 'slurm_cluster' in self.cluster_info:
+            # When several clusters share the same SLURM database
+            bash_com += ["-M", self.cluster_info['slurm_cluster']]
+        return bash_com
+
+    def run_sacct(self, startDay=None, endDay=None, jobIDs=None):
+        '''
+        Run sacct (see `get_sacct_command` for the parameters) and check that it succeeded.
+        :return: [bytes] sacct output
+        '''
+        bash_com = self.get_sacct_command(startDay, endDay, jobIDs=jobIDs)
+        logs = subprocess.run(bash_com, capture_output=True)
+        if logs.returncode != 0:
+            raise SacctError(
+                f"sacct failed for the jobs from {bash_com[2]} to {bash_com[4]} (exit code {logs.returncode}): "
+                f"{logs.stderr.decode(errors='replace').strip()}"
+            )
+        return logs.stdout
+
+    def get_filter_jobIDs(self):
+        '''
+        Job IDs from --filterJobIDs, to only pull these jobs from the workload manager.
+        :return: [None or list of str] None if all the jobs need to be pulled
+        '''
+        if self.args.filterJobIDs == 'all':
+            return None
+        L_jobIDs = self.args.filterJobIDs.split(',')
+        # Anything else than plain job IDs can't match a parent job ID, so it's left to `filter_raw_logs`
+        # rather than passed to sacct.
+        if not all(x.isdigit() for x in L_jobIDs):
+            return None
+        return L_jobIDs
 
+    def pull_logs(self):
+        '''
+        Run the command line to pull usage from the workload manager.
+        '''
         if self.args.useLoggedOutput == '':
-            logs = subprocess.run(bash_com, capture_output=True)
-            self.logs_raw = logs.stdout
+            if self.args.shardDays > 0:
+                self.logs_raw = self.pull_logs_sharded(jobIDs=self.get_filter_jobIDs())
+            else:
+                self.logs_raw = self.run_sacct(jobIDs=self.get_filter_jobIDs())
         else:
             print(f"Overrriding logs_raw with: {self.args.useLoggedOutput}")
-            with open(os.path.join('testData', self.args.useLoggedOutput), 'rb') as f:
-                self.logs_raw = f.read()
+            self.logs_raw = self.read_logged_outputs()
+
+    def get_logged_outputs(self):
+        '''
+        Files replayed with --useLoggedOutput: a file, a directory (all the files in it) or a glob pattern,
+        relative to testData/ unless absolute.
+        :return: [list of str] paths, sorted by name (i.e. chronologically for dated dumps)
+        '''
+        path = os.path.join('testData', self.args.useLoggedOutput)
+        if os.path.isdir(path):
+            L_paths = [os.path.join(path, x) for x in os.listdir(path)]
+        elif any(c in path for c in '*?['):
+            L_paths = glob.glob(path)
+        else:
+            L_paths = [path]
+        L_paths = sorted(x for x in L_paths if os.path.isfile(x))
+        if len(L_paths) == 0:
+            raise FileNotFoundError(f"No usage logs found at {path}")
+        return L_paths
+
+    def open_logged_output(self, path):
+        '''
+        Open a logged sacct output, decompressed on the fly if it's compressed (.gz, or .zst which requires zstandard).
+        :param path: [str]
+        :return: [binary file-like object]
+        '''
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rb')
+        if path.endswith(('.zst', '.zstd')):
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError(f"zstandard is needed to read {path}, install it or decompress it first.")
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return open(path, 'rb')
+
+    def read_logged_outputs(self):
+        '''
+        Read the usage logs replayed with --useLoggedOutput.
+        A single uncompressed file is memory-mapped, so that it's parsed straight from the page cache instead of being copied.
+        Compressed files are decompressed in memory, and several files are merged as one sacct output,
+        keeping the last version of the jobs found in several of them (i.e. their final state for consecutive dumps).
+        :return: [bytes or mmap.mmap] sacct output
+        '''
+        L_paths = self.get_logged_outputs()
+        if (len(L_paths) == 1) and not L_paths[0].endswith(('.gz', '.zst', '.zstd')):
+            with open(L_paths[0], 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # Empty files can't be memory-mapped
+                    return b''
+                # NB: the mapping stays valid once the file is closed
+                return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        L_outputs = []
+        for path in L_paths:
+            with self.open_logged_output(path) as f:
+                L_outputs.append(f.read())
+        if len(L_outputs) == 1:
+            return L_outputs[0]
+        return self.merge_logs(L_outputs, keep='last')
+
+    def count_lines(self, logs_raw, block_size=2**26):
+        '''
+        :param logs_raw: [bytes or mmap.mmap] sacct output
+        :param block_size: [int, default=64MB] counted block by block, so that a memory-mapped file isn't copied at once
+        :return: [int] number of lines, including the header
+        '''
+        if isinstance(logs_raw, bytes):
+            return logs_raw.count(b'\n')
+        return sum(logs_raw[i:i + block_size].count(b'\n') for i in range(0, len(logs_raw), block_size))
+
+    def split_period(self, n_days, startDay=None, endDay=None):
+        '''
+        Split the period [startDay, endDay] into consecutive windows of `n_days` days (the last one can be shorter).
+        :param n_days: [int] length of each window, in days
+        :param startDay: [str, default=None] YYYY-MM-DD, to override args.startDay
+        :param endDay: [str, default=None] YYYY-MM-DD, to override args.endDay
+        :return: [list of (str,str)] start and end day of each window, as YYYY-MM-DD
+        '''
+        start = datetime.datetime.strptime(startDay or self.args.startDay, '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(endDay or self.args.endDay, '%Y-%m-%d').date()
+        L_windows = []
+        while True:
+            window_end = min(start + datetime.timedelta(days=n_days), end)
+            L_windows.append((start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+            if window_end >= end:
+                return L_windows
+            start = window_end
+
+    def pull_logs_sharded(self, L_windows=None, jobIDs=None):
+        '''
+        Pull the usage logs with one sacct call per window of `args.shardDays` days,
+        running `args.shardWorkers` calls concurrently, and merge the outputs.
+        sacct returns all the jobs overlapping a window, so a job can appear in several windows:
+        only its first occurrence is kept. If any of the calls fails, `SacctError` is raised (naming the window).
+        :param L_windows: [None or list of (str,str), default=None] to override the windows to pull
+        :param jobIDs: [None or list of str, default=None] to only pull these jobs
+        :return: [bytes] merged sacct output, in the same format as a single call.
+        '''
+        if L_windows is None:
+            L_windows = self.split_period(self.args.shardDays)
+        with ThreadPoolExecutor(max_workers=self.args.shardWorkers) as executor:
+            L_outputs = list(executor.map(
+                lambda window: self.run_sacct(*window, jobIDs=jobIDs),
+                L_windows
+            ))
+
+        return self.merge_logs(L_outputs)
+
+    def merge_logs(self, L_outputs, keep='first'):
+        '''
+        Merge several sacct outputs into one, in the same format as a single call.
+        A job can appear in several outputs (e.g. overlapping windows), only one occurrence is kept.
+        :param L_outputs: [list of bytes] sacct outputs, with the same columns
+        :param keep: [str, default='first'] 'first' or 'last', occurrence of the jobs to keep
+        :return: [bytes] merged sacct output
+        '''
+        header = None
+        L_lines_kept = []
+        jobIDs_seen = set()
+        for output in (L_outputs if keep == 'first' else L_outputs[::-1]):
+            lines = output.splitlines()
+            if len(lines) == 0:
+                continue
+            if (header is not None) and (lines[0] != header):
+                raise ValueError(f"The usage logs to merge don't have the same columns: {header} and {lines[0]}")
+            header = lines[0]
+            lines_kept = []
+            jobIDs_output = set()
+            for line in lines[1:]:
+                # All the steps of a job have the same single jobID, i.e. the JobID before the '.'
+                single_jobID = line.split(b'|', 1)[0].split(b'.', 1)[0]
+                if single_jobID not in jobIDs_seen:
+                    lines_kept.append(line)
+                    jobIDs_output.add(single_jobID)
+            jobIDs_seen |= jobIDs_output
+            L_lines_kept.append(lines_kept)
+
+        if header is None:
+            return b''
+        if keep == 'last':
+            L_lines_kept = L_lines_kept[::-1]
+        return b'\n'.join([header] + [line for lines_kept in L_lines_kept for line in lines_kept]) + b'\n'
+
+    def read_logs(self, source, chunksize=None):
+        '''
+        Read sacct output into a pandas dataframe, with the types from `sacct_dtypes`.
+        :param source: [file-like object] sacct output
+        :param chunksize: [None or int, default=None] to read it in chunks
+        :return: [pd.DataFrame, or iterator of pd.DataFrame if chunksize is set]
+        '''
+        return pd.read_csv(source, sep="|", dtype=self.sacct_dtypes, chunksize=chunksize)
+
+    def open_logs_raw(self):
+        '''
+        :return: [file-like object] to read `logs_raw` without copying it
+        (BytesIO shares the buffer of bytes, and a memory-mapped file is read directly)
+        '''
+        if isinstance(self.logs_raw, mmap.mmap):
+            self.logs_raw.seek(0)
+            return self.logs_raw
+        return BytesIO(self.logs_raw)
 
     def convert2dataframe(self):
         '''
         Convert raw logs output into a pandas dataframe.
         '''
-        logs_df = pd.read_csv(BytesIO(self.logs_raw), sep="|", dtype='str')
-        for x in ['NNodes', 'NCPUS']:
-            logs_df[x] = logs_df[x].astype('int64')
+        self.logs_df = self.read_logs(self.open_logs_raw())
 
-        self.logs_df = logs_df
+    def filter_logs_df(self):
+        '''
+        Apply the filters on working directory and job IDs to the usage logs, before cleaning them.
+        '''
+        self.logs_df, _ = self.filter_raw_logs(self.logs_df)
+
+    def filter_raw_logs(self, logs_df, workDirs_previous=None):
+        '''
+        Apply the filters on working directory and job IDs to the raw usage logs,
+        so that the jobs that are not reported on are not cleaned and aggregated.
+        The jobs kept are the same as when filtering the aggregated jobs (see `process_df_agg`),
+        and all the steps of a job are either kept or removed together.
+        :param logs_df: [pd.DataFrame] raw usage logs, one row per job step
+        :param workDirs_previous: [None or dict, default=None] working directory of the jobs of the previous chunks,
+            for jobs whose steps are split across chunks (with --stream). It is updated with the jobs of this chunk.
+        :return: [pd.DataFrame, None or dict] usage logs of the jobs to keep, and the working directory of all the jobs
+            seen so far, including the previous chunks (if filtering on it)
+        '''
+        if (self.args.filterWD is None) and (self.args.filterJobIDs == 'all'):
+            return logs_df, None
+
+        single_jobID = self.get_single_jobID_column(logs_df.JobID)
+        keep = np.ones(len(logs_df), dtype=bool)
+        workDirs = None
+
+        if self.args.filterWD is not None:
+            # Same as WorkingDirX once aggregated, i.e. the first working directory reported for the job
+            workDirs_chunk = logs_df.WorkDir.astype(object).groupby(single_jobID.values, sort=False).first()
+            workDirs = {} if workDirs_previous is None else workDirs_previous
+            # The working directory found in a previous chunk comes first, as when aggregating the job
+            # (only the jobs of this chunk are looked up, so that each chunk takes the same time)
+            for jobID, workDir in workDirs_chunk.dropna().items():
+                workDirs.setdefault(jobID, workDir)
+            workDirs_chunk = pd.Series([workDirs.get(x) for x in workDirs_chunk.index], index=workDirs_chunk.index, dtype=object)
+            keep &= (single_jobID.map(workDirs_chunk) == self.args.filterWD).values
+
+        if self.args.filterJobIDs != 'all':
+            parentJobID = self.get_parent_jobID_column(single_jobID)
+            keep &= parentJobID.isin(self.args.filterJobIDs.split(',')).values
+
+        return logs_df.loc[keep].reset_index(drop=True), workDirs
 
     def clean_logs_df(self):
         '''
         Clean the different fields of the usage logs.
         NB: the name of the columns here (ending with X) need to be conserved, as they are used by the main script.
         '''
+        self.clean_columns(self.logs_df)
+
+        ### Aggregate per jobID
+        self.df_agg_0 = self.aggregate_per_job(self.logs_df)
+
+        self.process_df_agg()
+
+    def clean_columns(self, logs_df):
+        '''
+        Add the cleaned version of each field (ending with X) to the usage logs, one row per job step.
+        :param logs_df: [pd.DataFrame] usage logs, modified in place
+        '''
+        n_rows = len(logs_df)
+
         ### Calculate real memory usage
-        self.logs_df['ReqMemX'] = self.logs_df.apply(self.calc_ReqMem, axis=1)
+        with self.profiler.stage('ReqMemX', rows_in=n_rows):
+            logs_df['ReqMemX'] = self.calc_ReqMem_column(logs_df)
 
         ### Clean MaxRSS
-        self.logs_df['UsedMemX'] = self.logs_df.MaxRSS.apply(self.clean_RSS, cluster_info=self.cluster_info)
+        with self.profiler.stage('UsedMemX', rows_in=n_rows):
+            logs_df['UsedMemX'] = self.clean_RSS_column(logs_df.MaxRSS, cluster_info=self.cluster_info)
 
         ### Parse wallclock time
-        self.logs_df['WallclockTimeX'] = self.logs_df['Elapsed'].apply(self.parse_timedelta)
+        with self.profiler.stage('WallclockTimeX', rows_in=n_rows):
+            logs_df['WallclockTimeX'] = self.parse_timedelta_column(logs_df['Elapsed'])
 
         ### Parse total CPU time
-        self.logs_df['TotalCPUtimeX'] = self.logs_df['TotalCPU'].apply(self.parse_timedelta)
+        with self.profiler.stage('TotalCPUtimeX', rows_in=n_rows):
+            logs_df['TotalCPUtimeX'] = self.parse_timedelta_column(logs_df['TotalCPU'])
 
         ### Clean partition
         # Make sure it's either a partition name, or a comma-separated list of partitions
-        self.logs_df['PartitionX'] = self.logs_df.Partition.apply(
-            self.clean_partition,
-            cluster_info=self.cluster_info
-        )
+        with self.profiler.stage('PartitionX', rows_in=n_rows):
+            logs_df['PartitionX'] = self.apply_per_value(
+                logs_df.Partition,
+                self.clean_partition,
+                cluster_info=self.cluster_info
+            )
 
         ### Parse submit datetime
-        self.logs_df['SubmitDatetimeX'] = self.logs_df.Submit.apply(lambda x: datetime.datetime.strptime(x, "%Y-%m-%dT%H:%M:%S"))
+        with self.profiler.stage('SubmitDatetimeX', rows_in=n_rows):
+            logs_df['SubmitDatetimeX'] = self.parse_datetime_column(logs_df.Submit)
 
         ### Number of CPUs
         # e.g. here there is no cleaning necessary, so I just standardise the column name
-        self.logs_df['NCPUSX'] = self.logs_df.NCPUS
+        with self.profiler.stage('NCPUSX', rows_in=n_rows):
+            logs_df['NCPUSX'] = logs_df.NCPUS
 
         ### Number of nodes
-        self.logs_df['NNodesX'] = self.logs_df.NNodes
+        with self.profiler.stage('NNodesX', rows_in=n_rows):
+            logs_df['NNodesX'] = logs_df.NNodes
 
         ### Job name
-        self.logs_df['JobNameX'] = self.logs_df.JobName
+        with self.profiler.stage('JobNameX', rows_in=n_rows):
+            logs_df['JobNameX'] = logs_df.JobName
 
         ### Working directory
-        self.logs_df['WorkingDirX'] = self.logs_df.WorkDir
+        with self.profiler.stage('WorkingDirX', rows_in=n_rows):
+            logs_df['WorkingDirX'] = logs_df.WorkDir
 
         ### State
-        self.logs_df['StateX'] = self.logs_df.State.apply(self.clean_State)
+        with self.profiler.stage('StateX', rows_in=n_rows):
+            logs_df['StateX'] = self.apply_per_value(logs_df.State, self.clean_State).astype('int8')
+
+        ### User and account (only pulled when reporting on all the users)
+        for x in ['User', 'Account']:
+            if x in logs_df:
+                with self.profiler.stage(f'{x}X', rows_in=n_rows):
+                    logs_df[f'{x}X'] = logs_df[x]
 
         ### Pull jobID
-        self.logs_df['single_jobID'] = self.logs_df.JobID.apply(lambda x: x.split('.')[0])
+        with self.profiler.stage('single_jobID', rows_in=n_rows):
+            logs_df['single_jobID'] = self.get_single_jobID_column(logs_df.JobID)
 
-        ### Aggregate per jobID
-        self.df_agg_0 = self.logs_df.groupby('single_jobID').agg({
+        ### Drop the raw fields, now that they have been cleaned
+        logs_df.drop(columns=[x for x in self.sacct_dtypes if x in logs_df], inplace=True)
+
+    def aggregate_per_job(self, df):
+        '''
+        Aggregate the job steps per jobID.
+        All the reductions are associative, so this can also be used to merge partial aggregates
+        (e.g. from different chunks of the logs), as long as they are concatenated in the original order.
+        :param df: [pd.DataFrame] cleaned usage logs (or partial aggregates), with a column single_jobID
+        :return: [pd.DataFrame] one row per job, indexed by single_jobID
+        '''
+        agg_dict = {
             'TotalCPUtimeX': 'max',
             'WallclockTimeX': 'max',
             'ReqMemX': 'max',
             'UsedMemX': 'max',
             'NCPUSX': 'max',
             'NNodesX': 'max',
-            'PartitionX': lambda x: ''.join(x),
+            'PartitionX': 'first',  # see below
             'JobNameX': 'first',
             'SubmitDatetimeX': 'min',
             'WorkingDirX': 'first',
             'StateX': 'min',
-        })
+        }
+        # The user is only reported on the main line of the job, not on the steps
+        for x in ['UserX', 'AccountX']:
+            if x in df:
+                agg_dict[x] = 'first'
+        with self.profiler.stage('aggregate_per_job', rows_in=len(df)) as record:
+            # Only native reductions, so that pandas doesn't call Python once per job
+            df_agg = df.groupby('single_jobID').agg({x: func for x, func in agg_dict.items() if x != 'PartitionX'})
+            # Only the main line of a job has a partition (the steps have an empty one): it's the first non-empty one
+            partitions = df.PartitionX.where(df.PartitionX != '').groupby(df.single_jobID).first()
+            df_agg['PartitionX'] = partitions.reindex(df_agg.index).fillna('')
+            df_agg = df_agg[list(agg_dict)]
+            record['rows_out'] = len(df_agg)
+        return df_agg
+
+    def stream_logs(self):
+        '''
+        Alternative to `pull_logs` + `convert2dataframe` + `clean_logs_df` with bounded memory:
+        the output of sacct is read through a pipe and cleaned in chunks of `args.chunkSize` rows,
+        and each chunk is aggregated per jobID straight away.
+        Only the aggregates are kept, so memory scales with the number of jobs rather than the size of the logs.
+        Steps of a same job that are split across chunks are merged at the end.
+        Logged outputs (--useLoggedOutput) are read the same way, one file after the other.
+        '''
+        if self.args.useLoggedOutput == '':
+            L_paths = [None]
+        else:
+            print(f"Overrriding logs_raw with: {self.args.useLoggedOutput}")
+            L_paths = self.get_logged_outputs()
+
+        L_agg_outputs = []
+        workDirs = None
+        for path in L_paths:
+            if path is None:
+                process = subprocess.Popen(self.get_sacct_command(jobIDs=self.get_filter_jobIDs()), stdout=subprocess.PIPE)
+                stream = process.stdout
+            else:
+                # Logged outputs are decompressed on the fly, chunk by chunk
+                process = None
+                stream = self.open_logged_output(path)
+
+            L_agg = []
+            try:
+                for chunk in self.read_logs(stream, chunksize=self.args.chunkSize):
+                    chunk, workDirs = self.filter_raw_logs(chunk, workDirs_previous=workDirs)
+                    if len(chunk) == 0:
+                        continue
+                    self.clean_columns(chunk)
+                    L_agg.append(self.aggregate_per_job(chunk).reset_index())
+            except pd.errors.EmptyDataError:
+                pass
+            finally:
+                stream.close()
+                if (process is not None) and (process.wait() != 0):
+                    raise SacctError(f"sacct failed for the jobs from {self.args.startDay} to {self.args.endDay} (exit code {process.returncode})")
+
+            if len(L_agg) > 0:
+                ### Merge the jobs that were split across chunks
+                L_agg_outputs.append(self.aggregate_per_job(pd.concat(L_agg, ignore_index=True)))
+
+        if len(L_agg_outputs) == 0:
+            self.df_agg_0 = pd.DataFrame()
+        elif len(L_agg_outputs) == 1:
+            self.df_agg_0 = L_agg_outputs[0]
+        else:
+            ### Jobs found in several logged outputs: their last version is kept, as with `read_logged_outputs`
+            df_agg_0 = pd.concat(L_agg_outputs)
+            self.df_agg_0 = df_agg_0.loc[~df_agg_0.index.duplicated(keep='last')].sort_index()
+
+    def split_logs(self, n_parts):
+        '''
+        Split the usage logs into `n_parts` parts of similar size, just before the main line of a job
+        (so that all the steps of a job are in the same part).
+        :param n_parts: [int] number of parts
+        :return: [list of (int,int)] start and end of each part in `logs_raw`, in bytes (without the header)
+        '''
+        logs_raw = self.logs_raw
+        header_end = logs_raw.find(b'\n') + 1
+        L_offsets = [header_end]
+        for k in range(1, n_parts):
+            offset = max(header_end + (len(logs_raw) - header_end) * k // n_parts, L_offsets[-1])
+            # Start of the next line
+            if logs_raw[offset - 1:offset] != b'\n':
+                offset = (logs_raw.find(b'\n', offset) + 1) or len(logs_raw)
+            # Start of the next job, i.e. the next line that is not a job step (JobID without '.')
+            while (offset < len(logs_raw)) and (b'.' in logs_raw[offset:logs_raw.find(b'|', offset)]):
+                offset = (logs_raw.find(b'\n', offset) + 1) or len(logs_raw)
+            L_offsets.append(offset)
+        L_offsets.append(len(logs_raw))
+        return [(start, end) for start, end in zip(L_offsets[:-1], L_offsets[1:]) if end > start]
+
+    def aggregate_logs_parallel(self):
+        '''
+        Alternative to `convert2dataframe` + `filter_logs_df` + `clean_logs_df` (before `process_df_agg`) using `args.workers` processes:
+        the usage logs are split between jobs, and each part is filtered, cleaned and aggregated per job by a worker.
+        The workers are forked, so they read the usage logs from the memory of this process (copy-on-write)
+        rather than receiving a copy, and only the aggregated jobs are sent back.
+        '''
+        import multiprocessing
+
+        # More parts than workers, so that they all finish at about the same time
+        L_parts = self.split_logs(self.args.workers * 4)
+        with multiprocessing.get_context('fork').Pool(self.args.workers, initializer=init_worker, initargs=(self, self.logs_raw)) as pool:
+            L_agg = pool.map(aggregate_logs_part, L_parts, chunksize=1)
+
+        L_agg = [df for df in L_agg if len(df) > 0]
+        if len(L_agg) == 0:
+            self.df_agg_0 = pd.DataFrame()
+            return
+        df_agg = pd.concat(L_agg)
+        if not df_agg.index.is_unique:
+            # Steps that are not just after the main line of their job: merged as with --stream
+            df_agg = self.aggregate_per_job(df_agg.reset_index())
+        # Same order as when aggregating all the jobs at once
+        self.df_agg_0 = df_agg.sort_index()
+
+    def aggregate_raw_logs(self, logs_raw):
+        '''
+        Convert, clean and aggregate per job some raw sacct output, without keeping the intermediate dataframe.
+        :param logs_raw: [bytes] sacct output
+        :return: [pd.DataFrame] one row per job, indexed by single_jobID (empty if there are no jobs)
+        '''
+        if logs_raw.strip() == b'':
+            return pd.DataFrame()
+        logs_df = self.read_logs(BytesIO(logs_raw))
+        if len(logs_df) == 0:
+            return pd.DataFrame()
+        self.clean_columns(logs_df)
+        return self.aggregate_per_job(logs_df)
+
+    def pull_logs_cached(self, cache):
+        '''
+        Alternative to `pull_logs` + `convert2dataframe` + `clean_logs_df` using a local cache of finished jobs:
+        sacct is only called for the days not covered by the cache yet, and for the jobs that were unfinished last time.
+        :param cache: [JobsCache] cache of finished jobs for this user and cluster.
+        '''
+        today = datetime.date.today().strftime('%Y-%m-%d')
+
+        L_windows = cache.missing_windows(self.args.startDay, self.args.endDay)
+        if self.args.shardDays > 0:
+            L_windows = [shard for window in L_windows for shard in self.split_period(self.args.shardDays, *window)]
+
+        L_agg = []
+        if len(L_windows) > 0:
+            L_agg.append(self.aggregate_raw_logs(self.pull_logs_sharded(L_windows)))
+
+        unfinished = cache.unfinished_jobs()
+        if len(unfinished) > 0:
+            tomorrow = (datetime.date.today() + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+            L_agg.append(self.aggregate_raw_logs(self.run_sacct(
+                startDay=min(unfinished.values()),
+                endDay=tomorrow,
+                jobIDs=list(unfinished)
+            )))
+
+        L_agg = [df for df in L_agg if len(df) > 0]
+        if len(L_agg) > 0:
+            new_agg = pd.concat(L_agg)
+            # Jobs returned by several calls are only kept once
+            new_agg = new_agg.loc[~new_agg.index.duplicated()]
+        else:
+            new_agg = None
+
+        # Days after today can't be fully covered yet
+        cache.update(new_agg, [(start, min(end, today)) for start, end in L_windows if start < today])
+
+        self.df_agg_0 = cache.load(self.args.startDay, self.args.endDay)
+
+    def set_compact_dtypes(self, df_agg):
+        '''
+        Use compact types for the aggregated jobs: categoricals for the fields with few distinct values, and small integers.
+        NB: the memory values are kept as float64, so that the footprints are not affected by rounding.
+        :param df_agg: [pd.DataFrame] one row per job
+        :return: [pd.DataFrame] same dataframe with the types updated
+        '''
+        for x in ['PartitionX', 'JobNameX', 'WorkingDirX', 'UserX', 'AccountX']:
+            if x in df_agg:
+                df_agg[x] = df_agg[x].astype('category')
+        for x in ['NCPUSX', 'NNodesX']:
+            df_agg[x] = df_agg[x].astype('int32')
+        df_agg['StateX'] = df_agg.StateX.astype('int8')
+        return df_agg
+
+    def memory_usage_per_job(self):
+        '''
+        Memory used by the usage logs and by the aggregated jobs.
+        :return: [dict] bytes per row, for logs_df (if it exists, one row per job step) and df_agg (one row per job)
+        '''
+        memory_usage = {}
+        for name in ['logs_df', 'df_agg']:
+            df = getattr(self, name, None)
+            if (df is not None) and (len(df) > 0):
+                memory_usage[name] = df.memory_usage(deep=True).sum() / len(df)
+        return memory_usage
+
+    def process_df_agg(self):
+        '''
+        Final steps once the logs have been aggregated per job: remove unfinished jobs,
+        calculate memory needs and apply the filters from the user.
+        '''
+        self.df_agg_0 = self.set_compact_dtypes(self.df_agg_0)
 
         ### Remove jobs that are still running or currently queued
-        self.df_agg = self.df_agg_0.loc[self.df_agg_0.StateX != -1]
+        with self.profiler.stage('remove_unfinished', rows_in=len(self.df_agg_0)) as record:
+            self.df_agg = self.df_agg_0.loc[self.df_agg_0.StateX != -1]
+            record['rows_out'] = len(self.df_agg)
 
         ### Calculate real memory need
-        self.df_agg['NeededMemX'] = self.df_agg.apply(
-            self.calc_realMemNeeded,
-            granularity_memory_request=self.cluster_info['granularity_memory_request'],
-            axis=1)
+        with self.profiler.stage('NeededMemX', rows_in=len(self.df_agg)):
+            self.df_agg['NeededMemX'] = self.calc_realMemNeeded_column(
+                self.df_agg,
+                granularity_memory_request=self.cluster_info['granularity_memory_request']
+            )
 
         ### Add memory waste information
         # TODO can be overestimated
-        self.df_agg['memOverallocationFactorX'] = (self.df_agg.ReqMemX - self.df_agg.NeededMemX) / self.df_agg.NeededMemX
+        with self.profiler.stage('memOverallocationFactorX', rows_in=len(self.df_agg)):
+            self.df_agg['memOverallocationFactorX'] = (self.df_agg.ReqMemX - self.df_agg.NeededMemX) / self.df_agg.NeededMemX
 
         ### Filter on working directory
+        # NB: when the raw usage logs have already been filtered (see `filter_logs_df`), this doesn't remove anything,
+        # but it's still needed for the jobs from the cache.
         if self.args.filterWD is not None:
-            self.df_agg = self.df_agg.loc[self.df_agg.WorkingDirX == self.args.filterWD]
+            with self.profiler.stage('filterWD', rows_in=len(self.df_agg)) as record:
+                self.df_agg = self.df_agg.loc[self.df_agg.WorkingDirX == self.args.filterWD]
+                record['rows_out'] = len(self.df_agg)
 
         ### Filter on Job ID
         self.df_agg.reset_index(inplace=True)
-        self.df_agg['parentJobID'] = self.df_agg.single_jobID.apply(self.get_parent_jobID)
+        with self.profiler.stage('parentJobID', rows_in=len(self.df_agg)):
+            self.df_agg['parentJobID'] = self.get_parent_jobID_column(self.df_agg.single_jobID)
 
         if self.args.filterJobIDs != 'all':
-            list_jobs2keep = self.args.filterJobIDs.split(',')
-            self.df_agg = self.df_agg.loc[self.df_agg.parentJobID.isin(list_jobs2keep)]
+            with self.profiler.stage('filterJobIDs', rows_in=len(self.df_agg)) as record:
+                list_jobs2keep = self.args.filterJobIDs.split(',')
+                self.df_agg = self.df_agg.loc[self.df_agg.parentJobID.isin(list_jobs2keep)]
+                record['rows_out'] = len(self.df_agg)
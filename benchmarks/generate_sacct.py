@@ -0,0 +1,198 @@
+##
+## Generator of synthetic usage logs, in the same format as `sacct -P` in GreenAlgorithms_workloadManager.py
+##
+
+import os
+import sys
+import argparse
+import datetime
+import numpy as np
+import pandas as pd
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from GreenAlgorithms_workloadManager import WorkloadManager
+
+
+def format_duration(seconds, rng, fraction_withMs=0., fraction_MMSS=0.):
+    '''
+    Format durations the way sacct does, i.e. '[DD-[HH:]]MM:SS[.MS]'
+    :param seconds: [np.array of int] durations, in seconds
+    :param rng: [np.random.Generator]
+    :param fraction_withMs: [float] fraction of the durations (below 1 day) with milliseconds
+    :param fraction_MMSS: [float] fraction of the durations (below 1 hour) formatted as MM:SS
+    :return: [pd.Series of str]
+    '''
+    days, rest = np.divmod(seconds, 86400)
+    hours, rest = np.divmod(rest, 3600)
+    minutes, secs = np.divmod(rest, 60)
+    str2 = lambda x: pd.Series(x).astype(str).str.zfill(2)
+
+    HHMMSS = str2(hours) + ':' + str2(minutes) + ':' + str2(secs)
+    MMSS = str2(minutes) + ':' + str2(secs)
+
+    n = len(seconds)
+    withMs = (days == 0) & (rng.random(n) < fraction_withMs)
+    asMMSS = (days == 0) & (hours == 0) & (rng.random(n) < fraction_MMSS)
+
+    out = HHMMSS.where(~asMMSS, MMSS)
+    out = out.where(days == 0, pd.Series(days).astype(str) + '-' + HHMMSS)
+    ms = pd.Series(rng.integers(0, 1000, n)).astype(str).str.zfill(3)
+    return out.where(~withMs, out + '.' + ms)
+
+
+def generate_chunk(rng, first_job, n_jobs, options, cluster_info, columns):
+    '''
+    Generate the usage logs of `n_jobs` consecutive jobs, and their steps.
+    :param rng: [np.random.Generator]
+    :param first_job: [int] index of the first job of this chunk
+    :param n_jobs: [int] number of jobs in this chunk
+    :param options: [Namespace] options of the generator
+    :param cluster_info: [dict]
+    :param columns: [list of str] fields of the sacct output
+    :return: [pd.DataFrame] one row per job or job step, in the same order as sacct
+    '''
+    ### Job IDs, arrays are blocks of arraySize consecutive jobs
+    idx_jobs = np.arange(first_job, first_job + n_jobs)
+    idx_blocks = idx_jobs // options.arraySize
+    is_array = np.random.default_rng([options.seed, 1]).random(idx_blocks.max() + 1)[idx_blocks] < options.arrayFraction
+    jobIDs = pd.Series(options.firstJobID + idx_jobs).astype(str)
+    arrayIDs = pd.Series(options.firstJobID + idx_blocks * options.arraySize).astype(str) + '_' + pd.Series(idx_jobs % options.arraySize).astype(str)
+    jobIDs = jobIDs.where(~is_array, arrayIDs)
+
+    ### Partitions, with some lists of partitions (only partitions with the same TDP can be combined)
+    partitions = list(options.partitionMix)
+    weights = np.array([options.partitionMix[p] for p in partitions], dtype=float)
+    partition = pd.Series(np.array(partitions, dtype=object)[rng.choice(len(partitions), n_jobs, p=weights / weights.sum())])
+    L_TDPs = {}
+    for p, info in cluster_info['partitions'].items():
+        L_TDPs.setdefault(info['TDP'], []).append(p)
+    for p in partitions:
+        same_TDP = [x for x in L_TDPs[cluster_info['partitions'][p]['TDP']] if x != p]
+        if len(same_TDP) > 0:
+            multi = (partition == p) & (rng.random(n_jobs) < options.multiPartitionFraction)
+            partition[multi] = f"{p},{same_TDP[0]}"
+
+    ### Resources and usage
+    NNodes = np.where(rng.random(n_jobs) < 0.05, rng.integers(2, 9, n_jobs), 1)
+    NCPUS = rng.choice([1, 2, 4, 8, 16, 32, 64], n_jobs) * NNodes
+    elapsed = np.minimum(rng.lognormal(7, 2, n_jobs).astype(int) + 1, 14 * 86400)
+    totalCPU = (elapsed * NCPUS * rng.beta(5, 2, n_jobs)).astype(int)
+    reqMem_value = rng.choice([500, 1000, 2000, 4000, 8000], n_jobs)
+    inGB = rng.random(n_jobs) < 0.5
+    reqMem = (pd.Series(np.where(inGB, reqMem_value // 1000 + 1, reqMem_value)).astype(str)
+              + np.where(inGB, 'G', 'M') + np.where(rng.random(n_jobs) < 0.7, 'c', 'n'))
+
+    start = datetime.datetime.strptime(options.startDay, '%Y-%m-%d')
+    period_s = max(int((datetime.datetime.strptime(options.endDay, '%Y-%m-%d') - start).total_seconds()), 1)
+    submit = pd.Series(pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, period_s, n_jobs), unit='s')).dt.strftime('%Y-%m-%dT%H:%M:%S')
+
+    states = list(options.stateMix)
+    weights = np.array([options.stateMix[s] for s in states], dtype=float)
+    state = np.array(states, dtype=object)[rng.choice(len(states), n_jobs, p=weights / weights.sum())]
+
+    jobs = pd.DataFrame({
+        'job': idx_jobs,
+        'step': -1,
+        'JobID': jobIDs,
+        'JobName': pd.Series(rng.integers(0, 50, n_jobs)).map('job_{}'.format),
+        'Submit': submit,
+        'Elapsed': format_duration(elapsed, rng, options.msFraction, options.MMSSFraction),
+        'Partition': partition,
+        'NNodes': NNodes,
+        'NCPUS': NCPUS,
+        'TotalCPU': format_duration(totalCPU, rng, options.msFraction, options.MMSSFraction),
+        'ReqMem': reqMem,
+        'MaxRSS': '',
+        'WorkDir': pd.Series(rng.integers(0, 20, n_jobs)).map('/home/user/project_{}'.format),
+        'State': state,
+        'User': pd.Series(rng.integers(0, options.nUsers, n_jobs)).map('user{}'.format),
+        'Account': pd.Series(rng.integers(0, max(options.nUsers // 10, 1), n_jobs)).map('account{}'.format),
+    })
+
+    ### Steps: batch, extern, then numbered steps
+    n_steps = rng.integers(0, options.stepFanout + 1, n_jobs)
+    steps = jobs.loc[np.repeat(np.arange(n_jobs), n_steps)].reset_index(drop=True)
+    steps['step'] = np.arange(len(steps)) - np.repeat(np.cumsum(n_steps) - n_steps, n_steps)
+    stepNames = pd.Series(np.where(steps.step == 0, 'batch', np.where(steps.step == 1, 'extern', (steps.step - 2).astype(str)))).astype(str)
+    steps['JobID'] = steps.JobID + '.' + stepNames
+    steps['JobName'] = stepNames
+    steps['Partition'] = ''
+    steps['WorkDir'] = ''
+    steps['User'] = ''
+    usedMem_K = (rng.random(len(steps)) * 8e6).astype(int)
+    unit = rng.choice(['K', 'M', ''], len(steps), p=[0.6, 0.3, 0.1])
+    maxRSS = pd.Series(np.where(unit == 'M', usedMem_K // 1000, usedMem_K)).astype(str) + unit
+    steps['MaxRSS'] = maxRSS.where(rng.random(len(steps)) >= options.missingMaxRSSFraction, '')
+
+    logs = pd.concat([jobs, steps], ignore_index=True).sort_values(['job', 'step'], kind='stable')
+    return logs[columns]
+
+
+def generate_sacct(options, output):
+    '''
+    Write synthetic usage logs, in chunks so that large outputs don't need to fit in memory.
+    :param options: [Namespace] options of the generator
+    :param output: [file-like object] where to write the logs
+    '''
+    with open(options.clusterInfo, 'r') as f:
+        cluster_info = yaml.safe_load(f)
+    if options.partitionMix is None:
+        options.partitionMix = {p: 1 for p in cluster_info['partitions']}
+
+    # Same fields as the ones pulled by the workload manager
+    columns = WorkloadManager(argparse.Namespace(allUsers=options.allUsers), cluster_info).get_sacct_format().split(',')
+
+    rng = np.random.default_rng(options.seed)
+    for first_job in range(0, options.nJobs, options.chunkSize):
+        chunk = generate_chunk(rng, first_job, min(options.chunkSize, options.nJobs - first_job), options, cluster_info, columns)
+        chunk.to_csv(output, sep='|', index=False, header=(first_job == 0))
+
+
+def parse_mix(x):
+    '''
+    Parse a mix of categories, e.g. 'COMPLETED:8,FAILED:1'
+    :param x: [str]
+    :return: [dict] category -> weight
+    '''
+    return {k: float(v) for k, v in (item.split(':') for item in x.split(','))}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Generate synthetic usage logs, in the same format as sacct.')
+    parser.add_argument('--nJobs', type=int, default=10000, help='Number of jobs (default: 10000)')
+    parser.add_argument('--stepFanout', type=int, default=3,
+                        help='Maximum number of steps per job, the actual number is drawn uniformly (default: 3)')
+    parser.add_argument('--arrayFraction', type=float, default=0.2, help='Fraction of the jobs that are part of job arrays (default: 0.2)')
+    parser.add_argument('--arraySize', type=int, default=10, help='Number of jobs per array (default: 10)')
+    parser.add_argument('--partitionMix', type=parse_mix, default=None,
+                        help='Weights of the partitions, e.g. cpu_a:8,gpu_a:1 (default: all the partitions of the cluster, equally)')
+    parser.add_argument('--multiPartitionFraction', type=float, default=0.05,
+                        help='Fraction of the jobs submitted to a list of partitions (default: 0.05)')
+    parser.add_argument('--missingMaxRSSFraction', type=float, default=0.1, help='Fraction of the steps without MaxRSS (default: 0.1)')
+    parser.add_argument('--msFraction', type=float, default=0.2, help='Fraction of the durations with milliseconds (default: 0.2)')
+    parser.add_argument('--MMSSFraction', type=float, default=0.2,
+                        help='Fraction of the durations below one hour formatted as MM:SS (default: 0.2)')
+    parser.add_argument('--stateMix', type=parse_mix, default=parse_mix('COMPLETED:70,FAILED:10,CANCELLED by 0:5,TIMEOUT:5,RUNNING:5,PENDING:5'),
+                        help='Weights of the job states (default: COMPLETED:70,FAILED:10,CANCELLED by 0:5,TIMEOUT:5,RUNNING:5,PENDING:5)')
+    parser.add_argument('--allUsers', action='store_true', help='Add the User and Account fields, as with --allUsers')
+    parser.add_argument('--nUsers', type=int, default=100, help='Number of users, with --allUsers (default: 100)')
+    parser.add_argument('--startDay', type=str, default='2021-01-01', help='First day of submission (default: 2021-01-01)')
+    parser.add_argument('--endDay', type=str, default='2021-12-31', help='Last day of submission (default: 2021-12-31)')
+    parser.add_argument('--firstJobID', type=int, default=1000000, help='ID of the first job (default: 1000000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator (default: 0)')
+    parser.add_argument('--chunkSize', type=int, default=100000, help='Number of jobs generated at once (default: 100000)')
+    parser.add_argument('--clusterInfo', type=str,
+                        default=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cluster_info_benchmark.yaml'),
+                        help='cluster_info file with the partitions to use (default: cluster_info_benchmark.yaml)')
+    parser.add_argument('-o', '--output', type=str, default='-', help='Output file (default: stdout)')
+    return parser
+
+
+if __name__ == "__main__":
+    options = get_parser().parse_args()
+    if options.output == '-':
+        generate_sacct(options, sys.stdout)
+    else:
+        with open(options.output, 'w', newline='') as f:
+            generate_sacct(options, f)
@@ -0,0 +1,258 @@
+##
+## Stand-in for the SLURM accounting database: a SQLite file with the tables read by GreenAlgorithms_slurmdb.py,
+## filled from usage logs in the format of sacct (e.g. from generate_sacct.py).
+##
+## Usage:
+##   python benchmarks/generate_sacct.py --nJobs 10000 -o sacct.txt
+##   python benchmarks/generate_slurmdb.py sacct.txt -o slurm.sqlite
+## The reports from `--useLoggedOutput sacct.txt` and from `--slurmDB slurm.sqlite` should then be the same
+## (as long as the period covers all the jobs and they have all finished), up to the precision of the database:
+## elapsed times lose their milliseconds (they are stored in seconds, CPU times in microseconds), memory requested
+## in K is rounded to the MB, and memory usage goes through bytes (see tests/test_slurmdb.py for the tolerances).
+##
+
+import os
+import sys
+import time
+import argparse
+import sqlite3
+import numpy as np
+import pandas as pd
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from GreenAlgorithms_slurmdb import SlurmDBWorkloadManager
+
+# Subset of the columns of the SLURM tables (same names and meaning), with the types of SQLite
+schema = {
+    'job_table': '''
+        job_db_inx INTEGER PRIMARY KEY,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        account TEXT,
+        cpus_req INTEGER NOT NULL,
+        id_array_job INTEGER NOT NULL DEFAULT 0,
+        id_array_task INTEGER NOT NULL DEFAULT 4294967294,
+        id_assoc INTEGER NOT NULL,
+        id_job INTEGER NOT NULL,
+        id_user INTEGER NOT NULL,
+        job_name TEXT NOT NULL,
+        mem_req INTEGER NOT NULL DEFAULT 0,
+        nodes_alloc INTEGER NOT NULL,
+        `partition` TEXT NOT NULL,
+        state INTEGER NOT NULL,
+        time_submit INTEGER NOT NULL DEFAULT 0,
+        time_start INTEGER NOT NULL DEFAULT 0,
+        time_end INTEGER NOT NULL DEFAULT 0,
+        time_suspended INTEGER NOT NULL DEFAULT 0,
+        work_dir TEXT NOT NULL DEFAULT '',
+        tres_alloc TEXT NOT NULL DEFAULT '' ''',
+    'step_table': '''
+        job_db_inx INTEGER NOT NULL,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        id_step INTEGER NOT NULL,
+        step_name TEXT NOT NULL,
+        state INTEGER NOT NULL,
+        nodes_alloc INTEGER NOT NULL,
+        time_start INTEGER NOT NULL DEFAULT 0,
+        time_end INTEGER NOT NULL DEFAULT 0,
+        time_suspended INTEGER NOT NULL DEFAULT 0,
+        user_sec INTEGER NOT NULL DEFAULT 0,
+        user_usec INTEGER NOT NULL DEFAULT 0,
+        sys_sec INTEGER NOT NULL DEFAULT 0,
+        sys_usec INTEGER NOT NULL DEFAULT 0,
+        tres_usage_in_max TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (job_db_inx, id_step)''',
+    'assoc_table': '''
+        id_assoc INTEGER PRIMARY KEY,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        `user` TEXT NOT NULL DEFAULT '',
+        acct TEXT NOT NULL''',
+}
+
+# Special step IDs, as stored by SLURM >= 20.11
+step_ids = {'extern': -4, 'batch': -5, 'interactive': -6}
+
+
+def get_state_codes(states):
+    '''
+    Convert the states from sacct into the codes stored in the database.
+    :param states: [pd.Series of str] e.g. 'COMPLETED' or 'CANCELLED by 0'
+    :return: [np.array of int]
+    '''
+    WM = SlurmDBWorkloadManager
+    codes = {name: i for i, name in enumerate(WM.job_states)}
+    codes.update({'CD': codes['COMPLETED'], 'PD': codes['PENDING'], 'R': codes['RUNNING'], 'RQ': WM.JOB_REQUEUE, 'REQUEUED': WM.JOB_REQUEUE})
+    name = states.astype(str).str.split(' ', n=1).str[0]
+    unknown = ~name.isin(list(codes))
+    assert not unknown.any(), f"Unrecognised state: {states[unknown].iloc[0]}"
+    return name.map(codes).values.astype('int64')
+
+
+def to_epoch(datetimes):
+    '''
+    :param datetimes: [pd.Series of datetime64] local datetimes, as displayed by sacct
+    :return: [np.array of int] seconds since epoch
+    '''
+    return np.array([int(time.mktime(x.timetuple())) for x in datetimes], dtype='int64')
+
+
+def convert_logs(logs_path, cluster_info, uid):
+    '''
+    Convert usage logs from sacct into the rows of the SLURM tables.
+    NB: the database doesn't store the CPU time of the jobs, only of their steps (sacct adds them up),
+    so the CPU time of each job (the maximum of the job and of its steps, as used by the calculator) is put on its first step,
+    with an extra batch step for jobs without any. Elapsed times are rounded down to the second, as in the database.
+    :param logs_path: [str] usage logs, in the format of `sacct -P`
+    :param cluster_info: [dict]
+    :param uid: [int] user ID of the jobs
+    :return: [dict] table name -> pd.DataFrame
+    '''
+    WM = SlurmDBWorkloadManager(argparse.Namespace(), cluster_info)
+    with open(logs_path, 'rb') as f:
+        logs = WM.read_logs(f)
+    raw = logs[['JobID', 'Partition', 'ReqMem', 'State'] + [x for x in ['User', 'Account'] if x in logs]].copy()
+    WM.clean_columns(logs)
+    logs = pd.concat([logs, raw], axis=1)
+
+    isStep = logs.JobID.str.contains('.', regex=False)
+    jobs = logs.loc[~isStep].reset_index(drop=True)
+    steps = logs.loc[isStep].reset_index(drop=True)
+
+    ### Jobs
+    # The partition can be on the line of a step rather than of the job (see `aggregate_per_job`), it's stored with the job
+    partitions = logs.Partition.astype(object).groupby(logs.single_jobID.values, sort=False).first()
+    ids = jobs.single_jobID.str.extract(r'^(?P<job>[0-9]+)(?:_(?P<task>[0-9]+))?$')
+    assert not ids.job.isnull().any(), f"Can't parse the job ID: {jobs.single_jobID[ids.job.isnull()].iloc[0]}"
+    isArray = ids.task.notnull()
+    id_job = ids.job.astype('int64').values.copy()
+    # Each task of an array is a job of its own, with a new ID
+    id_job[isArray.values] = id_job.max() + 1 + np.arange(isArray.sum())
+
+    state = get_state_codes(jobs.State)
+    finished = (jobs.StateX != -1).values
+    time_submit = to_epoch(jobs.SubmitDatetimeX)
+    time_start = np.where(state == 0, 0, time_submit)
+    time_end = np.where(finished, time_start + jobs.WallclockTimeX.dt.total_seconds().astype('int64').values, 0)
+
+    mem = jobs.ReqMem.str.extract(r'^(?P<memory>[0-9.]+)(?P<unit>[KMG])(?P<per_coreOrNode>[cn])$')
+    mem_MB = np.round(mem.memory.astype('float64') * mem.unit.map({'K': 1e-3, 'M': 1., 'G': 1e3})).astype('int64')
+    # Flag MEM_PER_CPU, i.e. the highest bit of an unsigned 64-bit integer, stored as a signed one
+    mem_req = np.where(mem.per_coreOrNode == 'c', mem_MB + np.iinfo('int64').min, mem_MB)
+
+    if 'User' in jobs:
+        users = jobs.User.astype(object).fillna('')
+        accounts = jobs.Account.astype(object).fillna('')
+    else:
+        users = pd.Series('', index=jobs.index)
+        accounts = pd.Series('', index=jobs.index)
+    id_assoc, assocs = pd.factorize(pd.MultiIndex.from_arrays([users, accounts]))
+
+    job_table = pd.DataFrame({
+        'job_db_inx': np.arange(1, len(jobs) + 1),
+        'account': accounts.values,
+        'cpus_req': jobs.NCPUSX.values,
+        'id_array_job': np.where(isArray, ids.job.astype('int64'), 0),
+        'id_array_task': np.where(isArray, ids.task.fillna(0).astype('int64'), SlurmDBWorkloadManager.NO_VAL),
+        'id_assoc': id_assoc + 1,
+        'id_job': id_job,
+        'id_user': uid,
+        'job_name': jobs.JobNameX.astype(object).fillna('').values,
+        'mem_req': mem_req,
+        'nodes_alloc': jobs.NNodesX.values,
+        'partition': partitions.reindex(jobs.single_jobID.values).fillna('').values,
+        'state': state,
+        'time_submit': time_submit,
+        'time_start': time_start,
+        'time_end': time_end,
+        'work_dir': jobs.WorkingDirX.astype(object).fillna('').values,
+        'tres_alloc': '1=' + jobs.NCPUSX.astype(str) + ',4=' + jobs.NNodesX.astype(str),
+    })
+
+    ### Steps
+    job_position = pd.Series(np.arange(len(jobs)), index=jobs.single_jobID.values)
+    steps = steps.loc[steps.single_jobID.isin(job_position.index)].reset_index(drop=True)
+    steps_job = job_position[steps.single_jobID].values
+    stepName = steps.JobID.str.split('.', n=1).str[1]
+    id_step = stepName.map(step_ids)
+    id_step = id_step.fillna(pd.to_numeric(stepName, errors='coerce')).fillna(-6).astype('int64')
+
+    # CPU time of each job, put on its first step (with a batch step for jobs without steps)
+    cpu_us_jobs = jobs.TotalCPUtimeX.values.astype('timedelta64[us]').astype('int64')
+    cpu_us_steps = steps.TotalCPUtimeX.values.astype('timedelta64[us]').astype('int64')
+    np.maximum.at(cpu_us_jobs, steps_job, cpu_us_steps)
+    isFirst = ~pd.Series(steps_job).duplicated().values
+    cpu_us_steps = np.where(isFirst, cpu_us_jobs[steps_job], 0)
+
+    withoutSteps = np.setdiff1d(np.arange(len(jobs)), steps_job)
+    steps_job = np.concatenate([steps_job, withoutSteps])
+    id_step = np.concatenate([id_step.values, np.full(len(withoutSteps), step_ids['batch'])])
+    stepName = np.concatenate([stepName.values, np.full(len(withoutSteps), 'batch', dtype=object)])
+    cpu_us_steps = np.concatenate([cpu_us_steps, cpu_us_jobs[withoutSteps]])
+    stepState = np.concatenate([get_state_codes(steps.State), state[withoutSteps]])
+    stepFinished = np.concatenate([(steps.StateX != -1).values, finished[withoutSteps]])
+    stepElapsed = np.concatenate([
+        steps.WallclockTimeX.dt.total_seconds().astype('int64').values,
+        jobs.WallclockTimeX.dt.total_seconds().astype('int64').values[withoutSteps]
+    ])
+    # Memory usage in bytes, from the values in K displayed by sacct
+    usedMem_K = np.concatenate([np.round(steps.UsedMemX.values * 1e6), np.zeros(len(withoutSteps))]).astype('int64')
+
+    step_time_start = time_start[steps_job]
+    step_table = pd.DataFrame({
+        'job_db_inx': steps_job + 1,
+        'id_step': id_step,
+        'step_name': stepName,
+        'state': stepState,
+        'nodes_alloc': jobs.NNodesX.values[steps_job],
+        'time_start': step_time_start,
+        'time_end': np.where(stepFinished, step_time_start + stepElapsed, 0),
+        'user_sec': cpu_us_steps // 1000000,
+        'user_usec': cpu_us_steps % 1000000,
+        'tres_usage_in_max': np.where(usedMem_K > 0, '2=' + pd.Series(usedMem_K * 1024).astype(str), ''),
+    }).sort_values(['job_db_inx', 'id_step'], kind='stable')
+
+    assoc_table = pd.DataFrame({
+        'id_assoc': np.arange(1, len(assocs) + 1),
+        'user': assocs.get_level_values(0),
+        'acct': assocs.get_level_values(1),
+    })
+
+    return {'job_table': job_table, 'step_table': step_table, 'assoc_table': assoc_table}
+
+
+def write_slurmdb(tables, path, cluster):
+    '''
+    Write the tables in a new SQLite file.
+    :param tables: [dict] table name -> pd.DataFrame, from `convert_logs`
+    :param path: [str] SQLite file, replaced if it exists
+    :param cluster: [str] name of the cluster, i.e. the prefix of the tables
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    for name, df in tables.items():
+        table = f"{cluster}_{name}"
+        conn.execute(f"CREATE TABLE {table} ({schema[name]})")
+        conn.executemany(
+            f"INSERT INTO {table} ({','.join(f'`{x}`' for x in df.columns)}) VALUES ({','.join(['?'] * len(df.columns))})",
+            df.astype(object).itertuples(index=False, name=None)
+        )
+    conn.execute(f"CREATE INDEX {cluster}_job_table_submit ON {cluster}_job_table (time_submit)")
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Build a stand-in for the SLURM accounting database from usage logs in the format of sacct.')
+    parser.add_argument('logs', type=str, help='Usage logs, in the format of `sacct -P` (e.g. from generate_sacct.py)')
+    parser.add_argument('-o', '--output', type=str, required=True, help='SQLite file to create')
+    parser.add_argument('--cluster', type=str, default='cluster', help='Name of the cluster, i.e. the prefix of the tables (default: cluster)')
+    parser.add_argument('--uid', type=int, default=os.getuid(), help='User ID of the jobs (default: the current user)')
+    parser.add_argument('--clusterInfo', type=str,
+                        default=os.path.join(os.path.dirname(os.path.realpath(__file__)), 'cluster_info_benchmark.yaml'),
+                        help='cluster_info file with the partitions of the logs (default: cluster_info_benchmark.yaml)')
+    options = parser.parse_args()
+
+    with open(options.clusterInfo, 'r') as f:
+        cluster_info = yaml.safe_load(f)
+    write_slurmdb(convert_logs(options.logs, cluster_info, options.uid), options.output, options.cluster)
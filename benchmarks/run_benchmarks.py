@@ -0,0 +1,221 @@
+##
+## Benchmarks of the different stages of the calculator, on synthetic usage logs from generate_sacct.py
+##
+## Usage:
+##   python benchmarks/run_benchmarks.py --nJobs 10000 100000 --saveBaselines   # record the baselines
+##   python benchmarks/run_benchmarks.py --nJobs 10000 100000                   # fails if slower than the baselines, or without baselines
+##
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import subprocess
+import tracemalloc
+import yaml
+
+benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+repo_dir = os.path.dirname(benchmarks_dir)
+sys.path.insert(0, repo_dir)
+sys.path.insert(0, benchmarks_dir)
+
+import GreenAlgorithms_global as GA_global
+from GreenAlgorithms_workloadManager import WorkloadManager
+from generate_sacct import generate_sacct, get_parser as get_generator_parser
+
+
+def get_pipeline_args(logs_path, options):
+    '''
+    Arguments of the calculator, as if it was run on the whole period of the synthetic logs.
+    :param logs_path: [str] path to the synthetic logs
+    :param options: [Namespace] options of the benchmarks
+    :return: [Namespace]
+    '''
+    return argparse.Namespace(
+        startDay='2021-01-01',
+        endDay='2021-12-31',
+        useLoggedOutput=logs_path,
+        filterWD=None,
+        filterJobIDs='all',
+        shardDays=0,
+        allUsers=options.allUsers,
+    )
+
+
+def get_stages(args, cluster_info, fParams):
+    '''
+    The stages of `main()` in GreenAlgorithms_global.py, as functions to run one after the other.
+    :return: [list of (str, function)]
+    '''
+    state = {}
+
+    def pull_logs():
+        state['WM'] = WorkloadManager(args, cluster_info)
+        state['WM'].pull_logs()
+
+    def calculate_footprint():
+        state['GA'] = GA_global.GreenAlgorithms(df=state['WM'].df_agg, args=args, cluster_info=cluster_info, fParams=fParams)
+        state['GA'].calculate_footprint()
+
+    return [
+        ('pull_logs', pull_logs),
+        ('convert2dataframe', lambda: state['WM'].convert2dataframe()),
+        ('clean_logs_df', lambda: state['WM'].clean_logs_df()),
+        ('calculate_footprint', calculate_footprint),
+        ('generate_report', lambda: state['GA'].generate_report()),
+    ]
+
+
+def measure_stages(args, cluster_info, fParams, repeat):
+    '''
+    Time each stage (best of `repeat` runs), then measure the peak memory allocated by each stage (in a separate run,
+    as tracing allocations slows things down).
+    :return: [dict] stage -> {'wall_s', 'cpu_s', 'peak_MB'}
+    '''
+    results = {}
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        for _ in range(repeat):
+            for name, stage in get_stages(args, cluster_info, fParams):
+                wall, cpu = time.perf_counter(), time.process_time()
+                stage()
+                wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+                if (name not in results) or (wall < results[name]['wall_s']):
+                    results[name] = {'wall_s': wall, 'cpu_s': cpu}
+
+        tracemalloc.start()
+        for name, stage in get_stages(args, cluster_info, fParams):
+            tracemalloc.reset_peak()
+            start_MB = tracemalloc.get_traced_memory()[0] / 1e6
+            stage()
+            results[name]['peak_MB'] = tracemalloc.get_traced_memory()[1] / 1e6 - start_MB
+        tracemalloc.stop()
+
+    return results
+
+
+def measure_startup(repeat):
+    '''
+    Time to display --help (best of `repeat` runs), and check that pandas isn't imported at startup.
+    :return: [dict] {'wall_s'}
+    '''
+    pandas_imported = subprocess.run(
+        [sys.executable, '-c', "import sys, GreenAlgorithms_global; print('pandas' in sys.modules)"],
+        cwd=repo_dir, capture_output=True, text=True, check=True
+    ).stdout.strip()
+    assert pandas_imported == 'False', "pandas is imported at startup"
+
+    best = None
+    for _ in range(repeat):
+        wall = time.perf_counter()
+        subprocess.run([sys.executable, 'GreenAlgorithms_global.py', '--help'], cwd=repo_dir, capture_output=True, check=True)
+        wall = time.perf_counter() - wall
+        best = wall if best is None else min(best, wall)
+    return {'wall_s': best}
+
+
+def find_regressions(results, baselines, options):
+    '''
+    Compare the results with the baselines.
+    :return: [list of str] description of each regression (including the stages without baseline)
+    '''
+    L_regressions = []
+    for scenario, stages in results.items():
+        for name, metrics in stages.items():
+            baseline = baselines.get(scenario, {}).get(name)
+            if baseline is None:
+                L_regressions.append(f"{scenario} / {name}: no baseline, run with --saveBaselines first")
+                continue
+            # Small absolute margins, so that very short stages don't fail because of noise
+            if metrics['wall_s'] > baseline['wall_s'] * (1 + options.timeTolerance) + 0.02:
+                L_regressions.append(f"{scenario} / {name}: {metrics['wall_s']:.3f}s vs {baseline['wall_s']:.3f}s")
+            if ('peak_MB' in metrics) and (metrics['peak_MB'] > baseline['peak_MB'] * (1 + options.memoryTolerance) + 1):
+                L_regressions.append(f"{scenario} / {name}: {metrics['peak_MB']:.1f}MB vs {baseline['peak_MB']:.1f}MB")
+    return L_regressions
+
+
+def main(options):
+    with open(options.clusterInfo, 'r') as f:
+        cluster_info = yaml.safe_load(f)
+    with open(os.path.join(repo_dir, 'fixed_parameters.yaml'), 'r') as f:
+        fParams = yaml.safe_load(f)
+
+    results = {'startup': {'help': measure_startup(options.repeat)}}
+    if results['startup']['help']['wall_s'] > options.startupBudget:
+        print(f"Startup above budget: {results['startup']['help']['wall_s']:.3f}s > {options.startupBudget:.3f}s")
+        over_budget = True
+    else:
+        over_budget = False
+
+    os.makedirs(options.dataDir, exist_ok=True)
+    for nJobs in options.nJobs:
+        scenario = f"{nJobs}jobs_fanout{options.stepFanout}{'_allUsers' if options.allUsers else ''}"
+        logs_path = os.path.join(options.dataDir, f"sacct_{scenario}_seed{options.seed}.txt")
+        if not os.path.exists(logs_path):
+            generator_options = get_generator_parser().parse_args([
+                '--nJobs', str(nJobs), '--stepFanout', str(options.stepFanout), '--seed', str(options.seed),
+                '--clusterInfo', options.clusterInfo
+            ] + (['--allUsers'] if options.allUsers else []))
+            with open(logs_path, 'w', newline='') as f:
+                generate_sacct(generator_options, f)
+
+        args = get_pipeline_args(os.path.abspath(logs_path), options)
+        results[scenario] = measure_stages(args, cluster_info, fParams, options.repeat)
+
+    ### Display
+    for scenario, stages in results.items():
+        print(f"\n{scenario}")
+        for name, metrics in stages.items():
+            memory = f"{metrics['peak_MB']:10.1f} MB" if 'peak_MB' in metrics else ''
+            cpu = f"{metrics['cpu_s']:8.3f}s CPU" if 'cpu_s' in metrics else ''
+            print(f"  {name:22} {metrics['wall_s']:8.3f}s {cpu:13} {memory}")
+
+    ### Baselines
+    if options.saveBaselines:
+        baselines = {}
+        if os.path.exists(options.baselines):
+            with open(options.baselines, 'r') as f:
+                baselines = json.load(f)
+        baselines.update(results)
+        with open(options.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2)
+        print(f"\nBaselines saved in {options.baselines}")
+        return 1 if over_budget else 0
+
+    # The baselines depend on the machine, so they are not shipped: without them, nothing can be checked
+    if not os.path.exists(options.baselines):
+        print(f"\nNo baselines found in {options.baselines}, run with --saveBaselines first.", file=sys.stderr)
+        return 1
+
+    with open(options.baselines, 'r') as f:
+        baselines = json.load(f)
+    L_regressions = find_regressions(results, baselines, options)
+    if len(L_regressions) > 0:
+        print("\nPerformance regressions:\n  " + "\n  ".join(L_regressions))
+        return 1
+    print("\nNo performance regression.")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the calculator on synthetic usage logs.')
+    parser.add_argument('--nJobs', type=int, nargs='+', default=[10000, 100000], help='Number of jobs of each scenario (default: 10000 100000)')
+    parser.add_argument('--stepFanout', type=int, default=3, help='Maximum number of steps per job (default: 3)')
+    parser.add_argument('--allUsers', action='store_true', help='Include the User and Account fields, as with --allUsers')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generator (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of runs, the best time is kept (default: 3)')
+    parser.add_argument('--timeTolerance', type=float, default=0.25,
+                        help='Relative slowdown above which a stage is considered to have regressed (default: 0.25)')
+    parser.add_argument('--memoryTolerance', type=float, default=0.1,
+                        help='Relative increase in peak memory above which a stage is considered to have regressed (default: 0.1)')
+    parser.add_argument('--startupBudget', type=float, default=0.3,
+                        help='Maximum time, in seconds, to display --help (default: 0.3)')
+    parser.add_argument('--clusterInfo', type=str, default=os.path.join(benchmarks_dir, 'cluster_info_benchmark.yaml'),
+                        help='cluster_info file used for the benchmarks (default: cluster_info_benchmark.yaml)')
+    parser.add_argument('--dataDir', type=str, default=os.path.join(benchmarks_dir, 'data'),
+                        help='Where the synthetic logs are generated (default: benchmarks/data)')
+    parser.add_argument('--baselines', type=str, default=os.path.join(benchmarks_dir, 'baselines.json'),
+                        help='File with the baselines (default: benchmarks/baselines.json)')
+    parser.add_argument('--saveBaselines', action='store_true', help='Save the results as the new baselines')
+    sys.exit(main(parser.parse_args()))
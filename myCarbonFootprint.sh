@@ -12,31 +12,23 @@ cd "$parent_path"
 # The only requirement for the module is to start python 3.7 or later
 module load miniconda/3
 
-# Test if the python version is at least 3.7
-version_major=$(python3 -c 'import sys; print(sys.version_info[0])')
-version_minor=$(python3 -c 'import sys; print(sys.version_info[1])')
-if (( $version_major < 3 )); then
-  echo "The command python3 needs to refer to python 3"
-  exit 1
+# If the virtualenv GA_env already exists, its python has already been checked,
+# so it is started directly (only one python process, and no need to activate the virtualenv)
+if [ -f GA_env/bin/python3 ]; then
+  exec GA_env/bin/python3 GreenAlgorithms_global.py "$@"
 fi
 
-if (( $version_minor < 7 )); then
+# Test if the python version is at least 3.7
+if ! python3 -c 'import sys; sys.exit(0 if sys.version_info >= (3, 7) else 1)'; then
   echo "The command python3 needs to refer to python3.7 or higher."
   exit 1
 fi
 
 echo "Python versions: OK"
 
-# Test if the virtualenv GA_env already exists, and if not, creates it.
-if [ ! -f GA_env/bin/activate ]; then
-  echo "Need to create virtualenv"
-  python3 -m venv GA_env
-  source GA_env/bin/activate
-  pip3 install -r requirements.txt
-else
-  echo "Virtualenv: OK"
-  source GA_env/bin/activate
-fi
+# Create the virtualenv GA_env
+echo "Need to create virtualenv"
+python3 -m venv GA_env
+GA_env/bin/pip3 install -r requirements.txt
 
-# Check that python3 starts the correct version
-python3 GreenAlgorithms_global.py "$@"
+GA_env/bin/python3 GreenAlgorithms_global.py "$@"
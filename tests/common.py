@@ -0,0 +1,69 @@
+import os
+import argparse
+
+import yaml
+
+from GreenAlgorithms_workloadManager import WorkloadManager
+from GreenAlgorithms_global import GreenAlgorithms
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(tests_dir)
+data_dir = os.path.join(tests_dir, 'data')
+
+# Small sacct output with the edge cases of the cleaning (steps, job arrays, duration and memory formats, partitions...)
+sacct_jobs_path = os.path.join(data_dir, 'sacct_jobs.txt')
+
+
+def load_cluster_info():
+    with open(os.path.join(data_dir, 'cluster_info.yaml')) as f:
+        return yaml.safe_load(f)
+
+
+def load_fParams():
+    with open(os.path.join(repo_dir, 'fixed_parameters.yaml')) as f:
+        return yaml.safe_load(f)
+
+
+def make_args(**kwargs):
+    '''
+    Arguments of the calculator, replaying `sacct_jobs_path` by default.
+    '''
+    args = dict(
+        startDay='2021-01-01', endDay='2021-12-31', useLoggedOutput=sacct_jobs_path, filterWD=None, filterJobIDs='all',
+        reportBug=False, reportBugHere=False, allUsers=False, stream=False, chunkSize=100000, shardDays=0, shardWorkers=4,
+        workers=1,
+    )
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+def pull_df_agg_0(args, cluster_info):
+    '''
+    Jobs aggregated from the usage logs, before `process_df_agg`, as in `pull_jobs` (with --stream or not).
+    :return: [WorkloadManager] with `df_agg_0`
+    '''
+    WM = WorkloadManager(args, cluster_info)
+    if args.stream:
+        WM.stream_logs()
+    else:
+        WM.pull_logs()
+        WM.convert2dataframe()
+        WM.filter_logs_df()
+        WM.clean_columns(WM.logs_df)
+        WM.df_agg_0 = WM.aggregate_per_job(WM.logs_df)
+    return WM
+
+
+def calculate_footprint(args=None, cluster_info=None, fParams=None):
+    '''
+    Footprint of the jobs of `sacct_jobs_path`, as in `main`.
+    :return: [GreenAlgorithms] with the footprints calculated
+    '''
+    args = make_args() if args is None else args
+    cluster_info = load_cluster_info() if cluster_info is None else cluster_info
+    fParams = load_fParams() if fParams is None else fParams
+    WM = pull_df_agg_0(args, cluster_info)
+    WM.process_df_agg()
+    GA = GreenAlgorithms(df=WM.df_agg, args=args, cluster_info=cluster_info, fParams=fParams)
+    GA.calculate_footprint()
+    return GA
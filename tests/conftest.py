@@ -0,0 +1,5 @@
+import os
+import sys
+
+# So that the scripts can be imported when the tests are run with `pytest` from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from common import load_cluster_info, calculate_footprint
+
+
+class TestCITimeseries(unittest.TestCase):
+    '''
+    Mean carbon intensity of the jobs from a time series (`calculate_CI_column`, with the integral from `integrate_CI`).
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.GA = calculate_footprint()
+        # Hourly values over the period of the jobs of tests/data/sacct_jobs.txt
+        self.datetimes = pd.date_range('2021-03-01 06:00', '2021-03-10 12:00', freq='60min')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_timeseries(self, CI):
+        path = os.path.join(self.tmp_dir, f'CI_{len(os.listdir(self.tmp_dir))}.csv')
+        pd.DataFrame({'datetime': self.datetimes.strftime('%Y-%m-%d %H:%M:%S'), 'CI': CI}).to_csv(path, index=False)
+        return path
+
+    def calculate_CI_column(self, df, CI):
+        cluster_info = {**self.GA.cluster_info, 'CI_timeseries': self.write_timeseries(CI)}
+        return self.GA.calculate_CI_column(df, cluster_info=cluster_info)
+
+    def brute_force_CI(self, df, CI):
+        '''
+        Mean carbon intensity while each job was running, from the value at the middle of each second of the run.
+        '''
+        times = self.datetimes.values.astype('datetime64[s]').astype('int64')
+        L_CI = []
+        for start, wallclock in zip(df.SubmitDatetimeX, df.WallclockTimeX):
+            start_s = pd.Timestamp(start).to_datetime64().astype('datetime64[s]').astype('int64')
+            t = start_s + np.arange(max(int(wallclock.total_seconds()), 1)) + 0.5
+            # Value of the hour each second is in, the first and last values before and after the time series
+            i = np.clip(np.floor((t - times[0]) / 3600).astype('int64'), 0, len(times) - 1)
+            L_CI.append(np.asarray(CI)[i].mean())
+        return np.array(L_CI)
+
+    def test_constant(self):
+        # A constant time series gives the same carbon intensity, and footprint, as the value in cluster_info.yaml
+        CI = self.GA.cluster_info['CI']
+        np.testing.assert_allclose(self.calculate_CI_column(self.GA.df, np.full(len(self.datetimes), CI)), CI, rtol=1e-12)
+
+        cluster_info = load_cluster_info()
+        cluster_info['CI_timeseries'] = self.write_timeseries(np.full(len(self.datetimes), CI))
+        GA_timeseries = calculate_footprint(cluster_info=cluster_info)
+        np.testing.assert_allclose(GA_timeseries.df.carbonFootprint, self.GA.df.carbonFootprint, rtol=1e-12)
+
+    def test_steps(self):
+        CI = np.random.default_rng(0).integers(50, 500, len(self.datetimes)).astype('float64')
+        df = pd.concat([self.GA.df[['SubmitDatetimeX', 'WallclockTimeX']], pd.DataFrame({
+            # Instantaneous job, and jobs starting before and ending after the time series
+            'SubmitDatetimeX': pd.to_datetime(['2021-03-05 10:20', '2021-03-01 05:00', '2021-03-10 12:30']),
+            'WallclockTimeX': pd.to_timedelta(['0', '3h', '1h']),
+        })], ignore_index=True)
+        np.testing.assert_allclose(self.calculate_CI_column(df, CI), self.brute_force_CI(df, CI), rtol=1e-9)
+
+
+if __name__ == '__main__':
+    unittest.main()
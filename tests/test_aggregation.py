@@ -0,0 +1,49 @@
+import unittest
+
+import pandas as pd
+
+from common import make_args, load_cluster_info, pull_df_agg_0
+
+# Jobs of tests/data/sacct_jobs.txt once cleaned and aggregated (`df_agg_0`)
+columns = [
+    'single_jobID', 'TotalCPUtimeX', 'WallclockTimeX', 'ReqMemX', 'UsedMemX', 'NCPUSX', 'NNodesX',
+    'PartitionX', 'JobNameX', 'SubmitDatetimeX', 'WorkingDirX', 'StateX'
+]
+expected_jobs = [
+    # Steps with durations as MM:SS and with milliseconds, and MaxRSS in K, M and G: the maximum of the steps
+    ('2001', '18:45:10', '02:30:00', 32., 6.5, 8, 1, 'partition_1', 'align', '2021-03-01 08:00:00', '/home/a', 1),
+    # Job array, with a MaxRSS without unit (default_unit_RSS) and memory requested per node
+    ('2002_1', '3 days 10:00:00', '1 days 02:00:00', 16., 12., 4, 1, 'partition_1', 'sweep', '2021-03-02 10:00:00', '/home/b', 1),
+    ('2002_2', '00:19:30', '00:05:00', 16., 0., 4, 1, 'partition_1', 'sweep', '2021-03-02 10:00:00', '/home/b', 0),
+    ('2003', '5 days', '10:00:00', 64., 40., 16, 1, 'partition_2', 'train', '2021-03-03 12:00:00', '/home/a', 1),
+    # Submitted to 2 partitions (the first one is kept), out of memory, and memory requested per core
+    ('2004', '2 days 12:00:00', '03:00:00', 48., 47., 24, 2, 'partition_1', 'mixed', '2021-03-04 09:00:00', '/home/a', 0),
+    # The partition is only on the line of a step
+    ('2005', '00:39:00', '00:20:00', 8., 3., 2, 1, 'partition_3', 'steppart', '2021-03-05 15:30:00', '/scratch/c', 0),
+    ('2006', '0', '0', 1., 0., 1, 1, 'partition_1', 'queued', '2021-03-06 11:00:00', '/home/a', -1),
+    ('2007', '03:00:00', '01:00:00', 32., 10., 4, 1, 'partition_2', 'running', '2021-03-06 12:00:00', '/home/b', -1),
+    ('2008_7', '11:59:00', '12:00:00', 3., 2.9, 1, 1, 'partition_3', 'sweep2', '2021-03-07 07:00:00', '/home/a', 0),
+    ('2009', '40 days', '2 days', 256., 120., 32, 2, 'partition_2', 'late', '2021-03-08 23:50:00', '/home/b', 1),
+]
+
+
+class TestAggregatePerJob(unittest.TestCase):
+    '''
+    Jobs aggregated from their steps by `aggregate_per_job`.
+    '''
+
+    def test_df_agg_0(self):
+        df_agg_0 = pull_df_agg_0(make_args(), load_cluster_info()).df_agg_0
+
+        expected = pd.DataFrame(expected_jobs, columns=columns).set_index('single_jobID')
+        for x in ['TotalCPUtimeX', 'WallclockTimeX']:
+            expected[x] = pd.to_timedelta(expected[x])
+        expected['SubmitDatetimeX'] = pd.to_datetime(expected.SubmitDatetimeX)
+        pd.testing.assert_frame_equal(
+            df_agg_0.astype({'JobNameX': object, 'WorkingDirX': object}), expected,
+            check_dtype=False, check_index_type=False
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
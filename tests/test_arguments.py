@@ -0,0 +1,62 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from GreenAlgorithms_global import load_yaml, load_scenarios, load_uncertainty
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestScenariosAndUncertainty(unittest.TestCase):
+    '''
+    The files of --scenarios and --uncertainty are checked before pulling the jobs.
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # No sacct in the PATH: the script must stop before pulling the jobs
+        self.env = dict(os.environ, XDG_CACHE_HOME=self.tmp_dir, PATH=os.path.dirname(sys.executable))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def run_script(self, *args):
+        return subprocess.run(
+            [sys.executable, 'GreenAlgorithms_global.py', '--noServer'] + list(args),
+            cwd=repo_dir, env=self.env, capture_output=True, text=True
+        )
+
+    def test_shipped_files(self):
+        cluster_info = load_yaml(os.path.join(repo_dir, 'cluster_info.yaml'))
+        self.assertGreater(len(load_scenarios(os.path.join(repo_dir, 'scenarios.yaml'), cluster_info)), 0)
+        self.assertEqual(load_uncertainty(os.path.join(repo_dir, 'uncertainty.yaml'))['confidence'], 0.95)
+
+    def test_missing_files(self):
+        for option in ['--scenarios', '--uncertainty']:
+            process = self.run_script(option, os.path.join(self.tmp_dir, 'missing.yaml'))
+            self.assertEqual(process.returncode, 2)
+            self.assertIn(f"error: {option}: ", process.stderr)
+            self.assertNotIn('Traceback', process.stderr)
+
+    def test_unknown_partition(self):
+        path = os.path.join(self.tmp_dir, 'scenarios.yaml')
+        with open(path, 'w') as f:
+            f.write("- name: Newer GPUs\n  partitions:\n    unknown_partition:\n      TDP: 200\n")
+        process = self.run_script('--scenarios', path)
+        self.assertEqual(process.returncode, 2)
+        self.assertIn("Unrecognised partition in scenario Newer GPUs: unknown_partition", process.stderr)
+
+    def test_invalid_distribution(self):
+        path = os.path.join(self.tmp_dir, 'uncertainty.yaml')
+        with open(path, 'w') as f:
+            f.write("PUE:\n  distribution: normal\n")
+        process = self.run_script('--uncertainty', path)
+        self.assertEqual(process.returncode, 2)
+        self.assertIn("Missing for the distribution of PUE: sd", process.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
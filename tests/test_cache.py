@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from GreenAlgorithms_cache import JobsCache
+
+
+class TestJobsCacheLoad(unittest.TestCase):
+    '''
+    Selection of the cached jobs running during a period, compared with the selection of sacct (see `JobsCache.load`).
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = JobsCache(os.path.join(self.tmp_dir, 'jobs.sqlite'), {'cluster_name': 'test'})
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def add_job(self, jobID, submit, wallclock_hours):
+        df_agg = pd.DataFrame({
+            'single_jobID': [jobID],
+            'TotalCPUtimeX': [pd.Timedelta(hours=wallclock_hours)],
+            'WallclockTimeX': [pd.Timedelta(hours=wallclock_hours)],
+            'ReqMemX': [1.],
+            'UsedMemX': [1.],
+            'NCPUSX': [1],
+            'NNodesX': [1],
+            'PartitionX': ['partition_1'],
+            'JobNameX': ['job'],
+            'SubmitDatetimeX': [pd.Timestamp(submit)],
+            'WorkingDirX': ['/home/user'],
+            'StateX': [1],
+        }).set_index('single_jobID')
+        self.cache.update(df_agg, [('2021-01-01', '2021-02-01')])
+
+    def test_jobs_running_during_the_period(self):
+        self.add_job('1', '2021-01-04 20:00:00', 10)  # ends on 2021-01-05, as sacct
+        self.add_job('2', '2021-01-09 12:00:00', 1)  # runs during the period, as sacct
+        self.add_job('3', '2021-01-10 12:00:00', 1)  # submitted after the end, as sacct
+        self.add_job('4', '2021-01-03 12:00:00', 1)  # finished before the start, as sacct
+        self.assertEqual(list(self.cache.load('2021-01-05', '2021-01-10').index), ['1', '2'])
+
+    def test_queued_job_ending_after_the_start(self):
+        # Submitted on 2021-01-01 but only started on 2021-01-06 after waiting in the queue: sacct returns it for
+        # the period starting on 2021-01-05, but the start time isn't cached, so it is considered to have ended on 2021-01-01.
+        self.add_job('1', '2021-01-01 00:00:00', 1)
+        self.assertEqual(len(self.cache.load('2021-01-05', '2021-01-10')), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from GreenAlgorithms_workloadManager import Helpers_WM
+
+
+class TestCleaningColumns(unittest.TestCase):
+    '''
+    The vectorised cleaning of the usage logs (`*_column`) gives exactly the same values as the row-wise version.
+    '''
+
+    def setUp(self):
+        self.helpers = Helpers_WM()
+
+    def assert_same_values(self, L_inputs, row_values, column_values):
+        for x, row_value, column_value in zip(L_inputs, row_values, column_values):
+            with self.subTest(x=x):
+                self.assertEqual(column_value, row_value)
+
+    def test_parse_timedelta(self):
+        L_durations = ['45:12', '03:00.125', '10:02:03.250', '2-03:04:05.678', '1-00:00:00', '12:30:00', '7', '00:00:00.5']
+        x = pd.Series(L_durations)
+        self.assert_same_values(
+            L_durations,
+            [pd.Timedelta(self.helpers.parse_timedelta(d)) for d in L_durations],
+            self.helpers.parse_timedelta_column(x)
+        )
+
+    def test_clean_RSS(self):
+        cluster_info = {'default_unit_RSS': 'K'}
+        L_RSS = ['5242880K', '6.5G', '300M', '12000000', '0', np.nan]  # NaN: empty in sacct output
+        x = pd.Series(L_RSS, dtype=object)
+        self.assert_same_values(
+            L_RSS,
+            [self.helpers.clean_RSS(rss, cluster_info) for rss in L_RSS],
+            self.helpers.clean_RSS_column(x, cluster_info)
+        )
+
+    def test_clean_RSS_without_default_unit(self):
+        for clean_RSS in [lambda x: [self.helpers.clean_RSS(y, {}) for y in x], lambda x: self.helpers.clean_RSS_column(x, {})]:
+            with self.assertRaisesRegex(AssertionError, 'default_unit_RSS'):
+                clean_RSS(pd.Series(['12000000']))
+
+    def test_calc_ReqMem(self):
+        df = pd.DataFrame({
+            'ReqMem': ['4Gc', '16Gn', '2000Mc', '512Kn', '0.5Gn', '3.2Gc'],
+            'NNodes': [1, 2, 1, 1, 3, 2],
+            'NCPUS': [8, 4, 3, 1, 1, 6],
+        })
+        self.assert_same_values(
+            df.ReqMem,
+            df.apply(self.helpers.calc_ReqMem, axis=1),
+            self.helpers.calc_ReqMem_column(df)
+        )
+
+    def test_calc_realMemNeeded(self):
+        df = pd.DataFrame({
+            'ReqMemX': [32., 32., 4., 12., 12., 6., 0.1],
+            'UsedMemX': [6.5, 0., 5., 12., 11.99, 6., 0.05],
+        })
+        self.assert_same_values(
+            list(zip(df.ReqMemX, df.UsedMemX)),
+            df.apply(self.helpers.calc_realMemNeeded, granularity_memory_request=6, axis=1),
+            self.helpers.calc_realMemNeeded_column(df, granularity_memory_request=6)
+        )
+
+    def test_get_parent_jobID(self):
+        L_jobIDs = ['2001', '2002_1', '2008_7', '123456789_0', '123456789_[1-10]']
+        x = pd.Series(L_jobIDs)
+        self.assert_same_values(
+            L_jobIDs,
+            [self.helpers.get_parent_jobID(jobID) for jobID in L_jobIDs],
+            self.helpers.get_parent_jobID_column(x)
+        )
+        for get_parent_jobID in [self.helpers.get_parent_jobID, lambda x: self.helpers.get_parent_jobID_column(pd.Series([x]))]:
+            with self.assertRaisesRegex(AssertionError, "Can't parse the job ID"):
+                get_parent_jobID('1_2_3')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from GreenAlgorithms_global import GreenAlgorithms
+from common import make_args, load_cluster_info, load_fParams, pull_df_agg_0
+
+
+class TestEnergies(unittest.TestCase):
+    '''
+    `calculate_energies_column` gives exactly the same energies as the row-wise `calculate_energies`.
+    '''
+
+    def setUp(self):
+        args = make_args()
+        cluster_info = load_cluster_info()
+        WM = pull_df_agg_0(args, cluster_info)
+        WM.process_df_agg()
+        self.GA = GreenAlgorithms(df=WM.df_agg, args=args, cluster_info=cluster_info, fParams=load_fParams())
+
+    def test_same_energies(self):
+        df = self.GA.df.set_index('single_jobID')
+        # CPU and GPU jobs (one of them on 2 nodes), and a job submitted to 2 partitions
+        self.assertEqual(set(df.PartitionX), {'partition_1', 'partition_2', 'partition_3'})
+        self.assertEqual(df.loc['2004', 'PartitionX'], 'partition_1')
+
+        df_column = self.GA.calculate_energies_column(df)
+        df_row = df.apply(self.GA.calculate_energies, axis=1)
+        for x in ['energy_CPUs', 'energy_GPUs', 'energy_memory', 'energy', 'energy_memory_memoryNeededOnly', 'energy_memoryNeededOnly']:
+            for jobID in df.index:
+                with self.subTest(x=x, jobID=jobID):
+                    self.assertEqual(df_column.loc[jobID, x], df_row.loc[jobID, x])
+
+
+if __name__ == '__main__':
+    unittest.main()
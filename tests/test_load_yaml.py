@@ -0,0 +1,66 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from GreenAlgorithms_global import load_yaml
+
+
+class TestLoadYaml(unittest.TestCase):
+    '''
+    Cache of the yaml files (as json) used by `load_yaml`.
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ['XDG_CACHE_HOME'] = self.tmp_dir
+        self.cache_path = os.path.join(self.tmp_dir, 'GreenAlgorithms4HPC', 'config_cache.json')
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def read_cache(self):
+        with open(self.cache_path) as f:
+            return json.load(f)
+
+    def test_cached(self):
+        path = self.write('a.yaml', "PUE: 1.67\npartitions:\n  partition_1:\n    TDP: 10\n")
+        content = {'PUE': 1.67, 'partitions': {'partition_1': {'TDP': 10}}}
+        self.assertEqual(load_yaml(path), content)
+        self.assertEqual(self.read_cache()[path]['content'], content)
+        self.assertEqual(load_yaml(path), content)
+
+    def test_non_string_keys(self):
+        path = self.write('a.yaml', "partitions:\n  1:\n    TDP: 10\n")
+        self.assertEqual(load_yaml(path), {'partitions': {1: {'TDP': 10}}})
+        self.assertNotIn(path, self.read_cache())
+        # Still the same keys the second time
+        self.assertEqual(load_yaml(path), {'partitions': {1: {'TDP': 10}}})
+
+    def test_modified_and_removed_files(self):
+        path_a = self.write('a.yaml', "PUE: 1.67\n")
+        path_b = self.write('b.yaml', "PUE: 1.2\n")
+        load_yaml(path_a)
+        load_yaml(path_b)
+        self.write('b.yaml', "PUE: 1.25\n")
+        os.remove(path_a)
+        path_c = self.write('c.yaml', "PUE: 1.1\n")
+        load_yaml(path_c)
+        self.assertEqual(sorted(self.read_cache()), [path_c])
+        self.assertEqual(load_yaml(path_b), {'PUE': 1.25})
+        self.assertEqual(sorted(self.read_cache()), [path_b, path_c])
+        self.assertEqual(os.listdir(os.path.dirname(self.cache_path)), ['config_cache.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
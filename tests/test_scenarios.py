@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from common import load_cluster_info, calculate_footprint
+
+rtol = 1e-12
+
+
+class TestScenarios(unittest.TestCase):
+    '''
+    Footprints of the what-if scenarios (`calculate_scenarios`), calculated from the sums of the jobs per partition and state.
+    '''
+
+    def setUp(self):
+        self.GA = calculate_footprint()
+
+    def get_totals(self, GA):
+        '''
+        Totals of the jobs, as in a row of `calculate_scenarios`.
+        '''
+        df = GA.df
+        return np.array([
+            df.energy.sum(),
+            df.carbonFootprint.sum(),
+            (df.carbonFootprint - df.carbonFootprint_memoryNeededOnly).sum(),
+            df.carbonFootprint.where(df.StateX == 0, 0).sum(),
+        ])
+
+    def get_scenario(self, summary, name):
+        return summary.loc[name, ['energy', 'carbonFootprint', 'carbonFootprint_memoryWaste', 'carbonFootprint_failed']].values.astype('float64')
+
+    def test_identity(self):
+        cluster_info = self.GA.cluster_info
+        scenario = {
+            'name': 'Same', 'PUE': cluster_info['PUE'], 'CI': cluster_info['CI'],
+            'granularity_memory_request': cluster_info['granularity_memory_request'],
+            'power_memory_perGB': self.GA.fParams['power_memory_perGB'],
+            'partitions': {'partition_2': {'TDP': cluster_info['partitions']['partition_2']['TDP']}},
+        }
+        summary = self.GA.calculate_scenarios([scenario])
+        totals = self.get_totals(self.GA)
+        for name in ['Current', 'Same']:
+            with self.subTest(name=name):
+                np.testing.assert_allclose(self.get_scenario(summary, name), totals, rtol=rtol)
+        self.assertEqual(summary.loc['Same', 'change'], 0)
+
+    def test_PUE_linear(self):
+        PUE = self.GA.cluster_info['PUE']
+        summary = self.GA.calculate_scenarios([{'name': 'Double', 'PUE': 2 * PUE}, {'name': 'Perfect', 'PUE': 1}])
+        np.testing.assert_allclose(self.get_scenario(summary, 'Double'), 2 * self.get_scenario(summary, 'Current'), rtol=rtol)
+        np.testing.assert_allclose(self.get_scenario(summary, 'Perfect'), self.get_scenario(summary, 'Current') / PUE, rtol=rtol)
+
+    def test_same_as_rerun(self):
+        # Each scenario gives the same footprint as calculating it again from the jobs with the cluster_info it describes
+        L_scenarios = [
+            {'name': 'Granularity', 'granularity_memory_request': 4},
+            {'name': 'Fine granularity', 'granularity_memory_request': 0.5},
+            {'name': 'Other', 'CI': 100, 'PUE': 1.2, 'partitions': {'partition_2': {'TDP': 300, 'TDP_CPU': 10}}},
+        ]
+        summary = self.GA.calculate_scenarios(L_scenarios)
+        for name in ['Granularity', 'Fine granularity']:
+            self.assertNotEqual(summary.loc[name, 'carbonFootprint_memoryWaste'], summary.loc['Current', 'carbonFootprint_memoryWaste'])
+        for scenario in L_scenarios:
+            with self.subTest(name=scenario['name']):
+                cluster_info = load_cluster_info()
+                cluster_info.update({x: y for x, y in scenario.items() if x not in ['name', 'partitions']})
+                for partition, partition_info in scenario.get('partitions', {}).items():
+                    cluster_info['partitions'][partition].update(partition_info)
+                totals = self.get_totals(calculate_footprint(cluster_info=cluster_info))
+                np.testing.assert_allclose(self.get_scenario(summary, scenario['name']), totals, rtol=rtol)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from GreenAlgorithms_workloadManager import WorkloadManager, SacctError
+from common import make_args, load_cluster_info, sacct_jobs_path
+
+# Stub of sacct: returns the lines of STUB_SACCT_SRC submitted from 5 days before --starttime (jobs still running
+# at the start) to --endtime, so that consecutive windows overlap, and fails if --starttime is STUB_SACCT_FAIL.
+stub_sacct = '''#!{python}
+import os, sys, datetime
+args = sys.argv
+start, end = args[args.index('--starttime') + 1], args[args.index('--endtime') + 1]
+if os.environ.get('STUB_SACCT_FAIL') == start:
+    print('sacct: error: Problem talking to the database: Connection refused', file=sys.stderr)
+    sys.exit(1)
+start = datetime.datetime.strptime(start, '%Y-%m-%d') - datetime.timedelta(days=5)
+end = datetime.datetime.strptime(end, '%Y-%m-%d')
+with open(os.environ['STUB_SACCT_SRC']) as f:
+    lines = f.read().splitlines()
+print(lines[0])
+for line in lines[1:]:
+    if start <= datetime.datetime.strptime(line.split('|')[2], '%Y-%m-%dT%H:%M:%S') <= end:
+        print(line)
+'''
+
+
+class TestSharding(unittest.TestCase):
+    '''
+    Pulling the usage logs with one sacct call per window of --shardDays days (see `WorkloadManager.pull_logs_sharded`).
+    '''
+
+    def setUp(self):
+        self.bin_dir = tempfile.mkdtemp()
+        sacct_path = os.path.join(self.bin_dir, 'sacct')
+        with open(sacct_path, 'w') as f:
+            f.write(stub_sacct.format(python=sys.executable))
+        os.chmod(sacct_path, 0o755)
+        env = {'PATH': self.bin_dir + os.pathsep + os.environ.get('PATH', ''), 'STUB_SACCT_SRC': sacct_jobs_path}
+        self.patcher = mock.patch.dict(os.environ, env)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        shutil.rmtree(self.bin_dir)
+
+    def pull_logs(self, **kwargs):
+        args = make_args(useLoggedOutput='', startDay='2021-03-01', endDay='2021-03-10', **kwargs)
+        WM = WorkloadManager(args, load_cluster_info())
+        WM.pull_logs()
+        return WM.logs_raw
+
+    def test_split_period(self):
+        WM = WorkloadManager(make_args(startDay='2021-01-01', endDay='2021-01-10'), load_cluster_info())
+        self.assertEqual(
+            WM.split_period(4),
+            [('2021-01-01', '2021-01-05'), ('2021-01-05', '2021-01-09'), ('2021-01-09', '2021-01-10')]
+        )
+        self.assertEqual(WM.split_period(9), [('2021-01-01', '2021-01-10')])
+        self.assertEqual(WM.split_period(30), [('2021-01-01', '2021-01-10')])
+
+    def test_overlapping_windows(self):
+        # Each job is returned by several windows, but only kept once, in the same order as with a single call
+        logs_raw = self.pull_logs(shardDays=2)
+        self.assertEqual(logs_raw, self.pull_logs())
+        L_jobIDs = [line.split(b'|', 1)[0] for line in logs_raw.splitlines()[1:]]
+        self.assertEqual(len(L_jobIDs), 25)
+        self.assertEqual(len(set(L_jobIDs)), len(L_jobIDs))
+
+    def test_failing_window(self):
+        with mock.patch.dict(os.environ, {'STUB_SACCT_FAIL': '2021-03-05'}):
+            with self.assertRaisesRegex(SacctError, 'from 2021-03-05 to 2021-03-07 .*Connection refused'):
+                self.pull_logs(shardDays=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from GreenAlgorithms_global import GreenAlgorithms
+from GreenAlgorithms_slurmdb import SlurmDBWorkloadManager
+from common import repo_dir, sacct_jobs_path, make_args, load_cluster_info, load_fParams, pull_df_agg_0
+
+sys.path.insert(0, os.path.join(repo_dir, 'benchmarks'))
+import generate_slurmdb
+
+# The database stores elapsed times in seconds (so they lose their milliseconds), and memory requested in MB
+tolerance_durations = pd.Timedelta(seconds=1)
+tolerance_ReqMem = 1e-3  # in GB
+# Relative tolerance on the other values, e.g. memory usage that goes through bytes
+rtol = 1e-9
+
+
+class TestSlurmDB(unittest.TestCase):
+    '''
+    The jobs read from the stand-in for the SLURM database (see benchmarks/generate_slurmdb.py) with --slurmDB
+    are the same as the ones read from the sacct output it was generated from (--useLoggedOutput).
+    '''
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cluster_info = load_cluster_info()
+        self.slurmDB_path = os.path.join(self.tmp_dir, 'slurm.sqlite')
+        tables = generate_slurmdb.convert_logs(sacct_jobs_path, self.cluster_info, os.getuid())
+        generate_slurmdb.write_slurmdb(tables, self.slurmDB_path, 'test')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def calculate_footprints(self):
+        '''
+        :return: [tuple of pd.DataFrame] the finished jobs with their footprints, from sacct output and from the database
+        '''
+        L_df = []
+        for WM in [
+            pull_df_agg_0(make_args(), self.cluster_info),
+            SlurmDBWorkloadManager(make_args(useLoggedOutput='', slurmDB=self.slurmDB_path), self.cluster_info),
+        ]:
+            if isinstance(WM, SlurmDBWorkloadManager):
+                WM.pull_logs()
+                WM.convert2dataframe()
+                WM.clean_logs_df()
+            else:
+                WM.process_df_agg()
+            GA = GreenAlgorithms(df=WM.df_agg, args=WM.args, cluster_info=self.cluster_info, fParams=load_fParams())
+            GA.calculate_footprint()
+            L_df.append(GA.df.set_index('single_jobID'))
+        return L_df
+
+    def test_same_jobs(self):
+        df_sacct, df_db = self.calculate_footprints()
+        self.assertEqual(list(df_db.index), list(df_sacct.index))
+
+        for x in ['TotalCPUtimeX', 'WallclockTimeX']:
+            with self.subTest(x=x):
+                self.assertTrue(((df_db[x] - df_sacct[x]).abs() < tolerance_durations).all())
+        with self.subTest(x='ReqMemX'):
+            np.testing.assert_allclose(df_db.ReqMemX, df_sacct.ReqMemX, rtol=0, atol=tolerance_ReqMem)
+        for x in ['UsedMemX', 'NCPUSX', 'NNodesX', 'StateX', 'energy', 'carbonFootprint', 'carbonFootprint_memoryNeededOnly']:
+            with self.subTest(x=x):
+                np.testing.assert_allclose(df_db[x].astype('float64'), df_sacct[x].astype('float64'), rtol=rtol)
+        for x in ['PartitionX', 'JobNameX', 'WorkingDirX', 'SubmitDatetimeX', 'parentJobID']:
+            with self.subTest(x=x):
+                self.assertEqual(list(df_db[x]), list(df_sacct[x]))
+
+
+if __name__ == '__main__':
+    unittest.main()
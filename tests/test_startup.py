@@ -0,0 +1,69 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Maximum time to display --help, in seconds (same as the default --startupBudget of benchmarks/run_benchmarks.py)
+startup_budget = 0.3
+
+# Runs the script with --help, and prints the heavy modules that have been imported
+help_and_list_modules = '''
+import sys, json, runpy
+sys.argv = ['GreenAlgorithms_global.py', '--help']
+try:
+    runpy.run_path('GreenAlgorithms_global.py', run_name='__main__')
+except SystemExit:
+    pass
+print(json.dumps([x for x in ['pandas', 'numpy', 'yaml'] if x in sys.modules]), file=sys.stderr)
+'''
+
+
+class TestStartup(unittest.TestCase):
+    '''
+    --help (and the checks of the arguments) shouldn't load the heavy modules, so that the script starts quickly.
+    '''
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.env = dict(os.environ, XDG_CACHE_HOME=self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def run_help(self):
+        process = subprocess.run(
+            [sys.executable, '-c', help_and_list_modules],
+            cwd=repo_dir, env=self.env, capture_output=True, text=True, check=True
+        )
+        self.assertIn('usage:', process.stdout)
+        return json.loads(process.stderr.strip().splitlines()[-1])
+
+    def test_help_does_not_import_pandas(self):
+        modules = self.run_help()
+        self.assertNotIn('pandas', modules)
+        self.assertNotIn('numpy', modules)
+
+    def test_yaml_files_cached(self):
+        # The first time, the yaml files are parsed, and then read from the cache
+        self.run_help()
+        self.assertEqual(self.run_help(), [])
+
+    def test_help_within_budget(self):
+        self.run_help()
+        best = None
+        for _ in range(3):
+            wall = time.perf_counter()
+            subprocess.run([sys.executable, 'GreenAlgorithms_global.py', '--help'], cwd=repo_dir, env=self.env, capture_output=True, check=True)
+            wall = time.perf_counter() - wall
+            best = wall if best is None else min(best, wall)
+        self.assertLess(best, startup_budget, f"--help took {best:.3f}s")
+
+
+if __name__ == '__main__':
+    unittest.main()
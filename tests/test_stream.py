@@ -0,0 +1,47 @@
+import unittest
+
+import pandas as pd
+
+from common import load_cluster_info, make_args, pull_df_agg_0
+
+
+class TestStream(unittest.TestCase):
+    '''
+    With --stream, the usage logs are aggregated chunk by chunk, and the jobs whose steps are split across chunks are merged:
+    the jobs should be the same as without --stream, whatever the size of the chunks.
+    '''
+
+    def setUp(self):
+        self.cluster_info = load_cluster_info()
+
+    def assert_same_jobs(self, df_stream, df):
+        # NB: the categories of the text columns depend on the chunks, only their values are compared
+        pd.testing.assert_frame_equal(df_stream, df, check_dtype=False, check_categorical=False)
+
+    def check_chunk_sizes(self, **filters):
+        df = pull_df_agg_0(make_args(**filters), self.cluster_info).df_agg_0
+        self.assertGreater(len(df), 0)
+        for chunkSize in [1, 2, 3, 100000]:
+            with self.subTest(chunkSize=chunkSize):
+                WM = pull_df_agg_0(make_args(stream=True, chunkSize=chunkSize, **filters), self.cluster_info)
+                self.assert_same_jobs(WM.df_agg_0, df)
+
+    def test_no_filter(self):
+        self.check_chunk_sizes()
+
+    def test_filterWD(self):
+        # Job 2001 has 5 lines, with the working directory only on the first one
+        self.check_chunk_sizes(filterWD='/home/a')
+
+    def test_filterJobIDs(self):
+        self.check_chunk_sizes(filterJobIDs='2002,2005')
+
+    def test_filterWD_multistep_job(self):
+        # Regression test: with one line per chunk, the steps of a job in the third chunk and after were dropped with --filterCWD
+        WM = pull_df_agg_0(make_args(stream=True, chunkSize=1, filterWD='/home/a'), self.cluster_info)
+        self.assertEqual(WM.df_agg_0.loc['2001', 'UsedMemX'], 6.5)
+        self.assertEqual(WM.df_agg_0.loc['2004', 'UsedMemX'], 47.)
+
+
+if __name__ == '__main__':
+    unittest.main()
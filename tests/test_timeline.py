@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from common import calculate_footprint
+
+bins_h = {'minute': 1 / 60, 'hour': 1}
+
+
+class TestTimeline(unittest.TestCase):
+    '''
+    Power draw of the jobs over time (`calculate_timeline`).
+    '''
+
+    def setUp(self):
+        self.GA = calculate_footprint()
+
+    def test_same_energy(self):
+        # The power in each bin times its width adds up to the energy of the report
+        df = self.GA.df
+        for resolution, bin_h in bins_h.items():
+            timeline = self.GA.calculate_timeline(df, resolution=resolution)
+            for x in ['CPUs', 'GPUs', 'memory']:
+                with self.subTest(resolution=resolution, x=x):
+                    np.testing.assert_allclose(timeline[f'power_{x}'].sum() * bin_h, df[f'energy_{x}'].sum(), rtol=1e-9)
+            with self.subTest(resolution=resolution, x='total'):
+                np.testing.assert_allclose(timeline.power.sum() * bin_h, df.energy.sum(), rtol=1e-9)
+                np.testing.assert_allclose(
+                    timeline[['power_CPUs', 'power_GPUs', 'power_memory', 'power_overheads']].sum(axis=1), timeline.power, rtol=1e-9
+                )
+
+    def test_jobs_crossing_bins(self):
+        df = pd.DataFrame({
+            'SubmitDatetimeX': pd.to_datetime([
+                '2021-03-01 10:30', '2021-03-01 10:45', '2021-03-01 12:00', '2021-03-01 11:10', '2021-03-01 09:00'
+            ]),
+            'WallclockTimeX': pd.to_timedelta(['1h', '2h30min', '1h', '10min', '0']),
+            'energy': [1., 5., 3., 1., 2.],  # in kWh, the last job doesn't run
+        })
+        df['energy_CPUs'] = df.energy / 2
+        df['energy_GPUs'] = 0.
+        df['energy_memory'] = df.energy / 4
+        timeline = self.GA.calculate_timeline(df, resolution='hour')
+
+        # 1 kW from 10:30 to 11:30, 2 kW from 10:45 to 13:15, 3 kW from 12:00 to 13:00 and 6 kW from 11:10 to 11:20
+        self.assertEqual(list(timeline.datetime), [pd.Timestamp('2021-03-01 10:00') + pd.Timedelta(hours=i) for i in range(4)])
+        np.testing.assert_allclose(timeline.power, [0.5 + 0.5, 0.5 + 2 + 1, 2 + 3, 0.5], rtol=1e-12)
+        np.testing.assert_allclose(timeline.power_CPUs, timeline.power / 2, rtol=1e-12)
+        np.testing.assert_allclose(timeline.power_overheads, timeline.power / 4, rtol=1e-12)
+
+        timeline = self.GA.calculate_timeline(df, resolution='minute')
+        self.assertEqual(len(timeline), 165)  # from 10:30 to 13:15
+        self.assertEqual(timeline.datetime.iloc[0], pd.Timestamp('2021-03-01 10:30'))
+        power = timeline.set_index('datetime').power
+        for t, expected in [('10:30', 1), ('10:44', 1), ('10:45', 3), ('11:10', 9), ('11:19', 9), ('11:20', 3), ('11:30', 2), ('12:00', 5), ('13:14', 2)]:
+            with self.subTest(t=t):
+                self.assertAlmostEqual(power[pd.Timestamp(f'2021-03-01 {t}')], expected, places=9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from common import calculate_footprint
+
+uncertainty = {
+    'PUE': {'distribution': 'normal', 'sd': 0.1},
+    'CI': {'distribution': 'uniform', 'low': 0.8, 'high': 1.2},
+    'TDP': {'distribution': 'triangular', 'low': 0.7, 'high': 1.3},
+    'power_memory_perGB': {'distribution': 'normal', 'sd': 0.2},
+    'confidence': 0.95,
+    'seed': 0,
+}
+
+
+class TestUncertainty(unittest.TestCase):
+    '''
+    Confidence intervals of the totals of the report (`calculate_uncertainty`), with a fixed seed.
+    '''
+
+    def setUp(self):
+        self.GA = calculate_footprint()
+
+    def test_zero_width(self):
+        # Factors that are always 1 give the estimate with the current parameters
+        zero_width = {
+            'PUE': {'distribution': 'normal', 'sd': 0},
+            'CI': {'distribution': 'uniform', 'low': 1, 'high': 1},
+            'TDP': {'distribution': 'triangular', 'low': 1, 'high': 1},
+            'power_memory_perGB': {'distribution': 'normal', 'sd': 0},
+            'confidence': 0.95,
+            'seed': 0,
+        }
+        summary = self.GA.calculate_uncertainty(zero_width, 100)
+        for x in ['low', 'high']:
+            with self.subTest(x=x):
+                np.testing.assert_allclose(summary[x], summary.estimate, rtol=1e-12)
+        self.assertEqual(summary.loc['carbonFootprint', 'estimate'], self.GA.df.carbonFootprint.sum())
+
+    def test_interval_contains_estimate(self):
+        summary = self.GA.calculate_uncertainty(uncertainty, 2000)
+        self.assertTrue((summary.low < summary.estimate).all())
+        self.assertTrue((summary.estimate < summary.high).all())
+
+    def test_chunk_size(self):
+        summary = self.GA.calculate_uncertainty(uncertainty, 1000)
+        for chunk_size in [1, 7, 999, 5000]:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertTrue(self.GA.calculate_uncertainty(uncertainty, 1000, chunk_size=chunk_size).equals(summary))
+
+    def test_seed(self):
+        summary = self.GA.calculate_uncertainty(uncertainty, 1000)
+        self.assertTrue(self.GA.calculate_uncertainty(uncertainty, 1000).equals(summary))
+        self.assertFalse(self.GA.calculate_uncertainty({**uncertainty, 'seed': 1}, 1000).equals(summary))
+
+
+if __name__ == '__main__':
+    unittest.main()